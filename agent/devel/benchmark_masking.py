@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# Copyright (C) 2026 Canonical
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+Benchmark masking secrets in phase output.
+
+Random log-like output is masked in chunks, the way MaskingCommandRunner
+masks the output of a phase, with an increasing number of secrets. The
+throughput of LiteralMasker is logged next to the one of Masker, with the
+secrets escaped and combined into a single regular expression:
+
+    python devel/benchmark_masking.py --size 8 --secrets 1 10 100 1000
+"""
+
+import logging
+import random
+import re
+import string
+import time
+from argparse import ArgumentParser, Namespace
+
+from testflinger_agent.masking import LiteralMasker, Masker
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+# Size of the chunks of output that are masked, as read from a phase
+CHUNK_SIZE = 64 * 1024
+
+
+def get_args() -> Namespace:
+    """Parse command line arguments.
+
+    :return: Namespace containing parsed arguments
+    """
+    parser = ArgumentParser(description="Benchmark masking secrets")
+    parser.add_argument(
+        "-s", "--size", type=int, default=8, help="Output size in MB"
+    )
+    parser.add_argument(
+        "-n",
+        "--secrets",
+        type=int,
+        nargs="+",
+        default=[1, 10, 100, 1000],
+        help="Numbers of secrets to benchmark",
+    )
+    parser.add_argument(
+        "-l", "--length", type=int, default=24, help="Length of each secret"
+    )
+    parser.add_argument(
+        "-r",
+        "--regex-max",
+        type=int,
+        default=100,
+        help="Largest number of secrets to benchmark the regex masker with",
+    )
+    return parser.parse_args()
+
+
+def make_output(size: int, secrets: list[str]) -> str:
+    """Return size characters of output with some of the secrets in it."""
+    words = [
+        "".join(random.choices(string.ascii_lowercase, k=6))  # noqa: S311
+        for _ in range(1000)
+    ]
+    lines = []
+    length = 0
+    while length < size:
+        line = " ".join(random.choices(words, k=12))  # noqa: S311
+        if random.random() < 0.01:  # noqa: S311
+            line += " " + random.choice(secrets)  # noqa: S311
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines)[:size]
+
+
+def mask_chunks(masker: Masker, output: str) -> float:
+    """Mask the output in chunks and return the throughput in MB/s."""
+    start = time.perf_counter()
+    held = ""
+    for position in range(0, len(output), CHUNK_SIZE):
+        _, held = masker.apply_partial(
+            held + output[position : position + CHUNK_SIZE]
+        )
+    masker.apply(held)
+    return len(output) / (time.perf_counter() - start) / 1e6
+
+
+def main():
+    """Benchmark both maskers with each number of secrets."""
+    args = get_args()
+    logger.info("%8s %14s %14s", "secrets", "literal MB/s", "regex MB/s")
+    for count in args.secrets:
+        secrets = [
+            "".join(
+                random.choices(  # noqa: S311
+                    string.ascii_letters + string.digits + "+/=",
+                    k=args.length,
+                )
+            )
+            for _ in range(count)
+        ]
+        output = make_output(args.size * 1000 * 1000, secrets)
+        literal = mask_chunks(LiteralMasker(secrets), output)
+        regex = "-"
+        if count <= args.regex_max:
+            masker = Masker([re.escape(secret) for secret in secrets])
+            regex = f"{mask_chunks(masker, output):.1f}"
+        logger.info("%8d %14.1f %14s", count, literal, regex)
+
+
+if __name__ == "__main__":
+    main()
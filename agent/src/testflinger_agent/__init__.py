@@ -146,6 +146,9 @@ def start_agent():
         client.post_advertised_queues()
         logger.info("Checking jobs")
         agent.process_jobs()
+        if client.job_wait_supported:
+            # The server already held the job request for the interval
+            continue
         logger.info("Sleeping for %d", check_interval)
         time.sleep(check_interval)
 
@@ -34,6 +34,7 @@ from testflinger_agent.handlers import (
 from testflinger_agent.job import TestflingerJob
 from testflinger_agent.metrics import PrometheusHandler
 from testflinger_agent.os_release import query_dut_release
+from testflinger_agent.spool import replay_log_spools
 
 try:
     # attempt importing a tarfile filter, to check if filtering is supported
@@ -303,7 +304,9 @@ class TestflingerAgent:
             release = ""
             identifier = self.client.config.get("identifier", "")
             try:
-                job = TestflingerJob(job_data, self.client)
+                job = TestflingerJob(
+                    job_data, self.client, self.metrics_handler
+                )
                 event_emitter = EventEmitter(
                     job_data.get("job_queue"),
                     job_data.get("job_status_webhook"),
@@ -457,6 +460,7 @@ class TestflingerAgent:
                     event_emitter.emit_event(TestEvent.JOB_END, job_end_reason)
 
             try:
+                replay_log_spools(self.client, rundir)
                 self.client.transmit_job_outcome(rundir)
             except Exception as e:
                 # TFServerError will happen if we get other-than-good status
@@ -499,6 +503,7 @@ class TestflingerAgent:
         for result in old_results:
             try:
                 logger.info("Attempting to send result: %s", result)
+                replay_log_spools(self.client, result)
                 self.client.transmit_job_outcome(result)
             except TFServerError:
                 # Problems still, better luck next time?
@@ -22,7 +22,7 @@ from dataclasses import asdict, dataclass
 from functools import cached_property
 from http import HTTPStatus
 from pathlib import Path
-from typing import Dict, List
+from typing import BinaryIO, Dict, List, Optional
 from urllib.parse import urljoin
 
 import requests
@@ -39,6 +39,11 @@ from testflinger_agent.errors import TFServerError
 logger = logging.getLogger(__name__)
 
 DEFAULT_AUTH_TIMEOUT = 15  # seconds
+# Response header used by the server to advertise support for long-polling
+JOB_WAIT_HEADER = "X-Testflinger-Job-Wait"
+# How many times a download of job attachments is attempted, resuming from
+# where the previous attempt stopped
+ATTACHMENTS_DOWNLOAD_ATTEMPTS = 3
 
 
 @dataclass(frozen=True)
@@ -90,6 +95,13 @@ class TestflingerClient:
         self.session.hooks["response"].append(self._handle_token_refresh)
         self.influx_agent_db = "agent_jobs"
         self.influx_client = self._configure_influx()
+        # Set when the server held the last job request until a job was
+        # available or the polling interval expired
+        self.job_wait_supported = False
+        # Cleared when the server doesn't accept batches of log fragments
+        self.log_batch_supported = True
+        # Cleared when the server only accepts files as multipart form data
+        self.stream_upload_supported = True
 
     def _requests_retry(self, retries=3):
         session = requests.Session()
@@ -168,6 +180,9 @@ class TestflingerClient:
 
         If the agent has restricted queues, only accept jobs from those queues.
 
+        If the server supports long-polling, the request is held until a job
+        is available or the polling interval expires.
+
         :return: Dict with job data, or None if no job found
         """
         agent_id = self.config.get("agent_id")
@@ -181,12 +196,19 @@ class TestflingerClient:
 
         queue_list = restricted_queues or all_queues
 
+        # Ask the server to hold the request for up to the polling interval
+        # rather than sleeping between requests. Servers that don't support
+        # this ignore the parameter and won't advertise the header.
+        wait = self.config.get("polling_interval", 10)
         job_uri = urljoin(self.server, "/v1/job")
         logger.debug("Requesting a job")
         try:
             job_request = self.session.get(
-                job_uri, params={"queue": queue_list}, timeout=30
+                job_uri,
+                params={"queue": queue_list, "wait": wait},
+                timeout=30 + wait,
             )
+            self.job_wait_supported = JOB_WAIT_HEADER in job_request.headers
             job_request.raise_for_status()
             if job_request.content:
                 return job_request.json()
@@ -207,28 +229,93 @@ class TestflingerClient:
     def get_attachments(self, job_id: str, path: Path):
         """Download the attachment archive associated with a job.
 
+        If the download is interrupted, it is resumed from where it stopped
+        with a range request, as long as the archive hasn't changed.
+
         :param job_id:
             Id for the job
         :param path:
             Where to save the attachment archive
         """
         uri = urljoin(self.server, f"/v1/job/{job_id}/attachments")
-        with self.session.get(uri, stream=True, timeout=600) as response:
-            if not response:
-                logger.error(
-                    "Unable to retrieve attachments for job: %s (error: %d)",
+        headers = {}
+        for attempt in range(1, ATTACHMENTS_DOWNLOAD_ATTEMPTS + 1):
+            try:
+                with self.session.get(
+                    uri, stream=True, timeout=600, headers=headers
+                ) as response:
+                    if (
+                        response.status_code
+                        == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+                    ):
+                        # The archive was already completely downloaded
+                        return
+                    if not response:
+                        logger.error(
+                            "Unable to retrieve attachments for job: %s "
+                            "(error: %d)",
+                            job_id,
+                            response.status_code,
+                        )
+                        raise TFServerError(response.status_code)
+                    if etag := response.headers.get("ETag"):
+                        headers["If-Range"] = etag
+                    # Servers without range support send the whole archive
+                    resumed = (
+                        response.status_code == HTTPStatus.PARTIAL_CONTENT
+                    )
+                    with open(path, "ab" if resumed else "wb") as attachments:
+                        for chunk in response.iter_content(chunk_size=4096):
+                            attachments.write(chunk)
+                return
+            except (
+                requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.ConnectionError,
+            ) as exc:
+                if (
+                    attempt == ATTACHMENTS_DOWNLOAD_ATTEMPTS
+                    or not Path(path).exists()
+                ):
+                    raise
+                logger.warning(
+                    "Attachments download for job %s interrupted, "
+                    "resuming: %s",
                     job_id,
-                    response.status_code,
+                    exc,
                 )
-                raise TFServerError(response.status_code)
-            with open(path, "wb") as attachments:
-                for chunk in response.iter_content(chunk_size=4096):
-                    attachments.write(chunk)
+                headers["Range"] = f"bytes={Path(path).stat().st_size}-"
 
     def check_job_state(self, job_id):
-        job_data = self.get_result(job_id)
-        if job_data:
-            return job_data.get("job_state")
+        """Get the current job_state from the testflinger server.
+
+        This uses the lightweight state endpoint so that none of the logs
+        have to be transferred, and falls back to the full results for
+        servers that don't provide it.
+
+        :param job_id:
+            id for the job we want to check
+        :return:
+            the job_state as a string, or None if it could not be retrieved
+        """
+        state_uri = urljoin(self.server, f"/v1/result/{job_id}/state")
+        try:
+            job_request = self.session.get(state_uri, timeout=30)
+        except requests.exceptions.RequestException as exc:
+            logger.error(exc)
+            return None
+        if job_request.status_code == HTTPStatus.NOT_FOUND:
+            job_data = self.get_result(job_id)
+            return job_data.get("job_state") if job_data else None
+        if not job_request:
+            logger.error(
+                "Unable to get job state from: %s (error: %d)",
+                state_uri,
+                job_request.status_code,
+            )
+            return None
+        if job_request.content:
+            return job_request.json().get("job_state")
+        return None
 
     def post_job_state(self, job_id, phase):
         """Update the job_state on the testflinger server."""
@@ -366,10 +453,7 @@ class TestflingerClient:
                 self.server, "/v1/result/{}/artifact".format(job_id)
             )
             with open(f"{artifact_file}.tar.gz", "rb") as tarball:
-                file_upload = {"file": ("file", tarball, "application/x-gzip")}
-                artifact_request = self.session.post(
-                    artifact_uri, files=file_upload, timeout=600
-                )
+                artifact_request = self.post_file(artifact_uri, tarball)
             if not artifact_request:
                 logger.error(
                     "Unable to post results to: %s (error: %d)",
@@ -380,6 +464,33 @@ class TestflingerClient:
             else:
                 shutil.rmtree(artifacts_dir)
 
+    def post_file(self, uri: str, file: BinaryIO) -> requests.Response:
+        """Upload a file to the testflinger server.
+
+        The file is streamed as an application/octet-stream request body,
+        which the server stores as it arrives. Servers that reject it are
+        sent files as multipart form data instead.
+
+        :param uri: The URI to post the file to
+        :param file: The file to upload, opened in binary mode
+        :returns: The response of the server
+        """
+        if self.stream_upload_supported:
+            response = self.session.post(
+                uri,
+                data=file,
+                headers={"Content-Type": "application/octet-stream"},
+                timeout=600,
+            )
+            # Older servers fail to find the file in the form data
+            if response.status_code != HTTPStatus.BAD_REQUEST:
+                return response
+            logger.info("Server does not support file streams")
+            self.stream_upload_supported = False
+            file.seek(0)
+        file_upload = {"file": ("file", file, "application/x-gzip")}
+        return self.session.post(uri, files=file_upload, timeout=600)
+
     def post_log(
         self,
         job_id: str,
@@ -403,6 +514,45 @@ class TestflingerClient:
             return False
         return request.ok
 
+    def post_logs(
+        self,
+        job_id: str,
+        log_inputs: List[tuple[LogType, LogEndpointInput]],
+    ) -> bool:
+        """Post a batch of log data to the testflinger server for this job.
+
+        Servers that don't support batches of log fragments are sent each
+        fragment separately instead.
+
+        :param job_id: id for the job
+        :param log_inputs: Ordered list of log types and the log data to post
+        :returns: True if logs were posted successfully, False otherwise
+        """
+        if not self.log_batch_supported:
+            # Post every fragment even if some of them fail
+            results = [
+                self.post_log(job_id, log_input, log_type)
+                for log_type, log_input in log_inputs
+            ]
+            return all(results)
+        endpoint = urljoin(self.server, f"/v1/result/{job_id}/log")
+        fragments = [
+            {"log_type": str(log_type), **asdict(log_input)}
+            for log_type, log_input in log_inputs
+        ]
+        try:
+            request = self.session.post(
+                endpoint, json={"fragments": fragments}, timeout=60
+            )
+        except requests.exceptions.RequestException as exc:
+            logger.error(exc)
+            return False
+        if request.status_code == HTTPStatus.NOT_FOUND:
+            logger.info("Server does not support batches of log fragments")
+            self.log_batch_supported = False
+            return self.post_logs(job_id, log_inputs)
+        return request.ok
+
     def post_advertised_queues(self):
         """Post the list of advertised queues to testflinger server."""
         if "advertised_queues" not in self.config:
@@ -502,7 +652,8 @@ class TestflingerClient:
         webhook: str,
         events: List[Dict[str, str]],
         job_id: str,
-    ):
+        sequence: Optional[int] = None,
+    ) -> Optional[int]:
         """
         Post status updates about the running job as long as there is a
         webhook.
@@ -512,13 +663,19 @@ class TestflingerClient:
         :param webhook:
             String URL to post status update to
         :param events:
-            List of accumulated test events
+            List of accumulated test events, or of the new test events if
+            a sequence number is specified
         :param job_id:
             id for the job on which we want to post results
+        :param sequence:
+            Number of the first event in `events` among all the events of
+            the job, to only send the events the server doesn't have yet
+        :return:
+            The status code of the response, or None if the request failed
 
         """
         if webhook is None:
-            return
+            return None
 
         status_update_request = {
             "agent_id": self.config.get("agent_id"),
@@ -526,6 +683,8 @@ class TestflingerClient:
             "job_status_webhook": webhook,
             "events": events,
         }
+        if sequence is not None:
+            status_update_request["sequence"] = sequence
         status_update_uri = urljoin(self.server, f"/v1/job/{job_id}/events")
         try:
             job_request = self.session.post(
@@ -538,12 +697,14 @@ class TestflingerClient:
                     status_update_uri,
                     job_request.status_code,
                 )
+            return job_request.status_code
         except requests.exceptions.RequestException as exc:
             logger.error(
                 "Unable to post status updates to: %s (error: %s)",
                 status_update_uri,
                 exc,
             )
+            return None
 
     def is_server_reachable(self, timeout=10) -> bool:
         """Check if server is reachable by doing a health check.
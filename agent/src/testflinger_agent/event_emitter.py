@@ -14,6 +14,7 @@
 
 
 from datetime import datetime, timezone
+from http import HTTPStatus
 
 from testflinger_common.enums import TestEvent
 
@@ -44,6 +45,10 @@ class EventEmitter:
         self.events = []
         self.client = client
         self.job_id = job_id
+        # Number of events the server has acknowledged: only the events
+        # after these are sent, unless the server doesn't support it
+        self.reported = 0
+        self.incremental = True
 
     def emit_event(self, test_event: TestEvent, detail: str = ""):
         if test_event is not None:
@@ -53,6 +58,31 @@ class EventEmitter:
                 "detail": detail,
             }
             self.events.append(new_event_json)
+            if self.incremental:
+                self._post_new_events()
+            else:
+                self.client.post_status_update(
+                    self.job_queue, self.webhook, self.events, self.job_id
+                )
+
+    def _post_new_events(self):
+        """Post the events that the server hasn't acknowledged yet."""
+        status = self.client.post_status_update(
+            self.job_queue,
+            self.webhook,
+            self.events[self.reported :],
+            self.job_id,
+            sequence=self.reported,
+        )
+        if status == HTTPStatus.OK:
+            self.reported = len(self.events)
+        elif status == HTTPStatus.CONFLICT and self.reported:
+            # the server is missing earlier events: send them all again now
+            self.reported = 0
+            self._post_new_events()
+        elif status == HTTPStatus.UNPROCESSABLE_ENTITY:
+            # servers without incremental updates reject the sequence number
+            self.incremental = False
             self.client.post_status_update(
                 self.job_queue, self.webhook, self.events, self.job_id
             )
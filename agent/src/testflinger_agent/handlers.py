@@ -12,16 +12,38 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
+import gzip
+import json
 import logging
+import os
+import tempfile
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import asdict
 from datetime import datetime, timezone
+from typing import IO, Optional
 
 from testflinger_common.enums import LogType
 
 from .client import LogEndpointInput, TestflingerClient
+from .metrics import MetricsHandler
+from .spool import LogSpool
 
 logger = logging.getLogger(__name__)
 
+# Log data that can be queued in memory for each log type before it is
+# spilled to disk, in bytes
+LOG_QUEUE_BYTES = 16 * 1024 * 1024
+# Log fragments that are posted to the server in a single request by
+# default, if that many are queued
+LOG_BATCH_SIZE = 50
+# Log data written to a log file is flushed to disk once this many bytes
+# have been buffered, or at most this many seconds after it was written
+FILE_LOG_FLUSH_BYTES = 64 * 1024
+FILE_LOG_FLUSH_INTERVAL = 1
+
 
 class LogHandler(ABC):
     """Abstract callable class that receives live log updates."""
@@ -35,14 +57,69 @@ class FileLogHandler(LogHandler):
     """
     Implementation of LogHandler that writes live log updates
     to a file.
+
+    The file is kept open until the handler is closed, and log updates are
+    buffered until flush_bytes of them have been written, or for at most
+    flush_interval seconds, so the file stays up to date when the output
+    goes quiet. If compress is set, the file is compressed with gzip as it
+    is written.
     """
 
-    def __init__(self, filename: str):
+    def __init__(
+        self,
+        filename: str,
+        compress: bool = False,
+        flush_interval: float = FILE_LOG_FLUSH_INTERVAL,
+        flush_bytes: int = FILE_LOG_FLUSH_BYTES,
+    ):
         self.log_file = filename
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.log: Optional[IO[str]] = None
+        self.buffered = 0
+        self.flush_timer: Optional[threading.Timer] = None
+        self.lock = threading.Lock()
 
     def __call__(self, data: str):
-        with open(self.log_file, "a") as log:
-            log.write(data)
+        with self.lock:
+            if self.log is None:
+                if self.compress:
+                    self.log = gzip.open(self.log_file, "at")
+                else:
+                    self.log = open(self.log_file, "a")
+            self.log.write(data)
+            self.buffered += len(data)
+            if self.buffered >= self.flush_bytes:
+                self._flush()
+            elif self.flush_timer is None:
+                self.flush_timer = threading.Timer(
+                    self.flush_interval, self.flush
+                )
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+
+    def _flush(self):
+        """Write the buffered log updates, with the lock held."""
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        if self.log is not None:
+            self.log.flush()
+        self.buffered = 0
+
+    def flush(self):
+        """Write the buffered log updates to the file."""
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        """Write the buffered log updates and close the file."""
+        with self.lock:
+            self._flush()
+            if self.log is not None:
+                self.log.close()
+                self.log = None
 
 
 class AgentStatusHandler:
@@ -168,16 +245,55 @@ class EndpointLogHandler(LogHandler):
     """
     Abstract class that writes live log updates to a generic endpoint
     in Testflinger server.
+
+    Log updates are queued and posted from a background thread, so a slow
+    or unreachable server doesn't hold up the caller. Updates queued while
+    a previous post is in progress are posted together, in batches of up
+    to batch_size fragments. Once more than max_queue_bytes of log data is
+    queued, further updates are spilled to a temporary file until the
+    queue has been emptied, so they are still posted in order.
+
+    If a spool is set, updates that can't be posted are written to it
+    along with everything still queued, and the spooled updates are posted
+    before any new ones once the server can be reached again.
+
+    If a metrics handler is given, the number of queued updates and the
+    time taken to post them are reported to it.
     """
 
-    def __init__(self, client: TestflingerClient, job_id: str, phase: str):
+    log_type: LogType
+
+    def __init__(
+        self,
+        client: TestflingerClient,
+        job_id: str,
+        phase: str,
+        batch_size: int = 1,
+        max_queue_bytes: int = LOG_QUEUE_BYTES,
+        metrics_handler: Optional[MetricsHandler] = None,
+    ):
         self.fragment_number = 0
         self.client = client
         self.phase = phase
         self.job_id = job_id
+        self.batch_size = batch_size
+        self.max_queue_bytes = max_queue_bytes
+        self.queue: deque[LogEndpointInput] = deque()
+        self.queue_bytes = 0
+        self.spill: Optional[IO[str]] = None
+        self.spill_position = 0
+        self.spilled = 0
+        self.sending = False
+        self.condition = threading.Condition()
+        self.spool: Optional[LogSpool] = None
+        self.metrics_handler = metrics_handler
+
+    @abstractmethod
+    def write_to_endpoint(self, data: LogEndpointInput) -> bool:
+        raise NotImplementedError
 
     @abstractmethod
-    def write_to_endpoint(self, data: LogEndpointInput):
+    def write_batch_to_endpoint(self, data: list[LogEndpointInput]) -> bool:
         raise NotImplementedError
 
     def __call__(self, data: str):
@@ -187,8 +303,123 @@ class EndpointLogHandler(LogHandler):
             self.phase,
             data,
         )
-        self.write_to_endpoint(log_input)
         self.fragment_number += 1
+        with self.condition:
+            if self.spill is None and (
+                not self.queue
+                or self.queue_bytes + len(data) <= self.max_queue_bytes
+            ):
+                self.queue.append(log_input)
+                self.queue_bytes += len(data)
+            else:
+                self._spill(log_input)
+            self._report_depth(self._depth())
+            if not self.sending:
+                self.sending = True
+                threading.Thread(
+                    target=self._send_queued, name="log-sender", daemon=True
+                ).start()
+
+    def _depth(self) -> int:
+        """Return the number of queued log updates."""
+        return len(self.queue) + self.spilled
+
+    def _report_depth(self, depth: int):
+        """Report the number of queued log updates, if metrics are kept."""
+        if self.metrics_handler is not None:
+            self.metrics_handler.report_log_queue_depth(self.log_type, depth)
+
+    def _spill(self, log_input: LogEndpointInput):
+        """Write a log update to the spill file, creating it if needed."""
+        if self.spill is None:
+            logger.warning(
+                "More than %d bytes of %s log queued for job %s, "
+                "spilling to disk",
+                self.max_queue_bytes,
+                self.log_type,
+                self.job_id,
+            )
+            self.spill = tempfile.TemporaryFile("w+", encoding="utf-8")
+            self.spill_position = 0
+        self.spill.seek(0, os.SEEK_END)
+        self.spill.write(json.dumps(asdict(log_input)) + "\n")
+        self.spilled += 1
+
+    def _unspill(self, count: int) -> list[LogEndpointInput]:
+        """Read up to count log updates from the spill file."""
+        self.spill.seek(self.spill_position)
+        log_inputs = []
+        while len(log_inputs) < count and (line := self.spill.readline()):
+            log_inputs.append(LogEndpointInput(**json.loads(line)))
+        self.spill_position = self.spill.tell()
+        self.spilled -= len(log_inputs)
+        if not self.spilled:
+            # updates can be queued in memory again
+            self.spill.close()
+            self.spill = None
+        return log_inputs
+
+    def _next_batch(self, count: int) -> list[LogEndpointInput]:
+        """Take up to count log updates to post off the queue."""
+        batch = []
+        while self.queue and len(batch) < count:
+            log_input = self.queue.popleft()
+            self.queue_bytes -= len(log_input.log_data)
+            batch.append(log_input)
+        if self.spill is not None and len(batch) < count:
+            batch.extend(self._unspill(count - len(batch)))
+        return batch
+
+    def _send_queued(self):
+        """Post the queued log updates, until there are none left."""
+        while True:
+            with self.condition:
+                batch = self._next_batch(max(self.batch_size, 1))
+                self._report_depth(self._depth())
+                if not batch:
+                    self.sending = False
+                    self.condition.notify_all()
+                    return
+            start = time.monotonic()
+            try:
+                posted = self._post(batch)
+            except Exception:
+                logger.exception("Unable to post %s log", self.log_type)
+                posted = False
+            if self.metrics_handler is not None:
+                self.metrics_handler.report_log_send_latency(
+                    self.log_type, time.monotonic() - start
+                )
+            if not posted and self.spool is not None:
+                # spool everything queued, rather than waiting for each of
+                # the queued updates to fail in turn
+                with self.condition:
+                    batch.extend(self._next_batch(self._depth()))
+                    self._report_depth(0)
+                logger.warning(
+                    "Unable to post %s log for job %s, spooling %d updates",
+                    self.log_type,
+                    self.job_id,
+                    len(batch),
+                )
+                try:
+                    self.spool.append(batch)
+                except OSError:
+                    logger.exception("Unable to spool %s log", self.log_type)
+
+    def _post(self, batch: list[LogEndpointInput]) -> bool:
+        """Post a batch of log updates, after any spooled ones."""
+        if self.spool is not None and self.spool.pending:
+            if not self.spool.replay(self.write_batch_to_endpoint):
+                return False
+        if self.batch_size <= 1:
+            return self.write_to_endpoint(batch[0])
+        return self.write_batch_to_endpoint(batch)
+
+    def flush(self):
+        """Wait until all the queued log updates have been posted."""
+        with self.condition:
+            self.condition.wait_for(lambda: not self.sending)
 
     def write_from_file(self, filename: str, chunk_size: int = 1024 * 1024):
         """Write logs to endpoint from a file chunking by chunk_size.
@@ -205,6 +436,7 @@ class EndpointLogHandler(LogHandler):
                     self(data)
         except FileNotFoundError:
             pass
+        self.flush()
 
 
 class OutputLogHandler(EndpointLogHandler):
@@ -213,8 +445,16 @@ class OutputLogHandler(EndpointLogHandler):
     endpoint in Testflinger server.
     """
 
-    def write_to_endpoint(self, data: LogEndpointInput):
-        self.client.post_log(self.job_id, data, LogType.STANDARD_OUTPUT)
+    log_type = LogType.STANDARD_OUTPUT
+
+    def write_to_endpoint(self, data: LogEndpointInput) -> bool:
+        return self.client.post_log(self.job_id, data, LogType.STANDARD_OUTPUT)
+
+    def write_batch_to_endpoint(self, data: list[LogEndpointInput]) -> bool:
+        return self.client.post_logs(
+            self.job_id,
+            [(LogType.STANDARD_OUTPUT, log_input) for log_input in data],
+        )
 
 
 class SerialLogHandler(EndpointLogHandler):
@@ -223,5 +463,13 @@ class SerialLogHandler(EndpointLogHandler):
     endpoint in Testflinger server.
     """
 
-    def write_to_endpoint(self, data: LogEndpointInput):
-        self.client.post_log(self.job_id, data, LogType.SERIAL_OUTPUT)
+    log_type = LogType.SERIAL_OUTPUT
+
+    def write_to_endpoint(self, data: LogEndpointInput) -> bool:
+        return self.client.post_log(self.job_id, data, LogType.SERIAL_OUTPUT)
+
+    def write_batch_to_endpoint(self, data: list[LogEndpointInput]) -> bool:
+        return self.client.post_logs(
+            self.job_id,
+            [(LogType.SERIAL_OUTPUT, log_input) for log_input in data],
+        )
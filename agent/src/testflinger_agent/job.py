@@ -18,20 +18,23 @@ import time
 from pathlib import Path
 from typing import Optional
 
-from testflinger_common.enums import TestPhase
+from testflinger_common.enums import LogType, TestPhase
 
 from testflinger_agent.errors import TFServerError
 from testflinger_agent.handlers import (
+    LOG_BATCH_SIZE,
     FileLogHandler,
     OutputLogHandler,
     SerialLogHandler,
 )
-from testflinger_agent.masking import Masker
+from testflinger_agent.masking import LiteralMasker
 from testflinger_agent.runner import (
+    STOP_CHECK_INTERVAL,
     CommandRunner,
     MaskingCommandRunner,
     RunnerEvents,
 )
+from testflinger_agent.spool import LogSpool
 from testflinger_agent.stop_condition_checkers import (
     GlobalTimeoutChecker,
     JobCancelledChecker,
@@ -48,29 +51,49 @@ class TestflingerJob:
     # secrets are masked with a hash of this length
     _hash_length: int = 6
 
-    def __init__(self, job_data, client):
+    def __init__(self, job_data, client, metrics_handler=None):
         """
         :param job_data:
             Dictionary containing data for the test job_data
         :param client:
             Testflinger client object for communicating with the server
+        :param metrics_handler:
+            Metrics handler the log handlers report their metrics to
         """
         self.client = client
         self.job_data = job_data
         self.job_id = job_data.get("job_id")
         self.phase = "unknown"
+        log_batch_size = self.client.config.get(
+            "log_batch_size", LOG_BATCH_SIZE
+        )
         self.live_output_handler = OutputLogHandler(
-            self.client, self.job_id, self.phase
+            self.client,
+            self.job_id,
+            self.phase,
+            batch_size=log_batch_size,
+            metrics_handler=metrics_handler,
         )
         self.serial_output_handler = SerialLogHandler(
-            self.client, self.job_id, self.phase
+            self.client,
+            self.job_id,
+            self.phase,
+            batch_size=log_batch_size,
+            metrics_handler=metrics_handler,
         )
 
     def get_runner(self, rundir: str, phase: TestPhase):
+        stop_check_interval = self.client.config.get(
+            "stop_check_interval", STOP_CHECK_INTERVAL
+        )
         try:
             secrets = self.job_data[f"{phase}_data"]["secrets"]
         except KeyError:
-            return CommandRunner(cwd=rundir, env=self.client.config)
+            return CommandRunner(
+                cwd=rundir,
+                env=self.client.config,
+                stop_check_interval=stop_check_interval,
+            )
 
         # inject phase secrets into the environment
         environment = {
@@ -83,8 +106,9 @@ class TestflingerJob:
         return MaskingCommandRunner(
             cwd=rundir,
             env=environment,
-            masker=Masker(
-                patterns=list(secrets.values()), hash_length=self._hash_length
+            stop_check_interval=stop_check_interval,
+            masker=LiteralMasker(
+                secrets=list(secrets.values()), hash_length=self._hash_length
             ),
         )
 
@@ -123,14 +147,26 @@ class TestflingerJob:
                 )
                 return 0, None, None
         results_file = Path(rundir) / "testflinger-outcome.json"
+        compress_logs = self.client.config.get("compress_logs", False)
         output_log = Path(rundir) / f"{phase}.log"
+        if compress_logs:
+            output_log = output_log.with_suffix(".log.gz")
         serial_log = Path(rundir) / f"{phase}-serial.log"
 
         logger.info("Running %s_command: %s", phase, cmd)
         runner = self.get_runner(rundir, phase)
-        output_file_handler = FileLogHandler(output_log)
+        output_file_handler = FileLogHandler(
+            output_log, compress=compress_logs
+        )
         self.live_output_handler.phase = phase
         self.serial_output_handler.phase = phase
+        # Keep the output that can't be posted until the server is back
+        self.live_output_handler.spool = LogSpool(
+            rundir, LogType.STANDARD_OUTPUT
+        )
+        self.serial_output_handler.spool = LogSpool(
+            rundir, LogType.SERIAL_OUTPUT
+        )
         runner.register_output_handler(output_file_handler)
         runner.register_output_handler(self.live_output_handler)
 
@@ -189,6 +225,9 @@ class TestflingerJob:
             exitcode = 100
             exit_reason = str(exc)  # noqa: F841 - ignore this until it's used
         finally:
+            output_file_handler.close()
+            # Wait for the queued output to be sent
+            self.live_output_handler.flush()
             # Write serial log file generated in device connector to
             # the serial log endpoint if the file exists
             self.serial_output_handler.write_from_file(serial_log)
@@ -22,7 +22,12 @@ the same sensitive information is always replaced by the same mask.
 
 import hashlib
 import re
-from typing import List, Optional
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+# Length of the beginnings of the secrets that are searched for in the text
+# before it is scanned with the automaton
+PREFILTER_LENGTH = 4
 
 
 class Masker:
@@ -59,8 +64,178 @@ class Masker:
 
     def mask(self, match: re.Match) -> str:
         """Return a string with a mask applied on a pattern `match`."""
-        return f"**{self.hash(match.group())[: self.hash_length]}**"
+        return self.mask_text(match.group())
+
+    def mask_text(self, text: str) -> str:
+        """Return the mask that replaces `text`."""
+        return f"**{self.hash(text)[: self.hash_length]}**"
 
     def apply(self, text: str) -> str:
         """Return a string with all pattern matches in `text` masked."""
         return self.pattern.sub(self.mask, text)
+
+    def apply_partial(self, text: str) -> Tuple[str, str]:
+        """Mask `text` when more text may follow it.
+
+        Return the masked text that is ready to be output, and the end of
+        `text` that has to be held back until more text is available,
+        because it may be the beginning of a match. Matches of regular
+        expressions can't be predicted, so nothing is held back.
+        """
+        return self.apply(text), ""
+
+
+class LiteralMasker(Masker):
+    """
+    A class for masking secret strings in text.
+
+    Unlike `Masker`, the secrets are literal strings rather than regular
+    expressions. They are all matched in a single pass over the text with
+    an Aho-Corasick automaton, and where secrets overlap the longest of the
+    leftmost ones is masked.
+
+    Example:
+    ```
+    >>> masker = LiteralMasker(["1+1=2"], hash_length=6)
+    >>> masker.apply("Secret: 1+1=2")
+    'Secret: **c80289**'
+    ```
+    """
+
+    def __init__(self, secrets: List[str], hash_length: Optional[int] = None):
+        secrets = [secret for secret in secrets if secret]
+        if not secrets:
+            raise ValueError("No secrets to mask")
+        self.hash_length = hash_length
+        self.masks: Dict[str, str] = {}
+        # trie of the secrets: the transitions from each state, the length
+        # of the prefix of a secret each state matches, and the lengths of
+        # the secrets matched when reaching each state
+        self.goto: List[Dict[str, int]] = [{}]
+        self.depth = [0]
+        lengths: List[Tuple[int, ...]] = [()]
+        for secret in secrets:
+            state = 0
+            for char in secret:
+                if char not in self.goto[state]:
+                    self.goto[state][char] = len(self.goto)
+                    self.goto.append({})
+                    self.depth.append(self.depth[state] + 1)
+                    lengths.append(())
+                state = self.goto[state][char]
+            lengths[state] = (len(secret),)
+        # failure transitions to the state matching the longest suffix of
+        # the text matched by each state, in breadth-first order so that
+        # the suffixes are processed first
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                lengths[next_state] += lengths[self.fail[next_state]]
+                queue.append(next_state)
+        self.lengths = lengths
+        # text that can't start a secret is skipped with a regular
+        # expression matching the beginnings of the secrets, while the
+        # automaton is in its initial state
+        self.prefilter = re.compile(self.prefix_pattern(0))
+
+    def mask_text(self, text: str) -> str:
+        """Return the mask that replaces `text`."""
+        if text not in self.masks:
+            self.masks[text] = super().mask_text(text)
+        return self.masks[text]
+
+    def prefix_pattern(self, state: int) -> str:
+        """Return a regular expression for the beginnings of the secrets.
+
+        The expression matches the text leading from `state` to the end of
+        a secret, or to a depth of PREFILTER_LENGTH in the trie.
+        """
+        branches = []
+        for char, next_state in sorted(self.goto[state].items()):
+            branch = re.escape(char)
+            if (
+                self.depth[next_state] < PREFILTER_LENGTH
+                and self.goto[next_state]
+                and self.depth[next_state] not in self.lengths[next_state]
+            ):
+                branch += self.prefix_pattern(next_state)
+            branches.append(branch)
+        if len(branches) == 1:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")"
+
+    def next_state(self, state: int, char: str) -> int:
+        """Return the state of the automaton after `char`."""
+        goto = self.goto
+        while state and char not in goto[state]:
+            state = self.fail[state]
+        return goto[state].get(char, 0)
+
+    def find(self, text: str) -> Tuple[List[Tuple[int, int]], int]:
+        """Find all the secrets in `text`.
+
+        Return the start and end of each occurrence of a secret, ordered by
+        their end, and the length of the end of `text` that is the
+        beginning of a secret.
+        """
+        goto, lengths = self.goto, self.lengths
+        search = self.prefilter.search
+        matches = []
+        state = 0
+        position = 0
+        end = len(text)
+        # the beginnings of secrets at the very end of the text are too
+        # short to match the prefilter, so the end is always scanned
+        tail = end - PREFILTER_LENGTH + 1
+        while position < end:
+            if not state and position < tail:
+                found = search(text, position)
+                position = min(found.start() if found else end, tail)
+            char = text[position]
+            if char in goto[state]:
+                state = goto[state][char]
+            else:
+                state = self.next_state(state, char)
+            position += 1
+            for length in lengths[state]:
+                matches.append((position - length, position))
+        return matches, self.depth[state]
+
+    def apply(self, text: str) -> str:
+        """Return a string with all the secrets in `text` masked."""
+        return self.mask_matches(text, final=True)[0]
+
+    def apply_partial(self, text: str) -> Tuple[str, str]:
+        """Mask `text` when more text may follow it.
+
+        Return the masked text that is ready to be output, and the end of
+        `text` that has to be held back until more text is available,
+        because it may be the beginning of a secret.
+        """
+        return self.mask_matches(text, final=False)
+
+    def mask_matches(self, text: str, final: bool) -> Tuple[str, str]:
+        """Mask the secrets in `text`, holding back its end unless final."""
+        matches, partial = self.find(text)
+        hold = len(text) if final else len(text) - partial
+        masked = []
+        position = 0
+        for start, end in sorted(
+            matches, key=lambda match: (match[0], -match[1])
+        ):
+            if start >= hold:
+                break
+            if start < position:
+                continue
+            masked.append(text[position:start])
+            masked.append(self.mask_text(text[start:end]))
+            position = end
+        end = max(position, hold)
+        masked.append(text[position:end])
+        return "".join(masked), text[end:]
@@ -17,6 +17,7 @@ from abc import ABC, abstractmethod
 
 from prometheus_client import (
     Counter,
+    Gauge,
     Histogram,
     disable_created_metrics,
     start_http_server,
@@ -63,6 +64,24 @@ class MetricsHandler(ABC):
         """Report a recovery failure to the metrics backend."""
         raise NotImplementedError
 
+    @abstractmethod
+    def report_log_queue_depth(self, log_type: str, depth: int):
+        """Report the number of log fragments waiting to be posted.
+
+        :param log_type: Type of the log the fragments belong to
+        :param depth: Number of fragments waiting to be posted
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def report_log_send_latency(self, log_type: str, latency: float):
+        """Report the time taken to post log fragments to the server.
+
+        :param log_type: Type of the log the fragments belong to
+        :param latency: Time taken to post the fragments in seconds
+        """
+        raise NotImplementedError
+
 
 class PrometheusHandler(MetricsHandler):
     """Handler to store metrics for a Prometheus Metric Endpoint."""
@@ -92,6 +111,16 @@ class PrometheusHandler(MetricsHandler):
             "Total recovery failures since last agent restart",
             ["agent_id"],
         )
+        self.log_queue_depth = Gauge(
+            "log_queue_depth",
+            "Number of log fragments waiting to be posted to the server",
+            ["agent_id", "log_type"],
+        )
+        self.log_send_latency = Histogram(
+            "log_send_latency_seconds",
+            "Time taken to post log fragments to the server",
+            ["agent_id", "log_type"],
+        )
         if port is None:
             return
 
@@ -133,3 +162,19 @@ class PrometheusHandler(MetricsHandler):
     def report_recovery_failures(self):
         """Increase total recovery failures counter and push to gateway."""
         self.recovery_failures.labels(self.agent_id).inc()
+
+    def report_log_queue_depth(self, log_type: str, depth: int):
+        """Set the number of log fragments waiting to be posted.
+
+        :param log_type: Type of the log the fragments belong to
+        :param depth: Number of fragments waiting to be posted
+        """
+        self.log_queue_depth.labels(self.agent_id, log_type).set(depth)
+
+    def report_log_send_latency(self, log_type: str, latency: float):
+        """Track the time taken to post log fragments to the server.
+
+        :param log_type: Type of the log the fragments belong to
+        :param latency: Time taken to post the fragments in seconds
+        """
+        self.log_send_latency.labels(self.agent_id, log_type).observe(latency)
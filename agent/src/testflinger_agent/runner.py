@@ -12,9 +12,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
+import codecs
+import contextlib
 import fcntl
 import logging
 import os
+import selectors
 import signal
 import subprocess
 import sys
@@ -33,6 +36,16 @@ logger = logging.getLogger(__name__)
 OutputHandlerType = Callable[[str], None]
 StopConditionType = Callable[[], Optional[str]]
 
+# How often to check the stop conditions by default, in seconds
+STOP_CHECK_INTERVAL = 10
+# Output is posted as soon as this many bytes have been received, or this
+# long after the first of them was received, whichever comes first, so that
+# output arriving in many small pieces is posted together
+OUTPUT_COALESCE_SIZE = 64 * 1024
+OUTPUT_COALESCE_TIME = 0.25
+# How often to check whether the process has exited, in seconds
+PROCESS_POLL_INTERVAL = 1
+
 
 class RunnerEvents(Enum):
     """Runner events that can be subscribed to."""
@@ -48,10 +61,17 @@ class CommandRunner:
     known event types are defined in RunnerEvents.
     """
 
-    def __init__(self, cwd: Optional[str], env: Optional[dict]):
+    def __init__(
+        self,
+        cwd: Optional[str],
+        env: Optional[dict],
+        stop_check_interval: float = STOP_CHECK_INTERVAL,
+    ):
         self.output_handlers: List[OutputHandlerType] = []
         self.stop_condition_checkers: List[StopConditionType] = []
+        self.stop_check_interval = stop_check_interval
         self.process: Optional[subprocess.Popen] = None
+        self.process_started = threading.Event()
         self.cwd = cwd
         self.env = os.environ.copy()
         self.events = defaultdict(list)
@@ -76,6 +96,9 @@ class CommandRunner:
         for handler in self.output_handlers:
             handler(data)
 
+    def flush_output(self):
+        """Post any output held back by post_output."""
+
     def register_stop_condition_checker(self, checker: StopConditionType):
         self.stop_condition_checkers.append(checker)
 
@@ -90,27 +113,116 @@ class CommandRunner:
                 return event, detail
         return None, ""
 
-    def check_and_post_output(self):
-        raw_output = self.process.stdout.read()
-        if not raw_output:
+    def read_output(self) -> Optional[bytes]:
+        """Read the output that is available from the process.
+
+        :return:
+            The output read, which is empty if there is none available right
+            now, or None once the process has closed its output
+        """
+        try:
+            raw_output = os.read(
+                self.process.stdout.fileno(), OUTPUT_COALESCE_SIZE
+            )
+        except BlockingIOError:
+            return b""
+        return raw_output or None
+
+    def post_raw_output(self, raw_output: bytes, final: bool = False):
+        """Decode output from the process and post it.
+
+        Characters split between reads are decoded once they are complete.
+        """
+        output = self.decoder.decode(raw_output, final=final)
+        if not output:
             return
         self.post_event(RunnerEvents.OUTPUT_RECEIVED)
-
-        output = raw_output.decode(sys.stdout.encoding, errors="replace")
         self.post_output(output)
 
+    def pump_output(self) -> Tuple[Optional[TestEvent], str]:
+        """Post output from the process as it arrives, until it exits.
+
+        Output is posted as soon as it arrives, but output that arrives in
+        quick succession is posted together. The stop conditions are checked
+        every `stop_check_interval` seconds in between.
+
+        :return:
+            The stop event and reason, if a stop condition was met
+        """
+        selector = selectors.DefaultSelector()
+        selector.register(self.process.stdout, selectors.EVENT_READ)
+        output_open = True
+        pending = bytearray()
+        pending_since = 0.0
+        next_stop_check = time.monotonic() + self.stop_check_interval
+        try:
+            while self.process.poll() is None:
+                now = time.monotonic()
+                timeout = next_stop_check - now
+                if pending:
+                    timeout = min(
+                        timeout, pending_since + OUTPUT_COALESCE_TIME - now
+                    )
+                timeout = max(timeout, 0)
+                if not output_open:
+                    # only the stop conditions are left to check until the
+                    # process exits
+                    with contextlib.suppress(subprocess.TimeoutExpired):
+                        self.process.wait(timeout)
+                # the process may exit without its output being closed, if
+                # it was inherited by a child, so it is polled regularly
+                elif selector.select(min(timeout, PROCESS_POLL_INTERVAL)):
+                    raw_output = self.read_output()
+                    if raw_output is None:
+                        selector.unregister(self.process.stdout)
+                        output_open = False
+                    elif raw_output:
+                        if not pending:
+                            pending_since = time.monotonic()
+                        pending += raw_output
+
+                now = time.monotonic()
+                if pending and (
+                    len(pending) >= OUTPUT_COALESCE_SIZE
+                    or now - pending_since >= OUTPUT_COALESCE_TIME
+                ):
+                    self.post_raw_output(bytes(pending))
+                    pending.clear()
+
+                if now >= next_stop_check:
+                    next_stop_check = now + self.stop_check_interval
+                    stop_event, stop_reason = self.check_stop_conditions()
+                    if stop_event is not None:
+                        self.post_raw_output(bytes(pending))
+                        self.post_output(f"\n{stop_reason}\n")
+                        return stop_event, stop_reason
+        finally:
+            selector.close()
+        self.post_raw_output(bytes(pending))
+        return None, ""
+
+    def check_and_post_output(self):
+        """Post all the output that is available from the process."""
+        while raw_output := self.read_output():
+            self.post_raw_output(raw_output)
+        self.post_raw_output(b"", final=True)
+        self.flush_output()
+
     def run_command_thread(self, cmd: str):
-        self.process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            cwd=self.cwd,
-            env=self.env,
-            shell=True,
-        )
-        # Ensure that the output doesn't get buffered on our end
-        if self.process.stdout is not None:
-            set_nonblock(self.process.stdout.fileno())
+        try:
+            self.process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                cwd=self.cwd,
+                env=self.env,
+                shell=True,
+            )
+            # Ensure that the output doesn't get buffered on our end
+            if self.process.stdout is not None:
+                set_nonblock(self.process.stdout.fileno())
+        finally:
+            self.process_started.set()
         self.process.wait()
 
     def cleanup(self):
@@ -121,8 +233,10 @@ class CommandRunner:
     def run(self, cmd: str) -> Tuple[int, Optional[TestEvent], str]:
         # Ensure that the process is None before starting
         self.process = None
-        stop_event = None
-        stop_reason = ""
+        self.process_started.clear()
+        self.decoder = codecs.getincrementaldecoder(sys.stdout.encoding)(
+            errors="replace"
+        )
 
         signal.signal(signal.SIGTERM, lambda signum, frame: self.cleanup())
 
@@ -132,19 +246,11 @@ class CommandRunner:
         run_cmd_thread.start()
 
         # Make sure to wait until the process actually starts
-        while self.process is None:
-            time.sleep(1)
-
-        while self.process.poll() is None:
-            time.sleep(10)
-
-            stop_event, stop_reason = self.check_stop_conditions()
-            if stop_event is not None:
-                self.post_output(f"\n{stop_reason}\n")
-                self.cleanup()
-                break
+        self.process_started.wait()
 
-            self.check_and_post_output()
+        stop_event, stop_reason = self.pump_output()
+        if stop_event is not None:
+            self.cleanup()
 
         # Check for any final output before exiting
         run_cmd_thread.join()
@@ -157,16 +263,30 @@ class CommandRunner:
 
 
 class MaskingCommandRunner(CommandRunner):
-    """A CommandRunner that masks sensitive information in the output."""
+    """A CommandRunner that masks sensitive information in the output.
+
+    Output that may be the beginning of a secret is held back until the
+    rest of the output arrives, so secrets split between reads are masked.
+    """
 
     def __init__(self, *args, masker: Masker, **kwargs):
         super().__init__(*args, **kwargs)
         self.masker = masker
+        self.held_output = ""
 
     def post_output(self, data: str):
         # mask sensitive information before posting output data
-        data = self.masker.apply(data)
-        super().post_output(data)
+        data, self.held_output = self.masker.apply_partial(
+            self.held_output + data
+        )
+        if data:
+            super().post_output(data)
+
+    def flush_output(self):
+        if self.held_output:
+            data = self.masker.apply(self.held_output)
+            self.held_output = ""
+            super().post_output(data)
 
 
 def get_stop_reason(returncode: int, stop_reason: str) -> str:
@@ -48,6 +48,17 @@ SCHEMA_V1 = {
     # only the last `output_bytes` of the log will be included
     # in the results submitted to the server (default: 10MB)
     voluptuous.Optional("output_bytes", default=10 * 1024 * 1024): int,
+    # number of log fragments that can be posted to the server in a single
+    # request, servers without batch support are sent fragments separately
+    # (default: 50)
+    voluptuous.Optional("log_batch_size", default=50): int,
+    # seconds between checks for conditions that stop a running phase, such
+    # as timeouts and job cancellation (default: 10)
+    voluptuous.Optional("stop_check_interval", default=10): voluptuous.Any(
+        int, float
+    ),
+    # compress the phase output logs kept in the rundir with gzip
+    voluptuous.Optional("compress_logs", default=False): bool,
 }
 
 
@@ -0,0 +1,129 @@
+# Copyright (C) 2026 Canonical
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable
+
+from testflinger_common.enums import LogType
+
+from testflinger_agent.client import LogEndpointInput, TestflingerClient
+from testflinger_agent.errors import TFServerError
+
+logger = logging.getLogger(__name__)
+
+# Directory in the job's rundir where unsent log fragments are spooled
+SPOOL_DIR = "log-spool"
+# Log data posted in each request when replaying a spool, in bytes
+SPOOL_REPLAY_BYTES = 4 * 1024 * 1024
+
+
+class LogSpool:
+    """Spool of the log fragments of a job that couldn't be posted.
+
+    The fragments of each log type are appended to a file in the job's
+    rundir, in the order they were created, and synced to disk so they
+    survive an agent restart. Once the server is reachable again they are
+    replayed in order, in batches of up to SPOOL_REPLAY_BYTES of log data,
+    and the file is removed.
+
+    Fragments are stored by the server by their number, so the fragments
+    posted before a replay is interrupted can safely be posted again. A
+    line only partly written when the agent stopped is skipped on replay.
+    """
+
+    def __init__(self, rundir: str, log_type: LogType):
+        self.path = Path(rundir) / SPOOL_DIR / f"{log_type}.jsonl"
+        self.lock = threading.Lock()
+
+    @property
+    def pending(self) -> bool:
+        """Indicate whether there are spooled fragments to replay."""
+        return self.path.exists()
+
+    def append(self, log_inputs: list[LogEndpointInput]):
+        """Append log fragments to the spool."""
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as spool:
+                spool.writelines(
+                    json.dumps(asdict(log_input)) + "\n"
+                    for log_input in log_inputs
+                )
+                spool.flush()
+                os.fsync(spool.fileno())
+
+    def replay(
+        self,
+        post: Callable[[list[LogEndpointInput]], bool],
+        max_bytes: int = SPOOL_REPLAY_BYTES,
+    ) -> bool:
+        """Post the spooled fragments in order, and remove the spool.
+
+        :param post: Function that posts a batch of log fragments
+        :param max_bytes: Log data to post with each call to post
+        :return: True if all the spooled fragments were posted
+        """
+        with self.lock:
+            try:
+                spool = self.path.open("r", encoding="utf-8")
+            except FileNotFoundError:
+                return True
+            with spool:
+                batch = []
+                batch_bytes = 0
+                for line in spool:
+                    try:
+                        log_input = LogEndpointInput(**json.loads(line))
+                    except (json.JSONDecodeError, TypeError):
+                        # the agent stopped while the line was written
+                        logger.warning("Skipping torn line in %s", self.path)
+                        continue
+                    batch.append(log_input)
+                    batch_bytes += len(log_input.log_data)
+                    if batch_bytes >= max_bytes:
+                        if not post(batch):
+                            return False
+                        batch = []
+                        batch_bytes = 0
+                if batch and not post(batch):
+                    return False
+            self.path.unlink()
+            return True
+
+
+def replay_log_spools(client: TestflingerClient, rundir: str):
+    """Post the log fragments spooled for the job run in rundir.
+
+    :param client: Client used to post the log fragments
+    :param rundir: Directory the job was run in, named after its job ID
+    :raises TFServerError: If the fragments couldn't all be posted
+    """
+    job_id = Path(rundir).name
+    for log_type in LogType:
+        spool = LogSpool(rundir, log_type)
+        if not spool.pending:
+            continue
+        logger.info("Posting spooled %s log for job %s", log_type, job_id)
+        posted = spool.replay(
+            lambda log_inputs, log_type=log_type: client.post_logs(
+                job_id, [(log_type, log_input) for log_input in log_inputs]
+            )
+        )
+        if not posted:
+            raise TFServerError("unable to post spooled log")
@@ -30,10 +30,12 @@ from testflinger_common.enums import AgentState, LogType, TestEvent, TestPhase
 
 import testflinger_agent
 from testflinger_agent.agent import TestflingerAgent as _TestflingerAgent
+from testflinger_agent.client import LogEndpointInput
 from testflinger_agent.client import TestflingerClient as _TestflingerClient
 from testflinger_agent.config import ATTACHMENTS_DIR
 from testflinger_agent.errors import TFServerError
 from testflinger_agent.schema import validate
+from testflinger_agent.spool import LogSpool
 
 
 class TestClient:
@@ -456,6 +458,35 @@ class TestClient:
             )
             mock_transmit_job_outcome.assert_called_with(retry_dir)
 
+    def test_retry_transmit_spooled_logs(self, agent, requests_mock):
+        """Test that logs spooled by a job are posted with its results."""
+        job_id = str(uuid.uuid1())
+        result_dir = os.path.join(self.config.get("results_basedir"), job_id)
+        LogSpool(result_dir, LogType.STANDARD_OUTPUT).append(
+            [LogEndpointInput(0, "2026-01-01T00:00:00+00:00", "test", "out")]
+        )
+        batch_url = f"http://127.0.0.1:8000/v1/result/{job_id}/log"
+        requests_mock.post(
+            batch_url, status_code=HTTPStatus.SERVICE_UNAVAILABLE
+        )
+        with patch.object(
+            testflinger_agent.client.TestflingerClient, "transmit_job_outcome"
+        ) as mock_transmit_job_outcome:
+            # The results aren't sent until the spooled logs are
+            agent.retry_old_results()
+            mock_transmit_job_outcome.assert_not_called()
+            requests_mock.post(batch_url, status_code=HTTPStatus.OK)
+            agent.retry_old_results()
+            mock_transmit_job_outcome.assert_called_with(result_dir)
+        assert requests_mock.last_request.json()["fragments"][0] == {
+            "log_type": "output",
+            "fragment_number": 0,
+            "timestamp": "2026-01-01T00:00:00+00:00",
+            "phase": "test",
+            "log_data": "out",
+        }
+        assert not LogSpool(result_dir, LogType.STANDARD_OUTPUT).pending
+
     def test_recovery_failed(self, agent, requests_mock):
         # Make sure we stop processing jobs after a device recovery error
         self.config["provision_command"] = "bash -c 'exit 46'"
@@ -546,7 +577,12 @@ class TestClient:
                 requests_mock.request_history,
             )
         )
-        event_list = status_update_requests[-1].json()["events"]
+        # each update only contains the events that are new
+        event_list = [
+            event
+            for request in status_update_requests
+            for event in request.json()["events"]
+        ]
         event_name_list = [event["event_name"] for event in event_list]
         expected_event_name_list = [
             phase.value + postfix
@@ -580,7 +616,7 @@ class TestClient:
         requests_mock.post(status_url, status_code=HTTPStatus.OK)
 
         requests_mock.get(
-            f"http://127.0.0.1:8000/v1/result/{job_id}",
+            f"http://127.0.0.1:8000/v1/result/{job_id}/state",
             json={"job_state": "cancelled"},
         )
         with patch("shutil.rmtree"):
@@ -592,7 +628,12 @@ class TestClient:
                 requests_mock.request_history,
             )
         )
-        event_list = status_update_requests[-1].json()["events"]
+        # each update only contains the events that are new
+        event_list = [
+            event
+            for request in status_update_requests
+            for event in request.json()["events"]
+        ]
         event_name_list = [event["event_name"] for event in event_list]
 
         assert "cancelled" in event_name_list
@@ -629,7 +670,12 @@ class TestClient:
                 requests_mock.request_history,
             )
         )
-        event_list = status_update_requests[-1].json()["events"]
+        # each update only contains the events that are new
+        event_list = [
+            event
+            for request in status_update_requests
+            for event in request.json()["events"]
+        ]
         event_name_list = [event["event_name"] for event in event_list]
 
         assert "global_timeout" in event_name_list
@@ -666,7 +712,12 @@ class TestClient:
                 requests_mock.request_history,
             )
         )
-        event_list = status_update_requests[-1].json()["events"]
+        # each update only contains the events that are new
+        event_list = [
+            event
+            for request in status_update_requests
+            for event in request.json()["events"]
+        ]
         event_name_list = [event["event_name"] for event in event_list]
         assert "output_timeout" in event_name_list
 
@@ -785,7 +836,12 @@ class TestClient:
                 requests_mock.request_history,
             )
         )
-        event_list = status_update_requests[-1].json()["events"]
+        # each update only contains the events that are new
+        event_list = [
+            event
+            for request in status_update_requests
+            for event in request.json()["events"]
+        ]
         provision_fail_events = list(
             filter(
                 lambda event: event["event_name"] == "provision_fail",
@@ -858,7 +914,12 @@ class TestClient:
                 requests_mock.request_history,
             )
         )
-        event_list = status_update_requests[-1].json()["events"]
+        # each update only contains the events that are new
+        event_list = [
+            event
+            for request in status_update_requests
+            for event in request.json()["events"]
+        ]
         provision_fail_events = list(
             filter(
                 lambda event: event["event_name"] == "provision_fail",
@@ -912,9 +973,14 @@ class TestClient:
                 "release": "",
             },
         )
+        log_queue_depth = prometheus_client.REGISTRY.get_sample_value(
+            "log_queue_depth",
+            {"agent_id": agent_id, "log_type": LogType.STANDARD_OUTPUT},
+        )
         assert total_provision_failures == 1
         assert total_jobs == 1
         assert provision_duration_count == 1
+        assert log_queue_depth == 0
 
     def test_agent_metrics_release_label_after_provision(
         self, agent, requests_mock
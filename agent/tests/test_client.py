@@ -12,6 +12,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import io
 import json
 import uuid
 from datetime import datetime, timezone
@@ -102,6 +103,34 @@ class TestClient:
         assert params == ["queue1"]
         assert job_data == fake_job_data
 
+    def test_check_jobs_long_poll(self, client, requests_mock):
+        """Test the job request asks the server to wait for a job."""
+        client.config["polling_interval"] = 20
+        requests_mock.get(
+            "http://127.0.0.1:8000/v1/agents/data/test_agent", json={}
+        )
+        requests_mock.get(
+            "http://127.0.0.1:8000/v1/job",
+            status_code=HTTPStatus.NO_CONTENT,
+            headers={"X-Testflinger-Job-Wait": "60"},
+        )
+        assert client.check_jobs() is None
+        assert requests_mock.last_request.qs.get("wait") == ["20"]
+        assert requests_mock.last_request.timeout == 50
+        assert client.job_wait_supported is True
+
+    def test_check_jobs_long_poll_unsupported(self, client, requests_mock):
+        """Test long-polling isn't assumed if the server doesn't support it."""
+        client.job_wait_supported = True
+        requests_mock.get(
+            "http://127.0.0.1:8000/v1/agents/data/test_agent", json={}
+        )
+        requests_mock.get(
+            "http://127.0.0.1:8000/v1/job", status_code=HTTPStatus.NO_CONTENT
+        )
+        assert client.check_jobs() is None
+        assert client.job_wait_supported is False
+
     def test_post_advertised_queues(self, client, requests_mock):
         """
         Ensure that the server api /v1/agents/queues was called with
@@ -210,6 +239,41 @@ class TestClient:
         assert response == {}
         assert "Unable to get results" in caplog.text
 
+    def test_check_job_state(self, client, requests_mock):
+        """Test that check_job_state uses the lightweight state endpoint."""
+        job_id = str(uuid.uuid1())
+        requests_mock.get(
+            f"http://127.0.0.1:8000/v1/result/{job_id}/state",
+            json={"job_state": "test", "setup_status": 0},
+        )
+        assert client.check_job_state(job_id) == "test"
+
+    def test_check_job_state_fallback(self, client, requests_mock):
+        """
+        Test that check_job_state falls back to the full results when
+        the server does not provide the state endpoint.
+        """
+        job_id = str(uuid.uuid1())
+        requests_mock.get(
+            f"http://127.0.0.1:8000/v1/result/{job_id}/state",
+            status_code=HTTPStatus.NOT_FOUND,
+        )
+        requests_mock.get(
+            f"http://127.0.0.1:8000/v1/result/{job_id}",
+            json={"job_state": "cancelled"},
+        )
+        assert client.check_job_state(job_id) == "cancelled"
+
+    def test_check_job_state_error(self, client, requests_mock, caplog):
+        """Test that check_job_state returns None on a server error."""
+        job_id = str(uuid.uuid1())
+        requests_mock.get(
+            f"http://127.0.0.1:8000/v1/result/{job_id}/state",
+            status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+        )
+        assert client.check_job_state(job_id) is None
+        assert "Unable to get job state" in caplog.text
+
     def test_attachment_endpoint_error(self, client, requests_mock, caplog):
         """
         Test that the client handles the case where the server returns
@@ -225,6 +289,42 @@ class TestClient:
             client.get_attachments(job_id, None)
             assert "Unable to retrieve attachments for job" in caplog.text
 
+    def test_get_attachments_resumed(self, client, requests_mock, tmp_path):
+        """Test that an interrupted attachments download is resumed."""
+
+        class InterruptedStream(io.BytesIO):
+            """Stream that fails instead of ending."""
+
+            def read(self, *args, **kwargs):
+                data = super().read(*args, **kwargs)
+                if not data:
+                    raise ConnectionResetError("Connection lost")
+                return data
+
+        job_id = str(uuid.uuid1())
+        # the first response is interrupted after a complete chunk
+        first_part = b"x" * 4096
+        requests_mock.get(
+            f"http://127.0.0.1:8000/v1/job/{job_id}/attachments",
+            [
+                {
+                    "body": InterruptedStream(first_part),
+                    "headers": {"ETag": '"abc"'},
+                },
+                {
+                    "content": b"rest",
+                    "status_code": HTTPStatus.PARTIAL_CONTENT,
+                },
+            ],
+        )
+        path = tmp_path / "attachments.tar.gz"
+        client.get_attachments(job_id, path)
+
+        assert path.read_bytes() == first_part + b"rest"
+        resumed_request = requests_mock.request_history[-1]
+        assert resumed_request.headers["Range"] == "bytes=4096-"
+        assert resumed_request.headers["If-Range"] == '"abc"'
+
     def test_transmit_job_artifact(self, client, requests_mock, tmp_path):
         """Test that transmit_job_outcome sends artifacts if they exist."""
         artifacts_dir = tmp_path / "artifacts"
@@ -242,6 +342,33 @@ class TestClient:
         )
         client.transmit_job_outcome(tmp_path)
         assert requests_mock.called
+        assert (
+            requests_mock.last_request.headers["Content-Type"]
+            == "application/octet-stream"
+        )
+
+    def test_save_artifacts_multipart_fallback(
+        self, client, requests_mock, tmp_path
+    ):
+        """Test artifacts are sent as form data if streams are rejected."""
+        artifacts_dir = tmp_path / "artifacts"
+        artifacts_dir.mkdir()
+        (artifacts_dir / "test.txt").write_text("test")
+        job_id = str(uuid.uuid1())
+        requests_mock.post(
+            f"http://127.0.0.1:8000/v1/result/{job_id}/artifact",
+            [
+                {"status_code": HTTPStatus.BAD_REQUEST},
+                {"status_code": HTTPStatus.OK},
+            ],
+        )
+        client.save_artifacts(tmp_path, job_id)
+
+        first, second = requests_mock.request_history
+        assert first.headers["Content-Type"] == "application/octet-stream"
+        assert second.headers["Content-Type"].startswith("multipart/form-data")
+        assert not client.stream_upload_supported
+        assert not artifacts_dir.exists()
 
     def test_save_artifacts_missing_artifacts_dir(
         self, client, requests_mock, tmp_path
@@ -310,6 +437,21 @@ class TestClient:
         }
         assert requests_mock.last_request.json() == expected_json
 
+    def test_post_status_update_sequence(self, client, requests_mock):
+        """Test that new events are sent with their sequence number."""
+        job_id = str(uuid.uuid1())
+        requests_mock.post(
+            f"http://127.0.0.1:8000/v1/job/{job_id}/events",
+            status_code=HTTPStatus.OK,
+        )
+        events = [{"event_name": "provision_start", "timestamp": "now"}]
+        status = client.post_status_update(
+            "myjobqueue", "http://foo", events, job_id, sequence=3
+        )
+        assert status == HTTPStatus.OK
+        assert requests_mock.last_request.json()["sequence"] == 3
+        assert requests_mock.last_request.json()["events"] == events
+
     def test_status_update_endpoint_error(self, client, requests_mock, caplog):
         """
         Test that the client handles the case where the server returns
@@ -711,6 +853,57 @@ class TestClient:
         )
         assert client.post_log(job_id, log_input, log_type) is False
 
+    def test_post_logs_success(self, client, requests_mock):
+        job_id = str(uuid.uuid4())
+        requests_mock.post(
+            f"http://127.0.0.1:8000/v1/result/{job_id}/log",
+            status_code=HTTPStatus.OK,
+        )
+        log_inputs = [
+            (
+                log_type,
+                LogEndpointInput(
+                    fragment_number=0,
+                    timestamp=datetime.now(timezone.utc).isoformat(),
+                    phase="test",
+                    log_data=f"{log_type}_log_data",
+                ),
+            )
+            for log_type in (LogType.STANDARD_OUTPUT, LogType.SERIAL_OUTPUT)
+        ]
+        assert client.post_logs(job_id, log_inputs) is True
+        fragments = requests_mock.last_request.json()["fragments"]
+        assert [fragment["log_type"] for fragment in fragments] == [
+            "output",
+            "serial",
+        ]
+        assert fragments[1]["log_data"] == "serial_log_data"
+
+    def test_post_logs_not_supported(self, client, requests_mock):
+        """Test fragments are posted separately to older servers."""
+        job_id = str(uuid.uuid4())
+        batch_url = f"http://127.0.0.1:8000/v1/result/{job_id}/log"
+        output_url = f"{batch_url}/output"
+        requests_mock.post(batch_url, status_code=HTTPStatus.NOT_FOUND)
+        requests_mock.post(output_url, status_code=HTTPStatus.OK)
+        log_inputs = [
+            (
+                LogType.STANDARD_OUTPUT,
+                LogEndpointInput(
+                    fragment_number=i,
+                    timestamp=datetime.now(timezone.utc).isoformat(),
+                    phase="test",
+                    log_data=f"output{i}",
+                ),
+            )
+            for i in range(2)
+        ]
+        assert client.post_logs(job_id, log_inputs) is True
+        assert client.post_logs(job_id, log_inputs) is True
+        urls = [request.url for request in requests_mock.request_history]
+        # The batch endpoint is only tried once
+        assert urls == [batch_url] + 4 * [output_url]
+
     def test_session_retries_on_expired_token(
         self, client, requests_mock, tmp_path
     ):
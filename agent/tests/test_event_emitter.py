@@ -0,0 +1,103 @@
+# Copyright (C) 2026 Canonical
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from http import HTTPStatus
+from unittest.mock import MagicMock
+
+from testflinger_common.enums import TestEvent
+
+from testflinger_agent.event_emitter import EventEmitter
+
+
+def mock_client(statuses: list) -> MagicMock:
+    """Return a client responding to status updates with `statuses`.
+
+    The event names and sequence number of each update are recorded in
+    `client.posted`, as the events posted are changed by later events.
+    """
+    client = MagicMock()
+    client.posted = []
+
+    def post_status_update(job_queue, webhook, events, job_id, sequence=None):
+        client.posted.append(
+            ([event["event_name"] for event in events], sequence)
+        )
+        return statuses.pop(0)
+
+    client.post_status_update.side_effect = post_status_update
+    return client
+
+
+def test_emit_event_sends_new_events():
+    """Test that only the events the server doesn't have are sent."""
+    client = mock_client([HTTPStatus.OK, None, HTTPStatus.OK])
+    emitter = EventEmitter("queue", "http://webhook", client, "job_id")
+    emitter.emit_event(TestEvent.JOB_START)
+    emitter.emit_event(TestEvent.SETUP_START)
+    emitter.emit_event(TestEvent.SETUP_SUCCESS)
+
+    # the event that failed to be sent is sent again with the next one
+    assert client.posted == [
+        (["job_start"], 0),
+        (["setup_start"], 1),
+        (["setup_start", "setup_success"], 1),
+    ]
+
+
+def test_emit_event_resends_events_on_conflict():
+    """Test that all events are sent if the server is missing some."""
+    client = mock_client(
+        [HTTPStatus.OK, HTTPStatus.CONFLICT, HTTPStatus.OK, HTTPStatus.OK]
+    )
+    emitter = EventEmitter("queue", "http://webhook", client, "job_id")
+    emitter.emit_event(TestEvent.JOB_START)
+    emitter.emit_event(TestEvent.SETUP_START)
+    emitter.emit_event(TestEvent.SETUP_SUCCESS)
+
+    # the events are sent again right away, not with the next event
+    assert client.posted == [
+        (["job_start"], 0),
+        (["setup_start"], 1),
+        (["job_start", "setup_start"], 0),
+        (["setup_success"], 2),
+    ]
+
+
+def test_emit_event_conflict_from_start():
+    """Test that a conflict for the full history isn't retried forever."""
+    client = mock_client([HTTPStatus.CONFLICT, HTTPStatus.OK])
+    emitter = EventEmitter("queue", "http://webhook", client, "job_id")
+    emitter.emit_event(TestEvent.JOB_START)
+    emitter.emit_event(TestEvent.SETUP_START)
+
+    assert client.posted == [
+        (["job_start"], 0),
+        (["job_start", "setup_start"], 0),
+    ]
+
+
+def test_emit_event_full_history_fallback():
+    """Test that the full history is sent to servers without sequences."""
+    client = mock_client(
+        [HTTPStatus.UNPROCESSABLE_ENTITY, HTTPStatus.OK, HTTPStatus.OK]
+    )
+    emitter = EventEmitter("queue", "http://webhook", client, "job_id")
+    emitter.emit_event(TestEvent.JOB_START)
+    emitter.emit_event(TestEvent.SETUP_START)
+
+    assert client.posted == [
+        (["job_start"], 0),
+        (["job_start"], None),
+        (["job_start", "setup_start"], None),
+    ]
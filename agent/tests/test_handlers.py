@@ -12,10 +12,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
+import gzip
+import threading
+import time
 import uuid
+from unittest.mock import MagicMock
 
 import pytest
 import requests_mock as rmock
+from testflinger_common.enums import LogType
 
 import testflinger_agent
 from testflinger_agent.client import TestflingerClient as _TestflingerClient
@@ -24,7 +29,9 @@ from testflinger_agent.handlers import (
     OutputLogHandler,
     SerialLogHandler,
 )
+from testflinger_agent.metrics import MetricsHandler
 from testflinger_agent.schema import validate
+from testflinger_agent.spool import LogSpool
 
 
 class TestHandler:
@@ -46,16 +53,69 @@ class TestHandler:
         requests_mock.post(rmock.ANY)
         yield _TestflingerClient(self.config)
 
+    def hold_requests(self):
+        """Return a callback for requests that waits until posted is set.
+
+        The started event is set once the first request is received.
+        """
+        self.started = threading.Event()
+        self.posted = threading.Event()
+
+        def callback(request, context):
+            self.started.set()
+            self.posted.wait(5)
+            return ""
+
+        return callback
+
     def test_file_log_handler(self, tmp_path):
         filename = tmp_path / "output.log"
         file_log_handler = FileLogHandler(filename)
         file_log_handler("output1")
+        file_log_handler.flush()
         with open(filename, "r") as log:
             assert log.read() == "output1"
         file_log_handler("output2")
+        file_log_handler.close()
         with open(filename, "r") as log:
             assert log.read() == "output1output2"
 
+    def test_file_log_handler_buffered(self, tmp_path):
+        filename = tmp_path / "output.log"
+        file_log_handler = FileLogHandler(
+            filename, flush_interval=60, flush_bytes=10
+        )
+        # Log updates are buffered until enough of them have been written
+        file_log_handler("output1")
+        assert filename.read_text() == ""
+        file_log_handler("output2")
+        assert filename.read_text() == "output1output2"
+        file_log_handler("output3")
+        file_log_handler.close()
+        assert filename.read_text() == "output1output2output3"
+
+    def test_file_log_handler_flush_interval(self, tmp_path):
+        filename = tmp_path / "output.log"
+        file_log_handler = FileLogHandler(
+            filename, flush_interval=0.05, flush_bytes=1024
+        )
+        # Buffered updates are written once the output goes quiet
+        file_log_handler("output1")
+        deadline = time.monotonic() + 5
+        while filename.read_text() != "output1":
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        file_log_handler.close()
+
+    def test_file_log_handler_compress(self, tmp_path):
+        filename = tmp_path / "output.log.gz"
+        file_log_handler = FileLogHandler(filename, compress=True)
+        file_log_handler("output1")
+        file_log_handler("output2")
+        file_log_handler.close()
+        with gzip.open(filename, "rt") as log:
+            assert log.read() == "output1output2"
+
     def test_output_log_handler(self, client, requests_mock):
         job_id = str(uuid.uuid1())
         phase = "phase1"
@@ -64,6 +124,7 @@ class TestHandler:
         requests_mock.post(output_url, status_code=200)
         output_log_handler("output0")
         output_log_handler("output1")
+        output_log_handler.flush()
         requests = list(
             filter(
                 lambda req: req.url == output_url,
@@ -76,6 +137,22 @@ class TestHandler:
             assert requests[i].json()["phase"] == "phase1"
             assert requests[i].json()["log_data"] == f"output{i}"
 
+    def test_output_log_handler_metrics(self, client, requests_mock):
+        job_id = str(uuid.uuid1())
+        metrics_handler = MagicMock(spec=MetricsHandler)
+        output_log_handler = OutputLogHandler(
+            client, job_id, "phase1", metrics_handler=metrics_handler
+        )
+        output_log_handler("output0")
+        output_log_handler.flush()
+        metrics_handler.report_log_queue_depth.assert_any_call(
+            LogType.STANDARD_OUTPUT, 1
+        )
+        metrics_handler.report_log_queue_depth.assert_called_with(
+            LogType.STANDARD_OUTPUT, 0
+        )
+        metrics_handler.report_log_send_latency.assert_called_once()
+
     def test_serial_log_handler(self, client, requests_mock):
         job_id = str(uuid.uuid1())
         phase = "phase1"
@@ -84,6 +161,7 @@ class TestHandler:
         requests_mock.post(serial_url, status_code=200)
         serial_log_handler("output0")
         serial_log_handler("output1")
+        serial_log_handler.flush()
         requests = list(
             filter(
                 lambda req: req.url == serial_url,
@@ -117,3 +195,144 @@ class TestHandler:
         assert requests[0].json()["fragment_number"] == 0
         assert requests[0].json()["phase"] == "test"
         assert requests[0].json()["log_data"] == "a" * 2048
+
+    def test_output_log_handler_batch(self, client, requests_mock):
+        job_id = str(uuid.uuid1())
+        output_log_handler = OutputLogHandler(
+            client, job_id, "test", batch_size=3
+        )
+        batch_url = f"http://127.0.0.1:8000/v1/result/{job_id}/log"
+        requests_mock.post(batch_url, text=self.hold_requests())
+        # The first update is posted right away, the rest are queued while
+        # it is in progress and posted in batches
+        output_log_handler("output0")
+        self.started.wait(5)
+        for i in range(1, 5):
+            output_log_handler(f"output{i}")
+        self.posted.set()
+        output_log_handler.flush()
+        requests = [
+            req
+            for req in requests_mock.request_history
+            if req.url == batch_url
+        ]
+        assert [len(req.json()["fragments"]) for req in requests] == [1, 3, 1]
+        fragments = [
+            fragment
+            for req in requests
+            for fragment in req.json()["fragments"]
+        ]
+        for i, fragment in enumerate(fragments):
+            assert fragment["log_type"] == "output"
+            assert fragment["fragment_number"] == i
+            assert fragment["phase"] == "test"
+            assert fragment["log_data"] == f"output{i}"
+
+    def test_endpoint_write_from_file_batch(
+        self, client, requests_mock, tmp_path
+    ):
+        job_id = str(uuid.uuid1())
+        filename = tmp_path / "serial.log"
+        filename.write_text("a" * 10)
+        serial_log_handler = SerialLogHandler(
+            client, job_id, "provision", batch_size=10
+        )
+        batch_url = f"http://127.0.0.1:8000/v1/result/{job_id}/log"
+        requests_mock.post(batch_url, status_code=200)
+        serial_log_handler.write_from_file(filename, chunk_size=4)
+        fragments = [
+            fragment
+            for req in requests_mock.request_history
+            if req.url == batch_url
+            for fragment in req.json()["fragments"]
+        ]
+        assert [fragment["log_data"] for fragment in fragments] == [
+            "aaaa",
+            "aaaa",
+            "aa",
+        ]
+        assert [fragment["fragment_number"] for fragment in fragments] == [
+            0,
+            1,
+            2,
+        ]
+        assert {fragment["log_type"] for fragment in fragments} == {"serial"}
+
+    def test_output_log_handler_spill(self, client, requests_mock):
+        job_id = str(uuid.uuid1())
+        output_log_handler = OutputLogHandler(
+            client, job_id, "test", batch_size=2, max_queue_bytes=10
+        )
+        batch_url = f"http://127.0.0.1:8000/v1/result/{job_id}/log"
+        requests_mock.post(batch_url, text=self.hold_requests())
+        # Updates beyond the first 10 bytes are spilled to disk while the
+        # first update is being posted
+        output_log_handler("output0")
+        self.started.wait(5)
+        for i in range(1, 6):
+            output_log_handler(f"output{i}")
+        assert output_log_handler.spill is not None
+        self.posted.set()
+        output_log_handler.flush()
+        assert output_log_handler.spill is None
+        fragments = [
+            fragment
+            for req in requests_mock.request_history
+            if req.url == batch_url
+            for fragment in req.json()["fragments"]
+        ]
+        assert [fragment["log_data"] for fragment in fragments] == [
+            f"output{i}" for i in range(6)
+        ]
+        assert [fragment["fragment_number"] for fragment in fragments] == list(
+            range(6)
+        )
+
+    def test_output_log_handler_not_blocked(self, client, requests_mock):
+        job_id = str(uuid.uuid1())
+        output_log_handler = OutputLogHandler(client, job_id, "test")
+        output_url = f"http://127.0.0.1:8000/v1/result/{job_id}/log/output"
+        requests_mock.post(output_url, text=self.hold_requests())
+        # A slow server doesn't hold up the output
+        output_log_handler("output0")
+        output_log_handler("output1")
+        assert requests_mock.call_count <= 1
+        self.posted.set()
+        output_log_handler.flush()
+        assert requests_mock.call_count == 2
+
+    def test_output_log_handler_spool(self, client, requests_mock, tmp_path):
+        job_id = str(uuid.uuid1())
+        output_log_handler = OutputLogHandler(client, job_id, "test")
+        output_log_handler.spool = LogSpool(tmp_path, LogType.STANDARD_OUTPUT)
+        output_url = f"http://127.0.0.1:8000/v1/result/{job_id}/log/output"
+        batch_url = f"http://127.0.0.1:8000/v1/result/{job_id}/log"
+        requests_mock.post(output_url, status_code=503)
+        requests_mock.post(batch_url, status_code=503)
+        # Updates that can't be posted are spooled
+        output_log_handler("output0")
+        output_log_handler("output1")
+        output_log_handler.flush()
+        assert output_log_handler.spool.pending
+
+        # Once the server is back, the spooled updates are posted first
+        requests_mock.post(output_url, status_code=200)
+        requests_mock.post(batch_url, status_code=200)
+        requests_mock.reset_mock()
+        output_log_handler("output2")
+        output_log_handler.flush()
+        assert not output_log_handler.spool.pending
+        assert [req.url for req in requests_mock.request_history] == [
+            batch_url,
+            output_url,
+        ]
+        fragments = requests_mock.request_history[0].json()["fragments"]
+        assert [fragment["log_data"] for fragment in fragments] == [
+            "output0",
+            "output1",
+        ]
+        assert [fragment["fragment_number"] for fragment in fragments] == [
+            0,
+            1,
+        ]
+        assert requests_mock.request_history[1].json()["fragment_number"] == 2
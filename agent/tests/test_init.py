@@ -66,6 +66,7 @@ class TestMainLoop:
         """Test main loop continues polling when no jobs are available."""
         mock_load_config.return_value = config
         mock_client = Mock()
+        mock_client.job_wait_supported = False
         mock_client_class.return_value = mock_client
         mock_agent = Mock()
         mock_agent_class.return_value = mock_agent
@@ -80,6 +81,38 @@ class TestMainLoop:
         # Verify process_jobs was called twice
         assert mock_agent.process_jobs.call_count == 2
 
+    @patch("testflinger_agent.load_config")
+    @patch("testflinger_agent.configure_logging")
+    @patch("testflinger_agent.TestflingerClient")
+    @patch("testflinger_agent.TestflingerAgent")
+    @patch("time.sleep")
+    def test_main_loop_no_sleep_with_long_polling(
+        self,
+        mock_sleep,
+        mock_agent_class,
+        mock_client_class,
+        mock_configure_logging,
+        mock_load_config,
+        config,
+    ):
+        """Test main loop doesn't sleep when the server held the request."""
+        mock_load_config.return_value = config
+        mock_client = Mock()
+        mock_client.job_wait_supported = True
+        mock_client_class.return_value = mock_client
+        mock_agent = Mock()
+        mock_agent_class.return_value = mock_agent
+        mock_agent.check_offline.return_value = (False, "")
+        mock_agent.process_jobs.side_effect = [None, KeyboardInterrupt()]
+
+        try:
+            start_agent()
+        except KeyboardInterrupt:
+            pass
+
+        assert mock_agent.process_jobs.call_count == 2
+        mock_sleep.assert_not_called()
+
     @patch("testflinger_agent.load_config")
     @patch("testflinger_agent.configure_logging")
     @patch("testflinger_agent.TestflingerClient")
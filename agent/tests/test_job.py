@@ -1,3 +1,4 @@
+import gzip
 import json
 import os
 import re
@@ -82,6 +83,7 @@ class TestJob:
         global_timeout_checker = GlobalTimeoutChecker(1)
         runner.register_stop_condition_checker(global_timeout_checker)
         exit_code, exit_event, exit_reason = runner.run("sleep 12")
+        log_handler.close()
         with open(logfile) as log:
             log_data = log.read()
         assert timeout_str in log_data
@@ -109,6 +111,7 @@ class TestJob:
         # unfortunately, we need to sleep for longer that 10 seconds here
         # or else we fall under the polling time
         exit_code, exit_event, exit_reason = runner.run("sleep 12")
+        log_handler.close()
         with open(logfile) as log:
             log_data = log.read()
         assert timeout_str in log_data
@@ -178,6 +181,23 @@ class TestJob:
         assert exit_event == "setup_fail"
         assert exit_reason == "failed"
 
+    def test_compress_logs(self, client, tmp_path, requests_mock):
+        """Test that the phase output log is compressed if configured."""
+        with open(tmp_path / "testflinger-outcome.json", "w") as outcome_file:
+            outcome_file.write("{}")
+        self.config["compress_logs"] = True
+        self.config["setup_command"] = "echo complete"
+        requests_mock.post(rmock.ANY, status_code=HTTPStatus.OK)
+        requests_mock.get(rmock.ANY, json={}, status_code=HTTPStatus.OK)
+        job = _TestflingerJob({}, client)
+        exit_code, _, _ = job.run_test_phase("setup", tmp_path)
+        assert exit_code == 0
+        assert not (tmp_path / "setup.log").exists()
+        with gzip.open(tmp_path / "setup.log.gz", "rt") as log:
+            log_data = log.read()
+        assert "Starting testflinger setup phase" in log_data
+        assert log_data.endswith("complete\n")
+
     @pytest.mark.timeout(1)
     def test_wait_for_completion(self, client):
         """Test that wait_for_completion works."""
@@ -459,14 +479,16 @@ class TestJob:
         return_value, exit_event, exit_reason = job.run_test_phase(
             phase, tmp_path
         )
-        serial_url = f"http://127.0.0.1:8000/v1/result/{job_id}/log/serial"
-        requests = list(
-            filter(
-                lambda req: req.url == serial_url,
-                requests_mock.request_history,
-            )
-        )
-        assert len(requests) == 1
-        assert requests[0].json()["fragment_number"] == 0
-        assert requests[0].json()["phase"] == phase
-        assert requests[0].json()["log_data"] == "a" * 2048
+        # log fragments are posted in batches by default
+        batch_url = f"http://127.0.0.1:8000/v1/result/{job_id}/log"
+        fragments = [
+            fragment
+            for req in requests_mock.request_history
+            if req.url == batch_url
+            for fragment in req.json()["fragments"]
+            if fragment["log_type"] == "serial"
+        ]
+        assert len(fragments) == 1
+        assert fragments[0]["fragment_number"] == 0
+        assert fragments[0]["phase"] == phase
+        assert fragments[0]["log_data"] == "a" * 2048
@@ -12,7 +12,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from testflinger_agent.masking import Masker
+import random
+
+import pytest
+
+from testflinger_agent.masking import LiteralMasker, Masker
 
 
 def test_hash_consistency():
@@ -84,3 +88,55 @@ def test_apply_with_multiple_matches():
     assert "john@example.com" not in masked
     assert "123-45-6789" not in masked
     assert masked.count("**") == 4
+
+
+def test_literal_special_characters():
+    # secrets are matched literally, not as regular expressions
+    masker = LiteralMasker(["a.c", "(x|y)*"], hash_length=6)
+    masked = masker.apply("abc a.c x (x|y)*")
+    assert masked == (
+        f"abc {masker.mask_text('a.c')} x {masker.mask_text('(x|y)*')}"
+    )
+
+
+def test_literal_overlapping_secrets():
+    # the longest of the leftmost secrets is masked
+    masker = LiteralMasker(["he", "she", "hers", "abc", "abcdef"])
+    assert masker.apply("ushers") == f"u{masker.mask_text('she')}rs"
+    assert masker.apply("abcdefg") == f"{masker.mask_text('abcdef')}g"
+    assert masker.apply("abcdeg") == f"{masker.mask_text('abc')}deg"
+
+
+def test_literal_no_secrets():
+    with pytest.raises(ValueError):
+        LiteralMasker(["", ""])
+
+
+def test_literal_apply_partial():
+    masker = LiteralMasker(["secret", "cre"], hash_length=6)
+    # the end of the text that may be the beginning of a secret is held
+    assert masker.apply_partial("my sec") == ("my ", "sec")
+    masked, held = masker.apply_partial("secret and secr")
+    assert masked == f"{masker.mask_text('secret')} and "
+    assert held == "secr"
+    # text that can no longer be the beginning of a secret is released
+    masked, held = masker.apply_partial("secrex")
+    assert masked == f"se{masker.mask_text('cre')}x"
+    assert held == ""
+
+
+def test_literal_chunks_match_whole_text():
+    # masking text in chunks gives the same result as all at once
+    rng = random.Random(0)  # noqa: S311
+    secrets = [
+        "".join(rng.choices("abc", k=rng.randint(1, 5))) for _ in range(8)
+    ]
+    masker = LiteralMasker(secrets, hash_length=6)
+    text = "".join(rng.choices("abcd", k=2000))
+    masked = []
+    held = ""
+    for start in range(0, len(text), 7):
+        chunk, held = masker.apply_partial(held + text[start : start + 7])
+        masked.append(chunk)
+    masked.append(masker.apply(held))
+    assert "".join(masked) == masker.apply(text)
@@ -12,8 +12,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import time
+
+from testflinger_common.enums import TestEvent
+
 from testflinger_agent.handlers import FileLogHandler
-from testflinger_agent.masking import Masker
+from testflinger_agent.masking import LiteralMasker, Masker
 from testflinger_agent.runner import CommandRunner, MaskingCommandRunner
 
 
@@ -22,6 +26,7 @@ def run(runner, command, tmp_path):
     log_handler = FileLogHandler(logfile)
     runner.register_output_handler(log_handler)
     exit_code, _, _ = runner.run(command)
+    log_handler.close()
     with open(logfile) as log:
         log_data = log.read()
     return exit_code, log_data
@@ -80,3 +85,61 @@ def test_masking_runner_environment(tmp_path):
     for value in variables.values():
         assert value not in log_data
     assert len(log_data) == len(non_sensitive) + 2 + 2 * (hash_length + 4)
+
+
+def test_runner_output_not_delayed(tmp_path):
+    """Check that output is posted as it arrives, not when the command ends."""
+    runner = CommandRunner(tmp_path, env={})
+    received = []
+    runner.register_output_handler(
+        lambda data: received.append((time.monotonic(), data))
+    )
+    start = time.monotonic()
+    runner.run("echo first; sleep 2; echo second")
+
+    assert "".join(data for _, data in received) == "first\nsecond\n"
+    assert received[0][1] == "first\n"
+    assert received[0][0] - start < 1
+
+
+def test_runner_stop_condition_interval(tmp_path):
+    """Check that stop conditions are checked at the configured interval."""
+    runner = CommandRunner(tmp_path, env={}, stop_check_interval=0.1)
+    checks = []
+
+    def checker():
+        checks.append(time.monotonic())
+        if len(checks) == 3:
+            return TestEvent.GLOBAL_TIMEOUT, "Stopped"
+        return None, ""
+
+    runner.register_stop_condition_checker(checker)
+    start = time.monotonic()
+    _, stop_event, stop_reason = runner.run("sleep 30")
+
+    assert stop_event == TestEvent.GLOBAL_TIMEOUT
+    assert stop_reason == "Stopped"
+    assert time.monotonic() - start < 5
+
+
+def test_runner_split_characters(tmp_path):
+    """Check that characters split between reads are decoded whole."""
+    runner = CommandRunner(tmp_path, env={})
+    exit_code, log_data = run(
+        runner, r"printf '\303'; sleep 0.5; printf '\251'", tmp_path
+    )
+    assert exit_code == 0
+    assert log_data == "é"
+
+
+def test_masking_runner_split_secret(tmp_path):
+    """Check that secrets split between reads are masked."""
+    masker = LiteralMasker(["secret"], hash_length=6)
+    runner = MaskingCommandRunner(tmp_path, env={}, masker=masker)
+    received = []
+    runner.register_output_handler(received.append)
+    exit_code, _, _ = runner.run("printf 'a sec'; sleep 0.5; printf 'ret s'")
+    assert exit_code == 0
+    # the possible beginning of the secret is only held back until it
+    # can be masked, and the end of the output is posted once it ends
+    assert received == ["a ", f"{masker.mask_text('secret')} ", "s"]
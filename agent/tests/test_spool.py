@@ -0,0 +1,106 @@
+# Copyright (C) 2026 Canonical
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+import uuid
+
+import pytest
+from testflinger_common.enums import LogType
+
+from testflinger_agent.client import LogEndpointInput, TestflingerClient
+from testflinger_agent.errors import TFServerError
+from testflinger_agent.spool import LogSpool, replay_log_spools
+
+
+def log_inputs(count: int, start: int = 0) -> list[LogEndpointInput]:
+    """Return count log fragments numbered from start."""
+    return [
+        LogEndpointInput(i, "2026-01-01T00:00:00+00:00", "test", f"output{i}")
+        for i in range(start, start + count)
+    ]
+
+
+def test_spool_replay_in_batches(tmp_path):
+    """Test that spooled fragments are posted in order, in batches."""
+    spool = LogSpool(tmp_path, LogType.STANDARD_OUTPUT)
+    spool.append(log_inputs(3))
+    spool.append(log_inputs(2, start=3))
+    batches = []
+
+    def post(batch):
+        batches.append([log_input.fragment_number for log_input in batch])
+        return True
+
+    assert spool.replay(post, max_bytes=14)
+    assert batches == [[0, 1], [2, 3], [4]]
+    assert not spool.pending
+
+
+def test_spool_replay_torn_line(tmp_path):
+    """Test that a partly written fragment is skipped on replay."""
+    spool = LogSpool(tmp_path, LogType.STANDARD_OUTPUT)
+    spool.append(log_inputs(2))
+    with spool.path.open("a", encoding="utf-8") as spool_file:
+        spool_file.write('{"fragment_number": 2, "timest')
+    batches = []
+
+    def post(batch):
+        batches.append(batch)
+        return True
+
+    assert spool.replay(post)
+    assert batches == [log_inputs(2)]
+    assert not spool.pending
+
+
+def test_spool_replay_failed(tmp_path):
+    """Test that the spool is kept if it can't be posted."""
+    spool = LogSpool(tmp_path, LogType.SERIAL_OUTPUT)
+    spool.append(log_inputs(2))
+    assert not spool.replay(lambda batch: False)
+    assert spool.pending
+
+
+def test_replay_log_spools(config, tmp_path, requests_mock):
+    """Test that the spools of a job are posted to the batch endpoint."""
+    job_id = str(uuid.uuid1())
+    rundir = tmp_path / job_id
+    LogSpool(rundir, LogType.STANDARD_OUTPUT).append(log_inputs(2))
+    LogSpool(rundir, LogType.SERIAL_OUTPUT).append(log_inputs(1))
+    batch_url = f"http://127.0.0.1:8000/v1/result/{job_id}/log"
+    requests_mock.post(batch_url, status_code=200)
+
+    replay_log_spools(TestflingerClient(config), str(rundir))
+
+    fragments = [
+        (fragment["log_type"], fragment["fragment_number"])
+        for req in requests_mock.request_history
+        for fragment in req.json()["fragments"]
+    ]
+    assert fragments == [("output", 0), ("output", 1), ("serial", 0)]
+    assert not LogSpool(rundir, LogType.STANDARD_OUTPUT).pending
+    assert not LogSpool(rundir, LogType.SERIAL_OUTPUT).pending
+
+
+def test_replay_log_spools_unreachable(config, tmp_path, requests_mock):
+    """Test that an error is raised if the spools can't be posted."""
+    job_id = str(uuid.uuid1())
+    rundir = tmp_path / job_id
+    LogSpool(rundir, LogType.STANDARD_OUTPUT).append(log_inputs(2))
+    requests_mock.post(
+        f"http://127.0.0.1:8000/v1/result/{job_id}/log", status_code=503
+    )
+
+    with pytest.raises(TFServerError):
+        replay_log_spools(TestflingerClient(config), str(rundir))
+    assert LogSpool(rundir, LogType.STANDARD_OUTPUT).pending
@@ -18,6 +18,8 @@
 """TestflingerCli module."""
 
 import contextlib
+import gzip
+import hashlib
 import json
 import logging
 import os
@@ -28,6 +30,7 @@ import tempfile
 import time
 from argparse import ArgumentParser, RawTextHelpFormatter
 from collections import Counter
+from collections.abc import Iterator
 from datetime import datetime, timedelta, timezone
 from functools import partial
 from http import HTTPStatus
@@ -278,6 +281,17 @@ class TestflingerCli:
             action="store_true",
             help="Include job status (may add delay)",
         )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            help="Only list this many jobs, starting from the most recent",
+        )
+        parser.add_argument(
+            "--page",
+            type=int,
+            default=1,
+            help="Page of jobs to list when using --limit (default 1)",
+        )
 
     def _add_list_queues_args(self, subparsers):
         """Command line arguments for list-queues."""
@@ -1112,6 +1126,10 @@ class TestflingerCli:
         > and restore file information like timestamp, access permissions and
         > owner.
         Ref: https://docs.python.org/3/library/tarfile.html
+
+        The archive is reproducible (the gzip header holds no name or
+        timestamp), so that packing the same attachments again results in an
+        identical archive, which the server may already have stored.
         """
         # determine the reference directory for relative attachment paths
         if self.args.relative:
@@ -1124,7 +1142,13 @@ class TestflingerCli:
             # retrieved from the directory where the job file is contained
             reference = self.args.filename.parent.resolve(strict=True)
 
-        with tarfile.open(archive, "w:gz") as tar:
+        with (
+            open(archive, "wb") as file,
+            gzip.GzipFile(
+                filename="", mode="wb", fileobj=file, mtime=0
+            ) as compressed,
+            tarfile.open(fileobj=compressed, mode="w") as tar,
+        ):
             for phase, attachments in attachment_data.items():
                 phase_path = Path(phase)
                 for attachment in attachments:
@@ -1338,6 +1362,10 @@ class TestflingerCli:
         timeout = self.config.get("attachments_timeout", 600)
         tries = self.config.get("attachments_tries", 3)
 
+        if self.reference_job_attachments(job_id, path):
+            logger.info("Attachments for %s already stored", job_id)
+            return
+
         for _ in range(tries):
             try:
                 self.client.post_attachment(job_id, path, timeout=timeout)
@@ -1372,6 +1400,35 @@ class TestflingerCli:
             f"failed after {tries} tries"
         )
 
+    def reference_job_attachments(self, job_id: str, path: Path) -> bool:
+        """Use an identical attachments archive stored on the server, if any.
+
+        :param job_id:
+            ID for the test job
+        :param path:
+            The path to the attachment archive
+        :return:
+            True if the archive was referenced, False if it must be uploaded
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as archive:
+            while chunk := archive.read(1024 * 1024):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        try:
+            if not self.client.attachments_exist(sha256):
+                return False
+            self.client.reference_attachments(job_id, sha256)
+        except (
+            client.HTTPError,
+            NetworkError,
+            requests.RequestException,
+        ) as error:
+            # servers without shared attachments end up here as well
+            logger.debug("Unable to reference attachments: %s", error)
+            return False
+        return True
+
     def show(self):
         """Show the requested job JSON for a specified JOB_ID."""
         try:
@@ -1619,63 +1676,64 @@ class TestflingerCli:
         if job_state_data["job_state"] not in ("complete", "cancelled"):
             StatusLine.init()
 
-        prev_queue_pos = None
-        cur_fragment = start_fragment
+        # The progress is kept on the instance so that the output printed
+        # before a stream is interrupted isn't printed again
+        self.prev_queue_pos = None
+        self.cur_fragment = start_fragment
+        # Stream logs and state changes if the server supports it, and fall
+        # back to polling for them otherwise
+        use_stream = True
         while True:
             try:
-                job_state_data = self.get_job_state(job_id)
-                job_state = job_state_data["job_state"]
+                if use_stream:
+                    try:
+                        events = self.client.stream_logs(
+                            job_id,
+                            log_type,
+                            phase,
+                            self.cur_fragment,
+                            start_timestamp,
+                        )
+                    except client.HTTPError as exc:
+                        # Other errors are retried, as often as polling
+                        if exc.status not in (
+                            HTTPStatus.NOT_FOUND,
+                            HTTPStatus.METHOD_NOT_ALLOWED,
+                        ):
+                            time.sleep(10)
+                            raise
+                        logger.debug("Unable to stream job output: %s", exc)
+                        use_stream = False
+                        continue
+                    if self._stream_job(events, job_id, job_details, phase):
+                        break
+                    # The server closed the stream, so reconnect
+                    continue
 
-                self.history.update(job_id, job_state)
+                job_state_data = self.get_job_state(job_id)
 
                 last_fragment_number, log_data = self._get_combined_log_output(
-                    job_id, log_type, phase, cur_fragment, start_timestamp
+                    job_id, log_type, phase, self.cur_fragment, start_timestamp
                 )
 
                 # Print logs before any check
                 if last_fragment_number >= 0 and log_data:
                     self._filter_and_print_logs(log_data)
-                    cur_fragment = last_fragment_number + 1
-
-                # If we just entered this state, initialize the StatusLine
-                # Note: we finish printing information about the last (and
-                # maybe also the current) state before updating our StatusLine
-                if job_state != StatusLine.state:
-                    self._on_state_change(job_state, job_details)
-
-                if phase:
-                    phase_status = job_state_data.get(phase)
-                    if phase_status is not None:
-                        print(
-                            f"\nPhase '{phase}' completed with "
-                            f"exit code: {phase_status}",
-                            file=sys.stderr,
-                        )
-                        print(
-                            f"Use 'testflinger poll {job_id} --start_fragment "
-                            f"{cur_fragment}' to continue polling.",
-                            file=sys.stderr,
-                        )
-                        break
-
-                if job_state in ("cancelled", "complete"):
+                    self.cur_fragment = last_fragment_number + 1
+
+                if self._handle_job_state(
+                    job_id,
+                    job_details,
+                    job_state_data,
+                    phase,
+                    self.cur_fragment,
+                ):
                     break
 
-                if job_state == "waiting":
-                    queue_pos = int(self.client.get_job_position(job_id))
-                    if queue_pos != prev_queue_pos:
-                        prev_queue_pos = queue_pos
-                        if queue_pos == 0:
-                            print(
-                                "This job will be picked up after the "
-                                "current job is complete (it is next in line)"
-                            )
-                        else:
-                            print(
-                                f"This job will be picked up after the "
-                                f"current job and {queue_pos} job(s) ahead "
-                                f"of it in the queue are complete"
-                            )
+                if job_state_data["job_state"] == "waiting":
+                    self.prev_queue_pos = self._print_queue_position(
+                        job_id, self.prev_queue_pos
+                    )
                 time.sleep(10)
             except (errors.NoJobDataError, errors.InvalidJobIdError):
                 # Job-specific errors should exit immediately
@@ -1696,17 +1754,133 @@ class TestflingerCli:
                     if choice == "y":
                         self.cancel(job_id)
                         StatusLine.set_message("Job cancelled")
-                print(f"\nNext fragment number: {cur_fragment}")
+                print(f"\nNext fragment number: {self.cur_fragment}")
                 # Both y and n will allow the external handler deal with it
                 raise
 
+    def _stream_job(
+        self,
+        events: Iterator[tuple[str, dict | None]],
+        job_id: str,
+        job_details: dict,
+        phase: str | None,
+    ) -> bool:
+        """Print output and state changes of a job streamed by the server.
+
+        The next fragment number and the queue position that was last
+        printed are updated as the events are received.
+
+        :param events: Events streamed by the server
+        :param job_id: Job ID
+        :param job_details: Job details dict
+        :param phase: Phase to print output for, or None for all phases
+        :return: Whether polling is done
+        """
+        job_state = None
+        last_position_check = 0.0
+        for event, data in events:
+            if event == "log":
+                self._filter_and_print_logs(data["log_data"])
+                self.cur_fragment = data["fragment_number"] + 1
+            elif event == "state":
+                job_state = data["job_state"]
+                if self._handle_job_state(
+                    job_id, job_details, data, phase, self.cur_fragment
+                ):
+                    return True
+            # Queue position changes aren't streamed, so check them as
+            # often as when polling
+            if (
+                job_state == "waiting"
+                and time.monotonic() - last_position_check >= 10
+            ):
+                last_position_check = time.monotonic()
+                self.prev_queue_pos = self._print_queue_position(
+                    job_id, self.prev_queue_pos
+                )
+        return False
+
+    def _handle_job_state(
+        self,
+        job_id: str,
+        job_details: dict,
+        job_state_data: dict,
+        phase: str | None,
+        cur_fragment: int,
+    ) -> bool:
+        """Update the history and status line with the latest job state.
+
+        :param job_id: Job ID
+        :param job_details: Job details dict
+        :param job_state_data: Job and phase statuses
+        :param phase: Phase being polled, or None for all phases
+        :param cur_fragment: Next fragment number to print
+        :return: True if polling is done, False otherwise
+        """
+        job_state = job_state_data["job_state"]
+        self.history.update(job_id, job_state)
+
+        # If we just entered this state, initialize the StatusLine
+        # Note: we finish printing information about the last (and
+        # maybe also the current) state before updating our StatusLine
+        if job_state != StatusLine.state:
+            self._on_state_change(job_state, job_details)
+
+        if phase:
+            phase_status = job_state_data.get(phase)
+            if phase_status is not None:
+                print(
+                    f"\nPhase '{phase}' completed with "
+                    f"exit code: {phase_status}",
+                    file=sys.stderr,
+                )
+                print(
+                    f"Use 'testflinger poll {job_id} --start_fragment "
+                    f"{cur_fragment}' to continue polling.",
+                    file=sys.stderr,
+                )
+                return True
+
+        return job_state in ("cancelled", "complete")
+
+    def _print_queue_position(
+        self, job_id: str, prev_queue_pos: int | None
+    ) -> int:
+        """Print the queue position of a waiting job if it has changed.
+
+        :param job_id: Job ID
+        :param prev_queue_pos: Queue position that was last printed
+        :return: The current queue position
+        """
+        queue_pos = int(self.client.get_job_position(job_id))
+        if queue_pos != prev_queue_pos:
+            if queue_pos == 0:
+                print(
+                    "This job will be picked up after the "
+                    "current job is complete (it is next in line)"
+                )
+            else:
+                print(
+                    f"This job will be picked up after the "
+                    f"current job and {queue_pos} job(s) ahead "
+                    f"of it in the queue are complete"
+                )
+        return queue_pos
+
     def jobs(self):
         """List the previously started test jobs."""
         # Getting job state may be slow, only include if requested
         status_text = "Status" if self.args.status else ""
         print(f"{'Job ID':36} {status_text:9} Submission Time  Queue")
         print("-" * 79)
-        for job_id, jobdata in self.history.history.items():
+        history = list(self.history.history.items())
+        if self.args.limit is not None:
+            if self.args.limit < 1 or self.args.page < 1:
+                sys.exit("Error: --limit and --page must be positive")
+            # Pages are counted back from the most recent job
+            stop = len(history) - self.args.limit * (self.args.page - 1)
+            history = history[max(stop - self.args.limit, 0) : max(stop, 0)]
+        for job_id, jobdata in history:
             if self.args.status:
                 job_state = jobdata.get("job_state")
                 if job_state not in ("cancelled", "complete"):
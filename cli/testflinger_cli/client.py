@@ -20,10 +20,13 @@ import json
 import logging
 import time
 import urllib.parse
+from collections.abc import Iterator
+from datetime import datetime
 from http import HTTPStatus
 from pathlib import Path
 
 import requests
+import urllib3
 
 from testflinger_cli.auth import TestflingerCliAuth
 from testflinger_cli.enums import LogType, TestPhase
@@ -34,6 +37,9 @@ logger = logging.getLogger(__name__)
 # Maximum backoff delay in seconds
 MAX_BACKOFF_TIME = 60
 DEFAULT_TIMEOUT = 15  # seconds
+# How many times a download is attempted, resuming from where the previous
+# attempt stopped
+DOWNLOAD_ATTEMPTS = 3
 
 
 class HTTPError(Exception):
@@ -76,6 +82,8 @@ class Client:
         self.error_count = 0
         self.error_threshold = error_threshold
         self.auth_manager = auth_manager
+        # Cleared when the server only accepts files as multipart form data
+        self.stream_upload_supported = True
 
         self.session = requests.Session()
 
@@ -108,6 +116,9 @@ class Client:
             # Replay the original request with the new token
             new_request = response.request.copy()
             new_request.headers.update(self.auth_manager.build_headers())
+            if new_request._body_position is not None:
+                # Streamed files are sent again from the start
+                requests.utils.rewind_body(new_request)
             # Add a custom attribute to the request to indicate
             # that it has already been retried to avoid infinite loops
             new_request._auth_retry = True
@@ -168,17 +179,7 @@ class Client:
             req = self.session.get(uri, timeout=timeout)
             self.error_count = 0
         except (IOError, requests.exceptions.ConnectionError) as exc:
-            self.error_count += 1
-            if self.error_count % self.error_threshold == 0:
-                logger.warning(
-                    "Error communicating with the server for the past %s "
-                    "requests, but will continue to retry. Last error: %s",
-                    self.error_count,
-                    exc,
-                )
-            # Exponential backoff before re-raising exception
-            backoff_delay = min(2**self.error_count, MAX_BACKOFF_TIME)
-            time.sleep(backoff_delay)
+            self._backoff(exc)
             raise
         except requests.exceptions.Timeout as exc:
             raise NetworkError(
@@ -189,6 +190,23 @@ class Client:
             self._handle_response_error(req)
         return req.text
 
+    def _backoff(self, exc: Exception):
+        """Wait before retrying a request that failed to reach the server.
+
+        :param exc: The exception raised by the failed request
+        """
+        self.error_count += 1
+        if self.error_count % self.error_threshold == 0:
+            logger.warning(
+                "Error communicating with the server for the past %s "
+                "requests, but will continue to retry. Last error: %s",
+                self.error_count,
+                exc,
+            )
+        # Exponential backoff before re-raising exception
+        backoff_delay = min(2**self.error_count, MAX_BACKOFF_TIME)
+        time.sleep(backoff_delay)
+
     def post(
         self,
         uri_frag: str,
@@ -272,6 +290,10 @@ class Client:
     def put_file(self, uri_frag: str, path: Path, timeout: float):
         """Stream a file to the server using a POST request.
 
+        The file is sent as an application/octet-stream request body, which
+        the server stores as it arrives. Servers that reject it are sent
+        files as multipart form data instead.
+
         :param uri_frag:
             endpoint for the POST request
         :param path:
@@ -282,8 +304,23 @@ class Client:
         uri = urllib.parse.urljoin(self.server, uri_frag)
         with open(path, "rb") as file:
             try:
-                files = {"file": (path.name, file, "application/x-gzip")}
-                response = self.session.post(uri, files=files, timeout=timeout)
+                if self.stream_upload_supported:
+                    response = self.session.post(
+                        uri,
+                        data=file,
+                        headers={"Content-Type": "application/octet-stream"},
+                        timeout=timeout,
+                    )
+                    # Older servers fail to find the file in the form data
+                    if response.status_code == HTTPStatus.BAD_REQUEST:
+                        logger.debug("Server does not support file streams")
+                        self.stream_upload_supported = False
+                        file.seek(0)
+                if not self.stream_upload_supported:
+                    files = {"file": (path.name, file, "application/x-gzip")}
+                    response = self.session.post(
+                        uri, files=files, timeout=timeout
+                    )
             except requests.exceptions.ConnectTimeout:
                 logger.error(
                     "Timeout while trying to connect to the remote server"
@@ -306,8 +343,24 @@ class Client:
         :param job_id: ID for the test job
         :return: data containing the job state and each test phase status
         """
-        endpoint = "/v1/result/{}".format(job_id)
-        data = json.loads(self.get(endpoint))
+        endpoint = "/v1/result/{}/state".format(job_id)
+        try:
+            data = json.loads(self.get(endpoint))
+        except HTTPError as exc:
+            if exc.status != HTTPStatus.NOT_FOUND:
+                raise
+            # Older servers don't provide the lightweight state endpoint
+            endpoint = "/v1/result/{}".format(job_id)
+            data = json.loads(self.get(endpoint))
+        return self._parse_status(data)
+
+    @staticmethod
+    def _parse_status(data: dict) -> dict:
+        """Extract the job state and each test phase status from results.
+
+        :param data: Results or job state returned by the server
+        :return: data containing the job state and each test phase status
+        """
         job_status = {
             phase.value: data.get(f"{phase.value}_status")
             for phase in TestPhase
@@ -371,6 +424,29 @@ class Client:
         endpoint = f"/v1/job/{job_id}/attachments"
         self.put_file(endpoint, path, timeout=timeout)
 
+    def attachments_exist(self, sha256: str) -> bool:
+        """Check if an attachments archive is already stored on the server.
+
+        :param sha256:
+            SHA-256 digest of the attachments archive
+        :return:
+            True if the server has the archive, False otherwise
+        """
+        uri = urllib.parse.urljoin(self.server, f"/v1/attachments/{sha256}")
+        response = self.session.get(uri, timeout=DEFAULT_TIMEOUT)
+        return response.status_code == HTTPStatus.OK
+
+    def reference_attachments(self, job_id: str, sha256: str):
+        """Use an attachments archive stored on the server for a test job.
+
+        :param job_id:
+            ID for the test job
+        :param sha256:
+            SHA-256 digest of the attachments archive
+        """
+        endpoint = f"/v1/job/{job_id}/attachments"
+        self.post(endpoint, {"sha256": sha256})
+
     def get_job_data(self, job_id: str) -> dict:
         """Get the JSON job definition for the specified ID.
 
@@ -397,6 +473,9 @@ class Client:
     def get_artifact(self, job_id, path: Path):
         """Get results for a specified test job.
 
+        If the download is interrupted, it is resumed from where it stopped
+        with a range request, as long as the artifact hasn't changed.
+
         :param job_id:
             ID for the test job
         :param path:
@@ -404,13 +483,35 @@ class Client:
         """
         endpoint = "/v1/result/{}/artifact".format(job_id)
         uri = urllib.parse.urljoin(self.server, endpoint)
-        req = self.session.get(uri, timeout=DEFAULT_TIMEOUT, stream=True)
-        if req.status_code != HTTPStatus.OK:
-            raise HTTPError(req.status_code)
-        with path.open("wb") as artifact:
-            for chunk in req.raw.stream(4096, decode_content=False):
-                if chunk:
-                    artifact.write(chunk)
+        headers = {}
+        for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+            try:
+                req = self.session.get(
+                    uri, timeout=DEFAULT_TIMEOUT, stream=True, headers=headers
+                )
+                status = req.status_code
+                if status == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+                    # The artifact was already completely downloaded
+                    return
+                if status not in (HTTPStatus.OK, HTTPStatus.PARTIAL_CONTENT):
+                    raise HTTPError(status)
+                if etag := req.headers.get("ETag"):
+                    headers["If-Range"] = etag
+                # Servers without range support send the whole artifact
+                mode = "ab" if status == HTTPStatus.PARTIAL_CONTENT else "wb"
+                with path.open(mode) as artifact:
+                    for chunk in req.raw.stream(4096, decode_content=False):
+                        if chunk:
+                            artifact.write(chunk)
+                return
+            except (
+                requests.exceptions.ConnectionError,
+                urllib3.exceptions.HTTPError,
+            ) as exc:
+                if attempt == DOWNLOAD_ATTEMPTS or not path.exists():
+                    raise
+                logger.warning("Download interrupted, resuming: %s", exc)
+                headers["Range"] = f"bytes={path.stat().st_size}-"
 
     def get_logs(
         self,
@@ -439,6 +540,80 @@ class Client:
         complete_url_frag = f"{endpoint}?{encoded_params}"
         return json.loads(self.get(complete_url_frag))
 
+    def stream_logs(
+        self,
+        job_id: str,
+        log_type: LogType,
+        phase: TestPhase | None,
+        start_fragment: int,
+        start_timestamp: datetime | None = None,
+    ) -> Iterator[tuple[str, dict | None]]:
+        """Stream log fragments and state changes for a specified test job.
+
+        Events are read from the Server-Sent Events stream provided by the
+        server until it closes the stream, which happens when the job is
+        complete or after the server's maximum stream duration.
+
+        :param job_id: ID for the test job
+        :param log_type: Enum representing normal output or serial output
+        :param phase: Phase to retrieve logs for
+        :param start_fragment: First log fragment to start from
+        :param start_timestamp: Timestamp to start streaming logs from
+        :raises HTTPError: If the server doesn't support streaming logs, as
+            soon as this is called rather than when reading the events
+        :return: Iterator of event names and their data. ``log`` events
+            contain the phase, fragment number and log data of a fragment,
+            ``state`` events contain the job state and each test phase status
+            and ``keepalive`` events have no data.
+        """
+        endpoint = f"/v1/result/{job_id}/log/{log_type.value}/stream"
+        params = {"start_fragment": start_fragment}
+        if start_timestamp is not None:
+            params["start_timestamp"] = start_timestamp.isoformat()
+        if phase is not None:
+            params["phase"] = phase
+        uri = urllib.parse.urljoin(self.server, endpoint)
+        try:
+            req = self.session.get(
+                uri, params=params, timeout=DEFAULT_TIMEOUT, stream=True
+            )
+        except (IOError, requests.exceptions.ConnectionError) as exc:
+            self._backoff(exc)
+            raise
+        if req.status_code != HTTPStatus.OK:
+            with req:
+                self._handle_response_error(req)
+        self.error_count = 0
+        return self._read_events(req)
+
+    def _read_events(
+        self, req: requests.Response
+    ) -> Iterator[tuple[str, dict | None]]:
+        """Read the events of a Server-Sent Events stream.
+
+        :param req: The response streaming the events
+        :return: Iterator of event names and their data
+        """
+        with req:
+            event, data = "message", []
+            for line in req.iter_lines(decode_unicode=True):
+                if line.startswith(":"):
+                    yield "keepalive", None
+                elif line:
+                    field, _, value = line.partition(":")
+                    value = value.removeprefix(" ")
+                    if field == "event":
+                        event = value
+                    elif field == "data":
+                        data.append(value)
+                elif data:
+                    # A blank line dispatches the event
+                    payload = json.loads("\n".join(data))
+                    if event == "state":
+                        payload = self._parse_status(payload)
+                    yield event, payload
+                    event, data = "message", []
+
     def get_job_position(self, job_id):
         """Get the status of a test job.
 
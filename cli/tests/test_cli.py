@@ -23,6 +23,7 @@ import re
 import sys
 import tarfile
 import time
+import urllib.parse
 import uuid
 from http import HTTPStatus
 from pathlib import Path
@@ -50,7 +51,23 @@ def test_status(capsys, requests_mock):
     """Status should report job_state data."""
     jobid = str(uuid.uuid1())
     fake_return = {"job_state": "completed"}
-    requests_mock.get(f"{URL}/v1/result/{jobid}", json=fake_return)
+    requests_mock.get(f"{URL}/v1/result/{jobid}/state", json=fake_return)
+    sys.argv = ["", "status", jobid]
+    tfcli = testflinger_cli.TestflingerCli()
+    tfcli.status()
+    std = capsys.readouterr()
+    assert std.out == "completed\n"
+
+
+def test_status_fallback(capsys, requests_mock):
+    """Status should fall back to the results if there is no state endpoint."""
+    jobid = str(uuid.uuid1())
+    requests_mock.get(
+        f"{URL}/v1/result/{jobid}/state", status_code=HTTPStatus.NOT_FOUND
+    )
+    requests_mock.get(
+        f"{URL}/v1/result/{jobid}", json={"job_state": "completed"}
+    )
     sys.argv = ["", "status", jobid]
     tfcli = testflinger_cli.TestflingerCli()
     tfcli.status()
@@ -349,6 +366,21 @@ def test_pack_attachments_with_reference(tmp_path):
         assert "test/file_3.bin" in filenames
 
 
+def test_pack_attachments_reproducible(tmp_path):
+    """Check that packing the same attachments gives identical archives."""
+    attachment = tmp_path / "file.bin"
+    attachment.write_bytes(os.urandom(1024))
+    sys.argv = ["", "submit", str(tmp_path / "job.yaml")]
+    tfcli = testflinger_cli.TestflingerCli()
+
+    archives = []
+    for name in ("first.tar.gz", "second.tar.gz"):
+        attachment_data = {"test": [{"local": str(attachment)}]}
+        tfcli.pack_attachments(tmp_path / name, attachment_data)
+        archives.append((tmp_path / name).read_bytes())
+    assert archives[0] == archives[1]
+
+
 def test_submit_with_attachments(tmp_path, auth_fixture):
     """Make sure jobs with attachments are submitted correctly."""
     auth_fixture("user")
@@ -388,7 +420,15 @@ def test_submit_with_attachments(tmp_path, auth_fixture):
         # register responses for job and attachment submission endpoints
         mock_response = {"job_id": job_id}
         mocker.post(f"{URL}/v1/job", json=mock_response)
-        mocker.post(f"{URL}/v1/job/{job_id}/attachments")
+        uploads = []
+
+        def read_upload(request, context):
+            # the archive is streamed, so it is read as it is sent
+            uploads.append(request.body.read())
+            return ""
+
+        mocker.post(f"{URL}/v1/job/{job_id}/attachments", text=read_upload)
+        mocker.get(re.compile(f"{URL}/v1/attachments/"), status_code=404)
         mocker.get(
             f"{URL}/v1/queues/fake/agents",
             json=[{"name": "fake_agent", "state": "waiting"}],
@@ -401,21 +441,21 @@ def test_submit_with_attachments(tmp_path, auth_fixture):
         # - the queues endpoint
         # - the oauth2/token endpoint
         # - the job submission endpoint
+        # - the shared attachments endpoint (not found)
         # - the attachment submission endpoint
         history = mocker.request_history
-        assert len(history) == 4
+        assert len(history) == 5
         assert history[0].path == "/v1/oauth2/token"
         assert history[1].path == "/v1/queues/fake/agents"
         assert history[2].path == "/v1/job"
-        assert history[3].path == f"/v1/job/{job_id}/attachments"
+        assert history[3].path.startswith("/v1/attachments/")
+        assert history[4].path == f"/v1/job/{job_id}/attachments"
+
+        assert history[4].headers["Content-Type"] == "application/octet-stream"
 
-        # extract the binary file data from the request
-        # (`requests_mock` only provides access to the `PreparedRequest`)
-        match = re.search(b"\r\n\r\n(.+)\r\n--", history[-1].body, re.DOTALL)
-        data = match.group(1)
-        # write the binary data to a file
+        # write the uploaded binary data to a file
         with open("attachments.tar.gz", "wb") as attachments:
-            attachments.write(data)
+            attachments.write(uploads[0])
         # and check that the contents match the originals
         with tarfile.open("attachments.tar.gz") as attachments:
             filenames = attachments.getnames()
@@ -425,6 +465,54 @@ def test_submit_with_attachments(tmp_path, auth_fixture):
             assert json.load(attachment) == job_data
 
 
+def test_submit_with_stored_attachments(tmp_path, auth_fixture):
+    """Check that attachments already stored on the server aren't uploaded."""
+    auth_fixture("user")
+    job_id = str(uuid.uuid1())
+    job_file = tmp_path / "test.json"
+    job_data = {
+        "job_queue": "fake",
+        "test_data": {"attachments": [{"local": str(job_file)}]},
+    }
+    job_file.write_text(json.dumps(job_data))
+
+    sys.argv = ["", "submit", str(job_file)]
+    tfcli = testflinger_cli.TestflingerCli()
+
+    with Mocker() as mocker:
+        fake_jwt_token = jwt.encode(
+            {"permissions": {"client_id": "my_client_id", "role": "user"}},
+            "my-secret",
+            algorithm="HS256",
+        )
+        mocker.post(
+            f"{URL}/v1/oauth2/token",
+            json={
+                "access_token": fake_jwt_token,
+                "token_type": "Bearer",
+                "expires_in": 30,
+                "refresh_token": str(uuid.uuid4()),
+            },
+        )
+        mocker.post(f"{URL}/v1/job", json={"job_id": job_id})
+        mocker.post(f"{URL}/v1/job/{job_id}/attachments")
+        mocker.get(re.compile(f"{URL}/v1/attachments/"))
+        mocker.get(
+            f"{URL}/v1/queues/fake/agents",
+            json=[{"name": "fake_agent", "state": "waiting"}],
+        )
+
+        tfcli.submit()
+
+        # the stored archive is referenced by its digest, in place of
+        # uploading it again
+        history = mocker.request_history
+        assert len(history) == 5
+        sha256 = history[3].path.removeprefix("/v1/attachments/")
+        assert history[4].path == f"/v1/job/{job_id}/attachments"
+        assert history[4].json() == {"sha256": sha256}
+
+
 def test_submit_attachments_retries(tmp_path, auth_fixture):
     """Check retries after unsuccessful attachment submissions."""
     auth_fixture("user")
@@ -476,6 +564,7 @@ def test_submit_attachments_retries(tmp_path, auth_fixture):
                 {"status_code": 200},
             ],
         )
+        mocker.get(re.compile(f"{URL}/v1/attachments/"), status_code=404)
         mocker.get(
             f"{URL}/v1/queues/fake/agents",
             json=[{"name": "fake_agent", "state": "waiting"}],
@@ -490,11 +579,12 @@ def test_submit_attachments_retries(tmp_path, auth_fixture):
         # - there is a request to the job submission endpoint
         # - there are repeated requests to the attachment submission endpoint
         history = mocker.request_history
-        assert len(history) == 7
+        assert len(history) == 8
         assert history[0].path == "/v1/oauth2/token"
         assert history[1].path == "/v1/queues/fake/agents"
         assert history[2].path == "/v1/job"
-        for entry in history[3:]:
+        assert history[3].path.startswith("/v1/attachments/")
+        for entry in history[4:]:
             assert entry.path == f"/v1/job/{job_id}/attachments"
 
 
@@ -541,6 +631,7 @@ def test_submit_attachments_no_retries(tmp_path, auth_fixture):
             f"{URL}/v1/job/{job_id}/attachments", [{"status_code": 400}]
         )
         mocker.post(f"{URL}/v1/job/{job_id}/action", [{"status_code": 200}])
+        mocker.get(re.compile(f"{URL}/v1/attachments/"), status_code=404)
         mocker.get(
             f"{URL}/v1/queues/fake/agents",
             json=[{"name": "fake_agent", "state": "waiting"}],
@@ -555,16 +646,18 @@ def test_submit_attachments_no_retries(tmp_path, auth_fixture):
         # - there is a request to the queues endpoint
         # - there is a request to the oauth2/token endpoint
         # - there is a request to the job submission endpoint
-        # - there is a single request to the attachment submission endpoint:
-        #   no retries
+        # - there is a single attempt at the attachment submission endpoint,
+        #   streamed and then as form data: no retries
         # - there is a final request to cancel the action
         history = mocker.request_history
-        assert len(history) == 5
+        assert len(history) == 7
         assert history[0].path == "/v1/oauth2/token"
         assert history[1].path == "/v1/queues/fake/agents"
         assert history[2].path == "/v1/job"
-        assert history[3].path == f"/v1/job/{job_id}/attachments"
-        assert history[4].path == f"/v1/job/{job_id}/action"
+        assert history[3].path.startswith("/v1/attachments/")
+        assert history[4].path == f"/v1/job/{job_id}/attachments"
+        assert history[5].path == f"/v1/job/{job_id}/attachments"
+        assert history[6].path == f"/v1/job/{job_id}/action"
 
 
 def test_submit_attachments_timeout(tmp_path, auth_fixture):
@@ -617,6 +710,7 @@ def test_submit_attachments_timeout(tmp_path, auth_fixture):
             ],
         )
         mocker.post(f"{URL}/v1/job/{job_id}/action", [{"status_code": 200}])
+        mocker.get(re.compile(f"{URL}/v1/attachments/"), status_code=404)
         mocker.get(
             f"{URL}/v1/queues/fake/agents",
             json=[{"name": "fake_agent", "state": "waiting"}],
@@ -633,13 +727,14 @@ def test_submit_attachments_timeout(tmp_path, auth_fixture):
         # - the job submission endpoint
         # - the attachment submission endpoint (with retries)
         history = mocker.request_history
-        assert len(history) == 6
+        assert len(history) == 7
         assert history[0].path == "/v1/oauth2/token"
         assert history[1].path == "/v1/queues/fake/agents"
         assert history[2].path == "/v1/job"
-        assert history[3].path == f"/v1/job/{job_id}/attachments"
+        assert history[3].path.startswith("/v1/attachments/")
         assert history[4].path == f"/v1/job/{job_id}/attachments"
-        assert history[5].path == f"/v1/job/{job_id}/action"
+        assert history[5].path == f"/v1/job/{job_id}/attachments"
+        assert history[6].path == f"/v1/job/{job_id}/action"
 
 
 def test_show(capsys, requests_mock):
@@ -888,7 +983,7 @@ def test_reserve_with_distro(capsys, requests_mock):
     # Mock position and result to handle polling
     requests_mock.get(URL + f"/v1/job/{jobid}/position", text="1")
     requests_mock.get(
-        URL + f"/v1/result/{jobid}", json={"job_state": "completed"}
+        URL + f"/v1/result/{jobid}/state", json={"job_state": "completed"}
     )
     requests_mock.get(
         URL + f"/v1/result/{jobid}/log/output?start_fragment=0",
@@ -2136,6 +2231,12 @@ def test_live_polling_with_fragments_progression(
 ):
     """Test live polling uses cur_fragment and progresses through fragments."""
     job_id = str(uuid.uuid1())
+    # Older servers don't support streaming logs
+    requests_mock.get(
+        f"{URL}/v1/result/{job_id}/log/output/stream",
+        status_code=HTTPStatus.NOT_FOUND,
+        json={"message": "Not Found"},
+    )
 
     # Track fragment progression
     fragment_requests = []
@@ -2227,6 +2328,12 @@ def test_live_polling_with_empty_poll(
 ):
     """Test that live output handles empty polls correctly."""
     job_id = str(uuid.uuid1())
+    # Older servers don't support streaming logs
+    requests_mock.get(
+        f"{URL}/v1/result/{job_id}/log/output/stream",
+        status_code=HTTPStatus.NOT_FOUND,
+        json={"message": "Not Found"},
+    )
 
     # Mock job detail (show_job)
     requests_mock.get(
@@ -2236,7 +2343,7 @@ def test_live_polling_with_empty_poll(
 
     # Mock job status
     requests_mock.get(
-        f"{URL}/v1/result/{job_id}",
+        f"{URL}/v1/result/{job_id}/state",
         10 * [{"json": {"job_state": "active"}}]
         + [{"json": {"job_state": "complete"}}],
     )
@@ -2279,6 +2386,12 @@ def test_live_polling_with_empty_poll(
 def test_live_polling_by_phase(mock_sleep, capsys, requests_mock, monkeypatch):
     """Test live polling by phase exits when target phase completes."""
     job_id = str(uuid.uuid1())
+    # Older servers don't support streaming logs
+    requests_mock.get(
+        f"{URL}/v1/result/{job_id}/log/output/stream",
+        status_code=HTTPStatus.NOT_FOUND,
+        json={"message": "Not Found"},
+    )
 
     # Mock job detail (show_job)
     requests_mock.get(
@@ -2288,7 +2401,7 @@ def test_live_polling_by_phase(mock_sleep, capsys, requests_mock, monkeypatch):
 
     # Mock job status checks
     requests_mock.get(
-        f"{URL}/v1/result/{job_id}",
+        f"{URL}/v1/result/{job_id}/state",
         2
         * [
             {
@@ -2356,11 +2469,190 @@ def test_live_polling_by_phase(mock_sleep, capsys, requests_mock, monkeypatch):
     assert "Tests passed!" in captured.out
 
 
+@patch("time.sleep")
+def test_live_polling_with_stream(mock_sleep, capsys, requests_mock):
+    """Test live polling prints output streamed by the server."""
+    job_id = str(uuid.uuid1())
+    requests_mock.get(
+        f"{URL}/v1/job/{job_id}",
+        json={"job_state": "running", "timeout": 3600},
+    )
+    requests_mock.get(
+        f"{URL}/v1/result/{job_id}/state",
+        json={"job_state": "running"},
+    )
+    # The first stream is closed by the server before the job completes,
+    # so the client has to reconnect after the last fragment it received
+    requests_mock.get(
+        f"{URL}/v1/result/{job_id}/log/output/stream?start_fragment=0",
+        text=(
+            "event: state\n"
+            'data: {"job_state": "running"}\n\n'
+            "event: log\n"
+            "id: 0\n"
+            'data: {"phase": "test", "fragment_number": 0, '
+            '"log_data": "first\\n"}\n\n'
+        ),
+    )
+    requests_mock.get(
+        f"{URL}/v1/result/{job_id}/log/output/stream?start_fragment=1",
+        text=(
+            "event: log\n"
+            "id: 1\n"
+            'data: {"phase": "test", "fragment_number": 1, '
+            '"log_data": "second\\n"}\n\n'
+            "event: state\n"
+            'data: {"test_status": 0, "job_state": "complete"}\n\n'
+        ),
+    )
+
+    sys.argv = ["", "poll", job_id]
+    tfcli = testflinger_cli.TestflingerCli()
+    tfcli.do_poll(job_id)
+
+    captured = capsys.readouterr()
+    assert "first\nsecond\n" in captured.out
+    # Nothing is polled for when the server streams the output
+    assert not any(
+        request.path.endswith("/log/output")
+        for request in requests_mock.request_history
+    )
+    mock_sleep.assert_not_called()
+
+
+def test_live_polling_with_broken_stream(capsys, requests_mock):
+    """Test output isn't printed again when a stream is interrupted."""
+    job_id = str(uuid.uuid1())
+    requests_mock.get(
+        f"{URL}/v1/job/{job_id}",
+        json={"job_state": "running", "timeout": 3600},
+    )
+    requests_mock.get(
+        f"{URL}/v1/result/{job_id}/state",
+        json={"job_state": "running"},
+    )
+
+    def broken_stream():
+        for i in range(2):
+            yield (
+                "log",
+                {
+                    "phase": "test",
+                    "fragment_number": i,
+                    "log_data": f"line{i}\n",
+                },
+            )
+        raise requests.exceptions.ChunkedEncodingError("Connection reset")
+
+    def final_stream():
+        yield (
+            "log",
+            {"phase": "test", "fragment_number": 2, "log_data": "line2\n"},
+        )
+        yield "state", {"test": 0, "job_state": "complete"}
+
+    sys.argv = ["", "poll", job_id]
+    tfcli = testflinger_cli.TestflingerCli()
+    with patch.object(
+        tfcli.client,
+        "stream_logs",
+        side_effect=[broken_stream(), final_stream()],
+    ) as stream_logs:
+        tfcli.do_poll(job_id)
+
+    assert "line0\nline1\nline2\n" in capsys.readouterr().out
+    # The client reconnects after the last fragment it received
+    assert [call.args[3] for call in stream_logs.call_args_list] == [0, 2]
+
+
+@patch("time.sleep")
+def test_live_polling_with_stream_server_error(
+    mock_sleep, capsys, requests_mock
+):
+    """Test a server error doesn't stop the output from being streamed."""
+    job_id = str(uuid.uuid1())
+    requests_mock.get(
+        f"{URL}/v1/job/{job_id}",
+        json={"job_state": "running", "timeout": 3600},
+    )
+    requests_mock.get(
+        f"{URL}/v1/result/{job_id}/state",
+        json={"job_state": "running"},
+    )
+    requests_mock.get(
+        f"{URL}/v1/result/{job_id}/log/output/stream",
+        [
+            {
+                "status_code": HTTPStatus.SERVICE_UNAVAILABLE,
+                "json": {"message": "Service Unavailable"},
+            },
+            {
+                "text": (
+                    "event: log\n"
+                    "id: 0\n"
+                    'data: {"phase": "test", "fragment_number": 0, '
+                    '"log_data": "first\\n"}\n\n'
+                    "event: state\n"
+                    'data: {"test_status": 0, "job_state": "complete"}\n\n'
+                )
+            },
+        ],
+    )
+
+    sys.argv = ["", "poll", job_id]
+    tfcli = testflinger_cli.TestflingerCli()
+    tfcli.do_poll(job_id)
+
+    assert "first\n" in capsys.readouterr().out
+    # The output isn't polled for after the error
+    assert not any(
+        request.path.endswith("/log/output")
+        for request in requests_mock.request_history
+    )
+    mock_sleep.assert_called_once_with(10)
+
+
+def test_live_polling_with_stream_start_timestamp(capsys, requests_mock):
+    """Test the start timestamp is applied to streamed output."""
+    job_id = str(uuid.uuid1())
+    requests_mock.get(
+        f"{URL}/v1/job/{job_id}",
+        json={"job_state": "running", "timeout": 3600},
+    )
+    requests_mock.get(
+        f"{URL}/v1/result/{job_id}/state",
+        json={"job_state": "running"},
+    )
+    stream = requests_mock.get(
+        f"{URL}/v1/result/{job_id}/log/output/stream",
+        text=(
+            "event: log\n"
+            "id: 1\n"
+            'data: {"phase": "test", "fragment_number": 1, '
+            '"log_data": "second\\n"}\n\n'
+            "event: state\n"
+            'data: {"test_status": 0, "job_state": "complete"}\n\n'
+        ),
+    )
+
+    start_timestamp = "2025-04-24T10:01:00+00:00"
+    sys.argv = ["", "poll", "--start_timestamp", start_timestamp, job_id]
+    tfcli = testflinger_cli.TestflingerCli()
+    tfcli.do_poll(job_id)
+
+    assert "second\n" in capsys.readouterr().out
+    query = urllib.parse.parse_qs(
+        urllib.parse.urlparse(stream.last_request.url).query
+    )
+    assert query["start_timestamp"] == [start_timestamp]
+
+
 def test_get_job_state_network_error(requests_mock):
     """Test get_job_state returns dict on network errors."""
     jobid = str(uuid.uuid1())
     requests_mock.get(
-        f"{URL}/v1/result/{jobid}", exc=requests.exceptions.ConnectionError
+        f"{URL}/v1/result/{jobid}/state",
+        exc=requests.exceptions.ConnectionError,
     )
     sys.argv = ["", "status", jobid]
     tfcli = testflinger_cli.TestflingerCli()
@@ -2377,6 +2669,12 @@ def test_poll_exponential_backoff_on_network_errors(
 ):
     """Test that polling uses exponential backoff on network errors."""
     job_id = str(uuid.uuid1())
+    # Older servers don't support streaming logs
+    requests_mock.get(
+        f"{URL}/v1/result/{job_id}/log/output/stream",
+        status_code=HTTPStatus.NOT_FOUND,
+        json={"message": "Not Found"},
+    )
 
     # Mock job detail (show_job)
     requests_mock.get(
@@ -2386,7 +2684,7 @@ def test_poll_exponential_backoff_on_network_errors(
 
     # Mock both endpoints to fail 5 times then succeed
     requests_mock.get(
-        f"{URL}/v1/result/{job_id}",
+        f"{URL}/v1/result/{job_id}/state",
         [{"exc": requests.exceptions.ConnectionError}] * 5
         + [{"json": {"job_state": "complete"}}],
     )
@@ -2719,3 +3017,27 @@ def test_jobs_no_trailing_blank_line(capsys):
     )
     # The last meaningful line should contain the most recently submitted job.
     assert job_ids[1] in lines[-2]
+
+
+def test_jobs_limit_page(capsys):
+    """Test that `jobs` lists one page of the most recent jobs."""
+    job_ids = [str(uuid.uuid1()) for _ in range(5)]
+    submission_time = time.time()
+    history_data = {
+        job_id: {
+            "submission_time": submission_time + index,
+            "queue": "queue-a",
+            "job_state": "complete",
+        }
+        for index, job_id in enumerate(job_ids)
+    }
+
+    sys.argv = ["", "jobs", "--limit", "2", "--page", "2"]
+    tfcli = testflinger_cli.TestflingerCli()
+    tfcli.history.history = history_data
+
+    tfcli.jobs()
+
+    captured = capsys.readouterr()
+    listed = [job_id for job_id in job_ids if job_id in captured.out]
+    assert listed == job_ids[1:3]
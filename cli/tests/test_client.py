@@ -16,6 +16,7 @@
 
 """Unit tests for the Client class."""
 
+import io
 import logging
 import urllib.parse
 from datetime import datetime, timezone
@@ -282,6 +283,109 @@ def test_get_logs_error_handling(requests_mock, client):
         client.get_logs(job_id, LogType.STANDARD_OUTPUT, None, 0, None)
 
 
+def test_stream_logs(requests_mock, client):
+    """Test stream_logs parses log, state and keepalive events."""
+    job_id = "test-job-stream"
+    stream = (
+        "event: log\n"
+        "id: 3\n"
+        'data: {"phase": "test", "fragment_number": 3, "log_data": "hi"}\n'
+        "\n"
+        ": keepalive\n"
+        "\n"
+        "event: state\n"
+        'data: {"test_status": 0, "job_state": "complete"}\n'
+        "\n"
+    )
+    requests_mock.get(
+        f"{URL}/v1/result/{job_id}/log/output/stream?start_fragment=3",
+        text=stream,
+    )
+
+    events = list(client.stream_logs(job_id, LogType.STANDARD_OUTPUT, None, 3))
+
+    assert events[0] == (
+        "log",
+        {"phase": "test", "fragment_number": 3, "log_data": "hi"},
+    )
+    assert events[1] == ("keepalive", None)
+    assert events[2][0] == "state"
+    assert events[2][1]["test"] == 0
+    assert events[2][1]["job_state"] == "complete"
+
+
+def test_stream_logs_not_supported(requests_mock, client):
+    """Test stream_logs raises HTTPError for servers without streaming."""
+    job_id = "test-job-stream"
+    requests_mock.get(
+        f"{URL}/v1/result/{job_id}/log/serial/stream?start_fragment=0",
+        status_code=HTTPStatus.NOT_FOUND,
+        json={"message": "Not Found"},
+    )
+
+    with pytest.raises(HTTPError) as exc_info:
+        list(client.stream_logs(job_id, LogType.SERIAL_OUTPUT, None, 0))
+    assert exc_info.value.status == HTTPStatus.NOT_FOUND
+
+
+def test_get_artifact_resumed(requests_mock, client, tmp_path):
+    """Test an interrupted artifact download is resumed."""
+
+    class InterruptedStream(io.BytesIO):
+        """Stream that fails instead of ending."""
+
+        def read(self, *args, **kwargs):
+            data = super().read(*args, **kwargs)
+            if not data:
+                raise ConnectionResetError("Connection lost")
+            return data
+
+    job_id = "test-job-artifact"
+    requests_mock.get(
+        f"{URL}/v1/result/{job_id}/artifact",
+        [
+            {"body": InterruptedStream(b"hello"), "headers": {"ETag": '"a"'}},
+            {"content": b" world", "status_code": HTTPStatus.PARTIAL_CONTENT},
+        ],
+    )
+    path = tmp_path / "artifacts.tgz"
+    client.get_artifact(job_id, path)
+
+    assert path.read_bytes() == b"hello world"
+    assert requests_mock.last_request.headers["Range"] == "bytes=5-"
+    assert requests_mock.last_request.headers["If-Range"] == '"a"'
+
+
+def test_put_file_multipart_fallback(requests_mock, client, tmp_path):
+    """Test files are sent as form data to servers that reject streams."""
+    path = tmp_path / "attachments.tar.gz"
+    path.write_bytes(b"archive")
+    uri = f"{URL}/v1/job/job-id/attachments"
+    requests_mock.post(
+        uri,
+        [
+            {"status_code": HTTPStatus.BAD_REQUEST},
+            {"status_code": HTTPStatus.OK},
+            {"status_code": HTTPStatus.OK},
+        ],
+    )
+    client.put_file("/v1/job/job-id/attachments", path, timeout=10)
+    client.put_file("/v1/job/job-id/attachments", path, timeout=10)
+
+    content_types = [
+        request.headers["Content-Type"].split(";")[0]
+        for request in requests_mock.request_history
+        if request.url == uri
+    ]
+    # streams are only tried once
+    assert content_types == [
+        "application/octet-stream",
+        "multipart/form-data",
+        "multipart/form-data",
+    ]
+    assert b"archive" in requests_mock.last_request.body
+
+
 def test_token_refresh_hook_does_not_retry_twice(client):
     """Test access token refresh hook does not retry if already retried."""
     mock_response = MagicMock()
@@ -15,10 +15,12 @@
 """Unit tests for StatusLine."""
 
 import threading
+from http import HTTPStatus
 from unittest import mock
 
 from freezegun import freeze_time
 
+from testflinger_cli.client import HTTPError
 from testflinger_cli.status_line import StatusLine
 
 
@@ -369,6 +371,10 @@ class TestStatusLineReservedState:
             }
         )
         cli.client.get_job_position = mock.Mock(return_value=0)
+        # Older servers don't support streaming logs
+        cli.client.stream_logs = mock.Mock(
+            side_effect=HTTPError(HTTPStatus.NOT_FOUND)
+        )
 
         # Mock log output (no logs)
         mock_get_logs.return_value = (-1, "")
@@ -17,6 +17,7 @@
 from uuid import uuid4
 
 import pytest
+import requests
 
 from testflinger_device_connectors.devices.multi.multi import Multi
 from testflinger_device_connectors.devices.multi.tfclient import TFClient
@@ -98,3 +99,18 @@ def test_this_job_completed():
     incomplete_client.get_status = lambda job_id: "something else"
     test_agent = Multi(test_config, job_data, incomplete_client)
     assert test_agent.this_job_completed() is False
+
+
+def test_get_status_fallback(monkeypatch):
+    """Test that get_status falls back to the results endpoint."""
+
+    def fake_get(uri_frag, timeout=15):
+        if uri_frag.endswith("/state"):
+            response = requests.Response()
+            response.status_code = 404
+            raise requests.exceptions.HTTPError(response=response)
+        return '{"job_state": "complete"}'
+
+    client = TFClient("http://127.0.0.1:8000")
+    monkeypatch.setattr(client, "get", fake_get)
+    assert client.get_status(str(uuid4())) == "complete"
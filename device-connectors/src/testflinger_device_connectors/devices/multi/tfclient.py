@@ -109,8 +109,15 @@ class TFClient:
             cancelled, complete)
         """
         try:
-            endpoint = f"/v1/result/{job_id}"
-            data = json.loads(self.get(endpoint))
+            try:
+                endpoint = f"/v1/result/{job_id}/state"
+                data = json.loads(self.get(endpoint))
+            except requests.exceptions.HTTPError as exc:
+                if exc.response.status_code != 404:
+                    raise
+                # Older servers don't provide the lightweight state endpoint
+                endpoint = f"/v1/result/{job_id}"
+                data = json.loads(self.get(endpoint))
             state = data.get("job_state")
         except OSError:
             logger.error("Unable to get status for job %s", job_id)
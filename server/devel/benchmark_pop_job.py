@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# Copyright (C) 2026 Canonical
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+r"""
+Benchmark dispatching jobs from a deep queue with database.pop_job.
+
+The jobs collection of the target database is dropped and filled with
+waiting jobs, most of which exclude a large number of agents, before
+popping jobs from it as a single agent. The query plan used for dispatch
+is printed as well, so you can check that the dispatch index is used and
+no in-memory SORT stage is needed.
+
+Only point this at a scratch database, e.g. the one from docker-compose:
+
+    python devel/benchmark_pop_job.py --mongodb-uri \
+        mongodb://localhost:27017/testflinger_benchmark
+"""
+
+import logging
+import random
+import statistics
+import time
+import uuid
+from argparse import ArgumentParser, Namespace
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask
+
+from testflinger import database
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+QUEUE = "benchmark"
+AGENT = "benchmark-agent"
+
+
+def get_args() -> Namespace:
+    """Parse command line arguments.
+
+    :return: Namespace containing parsed arguments
+    """
+    parser = ArgumentParser(description="Benchmark database.pop_job")
+    parser.add_argument(
+        "--mongodb-uri",
+        default="mongodb://localhost:27017/testflinger_benchmark",
+        help="URI of the scratch database to use (it will be overwritten)",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=50000, help="Jobs in the queue"
+    )
+    parser.add_argument(
+        "-e",
+        "--exclude-agents",
+        type=int,
+        default=200,
+        help="Number of agents excluded by each job",
+    )
+    parser.add_argument(
+        "-x",
+        "--excluded-ratio",
+        type=float,
+        default=0.9,
+        help="Fraction of jobs that exclude the benchmarking agent",
+    )
+    parser.add_argument(
+        "-p", "--pops", type=int, default=200, help="Number of jobs to pop"
+    )
+    return parser.parse_args()
+
+
+def seed_jobs(num_jobs: int, num_excluded: int, excluded_ratio: float):
+    """Replace the jobs collection with waiting jobs on the queue."""
+    database.mongo.db.jobs.drop()
+    database.create_indexes()
+
+    excluded = [f"agent-{i}" for i in range(num_excluded)]
+    now = datetime.now(timezone.utc)
+    batch = []
+    for i in range(num_jobs):
+        exclude_agents = list(excluded)
+        if random.random() < excluded_ratio:  # noqa: S311
+            exclude_agents.append(AGENT)
+        batch.append(
+            {
+                "job_id": str(uuid.uuid4()),
+                "created_at": now - timedelta(seconds=num_jobs - i),
+                "job_priority": random.choice((0, 0, 0, 10, 100)),  # noqa: S311
+                "job_data": {
+                    "job_queue": QUEUE,
+                    "exclude_agents": exclude_agents,
+                },
+                "result_data": {"job_state": "waiting"},
+            }
+        )
+        if len(batch) == 1000:
+            database.mongo.db.jobs.insert_many(batch)
+            batch = []
+    if batch:
+        database.mongo.db.jobs.insert_many(batch)
+
+
+def show_query_plan():
+    """Log the winning plan for the dispatch query."""
+    plan = (
+        database.mongo.db.jobs.find(
+            {
+                "result_data.job_state": "waiting",
+                "job_data.job_queue": {"$in": [QUEUE]},
+                "job_data.exclude_agents": {"$nin": [AGENT]},
+            }
+        )
+        .sort(database.JOB_DISPATCH_SORT)
+        .limit(1)
+        .explain()
+    )
+    stages = []
+    stage = plan["queryPlanner"]["winningPlan"]
+    while stage:
+        stages.append(stage.get("stage"))
+        stage = stage.get("inputStage")
+    logger.info("Winning plan: %s", " <- ".join(stages))
+
+
+def benchmark_pops(num_pops: int):
+    """Pop jobs as a single agent and log the latency distribution."""
+    timings = []
+    for _ in range(num_pops):
+        start = time.perf_counter()
+        job = database.pop_job([QUEUE], AGENT)
+        timings.append((time.perf_counter() - start) * 1000)
+        if job is None:
+            break
+    timings.sort()
+    logger.info(
+        "pop_job over %d calls: mean %.2fms, p50 %.2fms, p95 %.2fms, "
+        "max %.2fms",
+        len(timings),
+        statistics.mean(timings),
+        timings[len(timings) // 2],
+        timings[int(len(timings) * 0.95)],
+        timings[-1],
+    )
+
+
+def main():
+    """Seed the scratch database and benchmark pop_job against it."""
+    args = get_args()
+    app = Flask(__name__)
+    database.mongo.init_app(app, uri=args.mongodb_uri)
+    with app.app_context():
+        logger.info(
+            "Seeding %d jobs excluding %d agents each",
+            args.jobs,
+            args.exclude_agents,
+        )
+        seed_jobs(args.jobs, args.exclude_agents, args.excluded_ratio)
+        show_query_plan()
+        benchmark_pops(args.pops)
+
+
+if __name__ == "__main__":
+    main()
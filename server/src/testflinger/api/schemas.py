@@ -20,7 +20,7 @@ from apiflask.validators import Length, OneOf, Regexp
 from marshmallow import INCLUDE, ValidationError, validates_schema
 from marshmallow_oneofschema import OneOfSchema
 from testflinger_common.duration import DurationParseError, parse_duration
-from testflinger_common.enums import ServerRoles, TestPhase
+from testflinger_common.enums import LogType, ServerRoles, TestPhase
 
 ValidJobStates = (
     "setup",
@@ -37,6 +37,7 @@ ValidJobStates = (
 )
 
 TestPhases = [phase.value for phase in TestPhase]
+LogTypes = [log_type.value for log_type in LogType]
 
 
 class ProvisionLogsIn(Schema):
@@ -429,6 +430,23 @@ class JobSearchRequest(Schema):
         fields.String(validate=OneOf(ValidJobStates)),
         metadata={"description": "List of job states to include"},
     )
+    limit = fields.Integer(
+        load_default=100,
+        validate=validators.Range(min=1, max=1000),
+        metadata={"description": "Maximum number of jobs to return"},
+    )
+    after = fields.String(
+        metadata={"description": "Cursor to return the next (older) jobs"},
+    )
+    before = fields.String(
+        metadata={"description": "Cursor to return the previous (newer) jobs"},
+    )
+    start = fields.DateTime(
+        metadata={"description": "Only include jobs created from this time"},
+    )
+    stop = fields.DateTime(
+        metadata={"description": "Only include jobs created before this time"},
+    )
 
 
 class JobSearchResponse(Schema):
@@ -466,6 +484,20 @@ class ResultGet(Schema):
     job_state = fields.String(required=False)
 
 
+class ResultState(Schema):
+    """Result State schema."""
+
+    setup_status = fields.Integer(required=False)
+    provision_status = fields.Integer(required=False)
+    firmware_update_status = fields.Integer(required=False)
+    test_status = fields.Integer(required=False)
+    allocate_status = fields.Integer(required=False)
+    reserve_status = fields.Integer(required=False)
+    cleanup_status = fields.Integer(required=False)
+
+    job_state = fields.String(required=False)
+
+
 class ResultPost(Schema):
     """Result Post schema."""
 
@@ -493,6 +525,7 @@ class StatusUpdate(Schema):
     job_queue = fields.String(required=False)
     job_status_webhook = fields.URL(required=True)
     events = fields.List(fields.Nested(JobEvent), required=False)
+    sequence = fields.Integer(required=False, validate=validators.Range(min=0))
 
 
 class RestrictedQueueIn(Schema):
@@ -517,6 +550,22 @@ class LogPost(Schema):
     log_data = fields.String(required=True)
 
 
+class LogBatchFragment(LogPost):
+    """Schema for a log fragment in a batch POST of log fragments."""
+
+    log_type = fields.String(required=True, validate=OneOf(LogTypes))
+
+
+class LogBatchPost(Schema):
+    """Schema for batch POST of log fragments."""
+
+    fragments = fields.List(
+        fields.Nested(LogBatchFragment),
+        required=True,
+        validate=Length(min=1),
+    )
+
+
 class LogGetItem(Schema):
     """Schema for GET of logs for a single phase."""
 
@@ -558,6 +607,15 @@ job_empty = {
     }
 }
 
+log_stream_out = {
+    200: {
+        "description": (
+            "Server-Sent Events stream of log fragments and job state changes"
+        ),
+        "content": {"text/event-stream": {"schema": {"type": "string"}}},
+    }
+}
+
 queues_out = {
     200: {
         "description": "Mapping of queue names and descriptions",
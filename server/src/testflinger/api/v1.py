@@ -16,26 +16,37 @@
 """Testflinger v1 API."""
 
 import importlib.metadata
+import json
 import os
+import time
 import uuid
 from datetime import datetime, timezone
 from http import HTTPStatus
 from urllib.parse import urlparse
 
-import requests
 from apiflask import APIBlueprint, abort
-from flask import current_app, g, jsonify, request, send_file
+from flask import (
+    Response,
+    current_app,
+    g,
+    jsonify,
+    make_response,
+    request,
+    send_file,
+    stream_with_context,
+    url_for,
+)
 from marshmallow import ValidationError
 from prometheus_client import Counter
-from requests.adapters import HTTPAdapter
+from testflinger_common.duration import DurationParseError, parse_duration
 from testflinger_common.enums import LogType, ServerRoles, TestPhase
-from urllib3.util.retry import Retry
 from werkzeug.routing import BaseConverter
 
 from testflinger import database
 from testflinger.api import auth, helpers, schemas
 from testflinger.api.auth import authenticate, require_role
 from testflinger.logs import LogFragment, MongoLogHandler
+from testflinger.notifier import job_notifier, result_notifier
 from testflinger.owasp import OWASPLogger
 from testflinger.secrets.exceptions import (
     AccessError,
@@ -43,9 +54,28 @@ from testflinger.secrets.exceptions import (
     UnexpectedError,
 )
 from testflinger.secrets.store import DEFAULT_SECRET_EXPIRATION
+from testflinger.webhooks import webhook_dispatcher
 
 TESTFLINGER_ADMIN_ID = "testflinger-admin"
 
+# Long-polling for jobs: maximum time a request can be held and how often
+# the database is re-checked while waiting (in seconds)
+JOB_WAIT_MAX = 60
+# Jobs submitted through other workers don't notify waiting requests, so
+# the database is re-checked after this many seconds, backing off up to
+# JOB_WAIT_RECHECK_MAX to limit the load from idle agents
+JOB_WAIT_RECHECK = 4
+JOB_WAIT_RECHECK_MAX = 30
+JOB_WAIT_HEADER = "X-Testflinger-Job-Wait"
+
+# Log streaming: maximum lifetime of a stream before the client has to
+# reconnect, and how often the database is re-checked while waiting for
+# new output (in seconds). The re-checks back off up to
+# LOG_STREAM_RECHECK_MAX while the job is quiet, like those of JOB_WAIT
+LOG_STREAM_MAX = 300
+LOG_STREAM_RECHECK = 2
+LOG_STREAM_RECHECK_MAX = 30
+
 jobs_metric = Counter(
     "jobs", "Number of jobs", ["queue"], namespace="testflinger"
 )
@@ -55,6 +85,19 @@ reservations_metric = Counter(
     ["queue"],
     namespace="testflinger",
 )
+# Upload throughput is the rate of bytes divided by the rate of seconds
+upload_bytes_metric = Counter(
+    "upload_bytes",
+    "Number of bytes uploaded",
+    ["kind"],
+    namespace="testflinger",
+)
+upload_seconds_metric = Counter(
+    "upload_seconds",
+    "Time spent receiving and storing uploads",
+    ["kind"],
+    namespace="testflinger",
+)
 
 
 v1 = APIBlueprint("v1", __name__)
@@ -140,6 +183,8 @@ def job_post(json_data: dict) -> dict:
     # CAUTION! If you ever move this line, you may need to pass data as a copy
     # because it will get modified by submit_job and other things it calls
     database.add_job(job)
+    if "attachments_status" not in job["job_data"]:
+        job_notifier.notify(job_queue)
     return jsonify(job_id=job.get("job_id"))
 
 
@@ -164,11 +209,10 @@ def validate_secrets(data: dict):
     # check that all secrets paths correspond to stored secrets
     # (i.e. a job containing secrets cannot be submitted unless all its secrets
     # are accessible.)
-    inaccessible_paths = [
-        secret_path
-        for secret_path in secrets.values()
-        if not current_app.secrets_store.exists(client_id, secret_path)
-    ]
+    accessible_paths = current_app.secrets_store.exists_many(
+        client_id, secrets.values()
+    )
+    inaccessible_paths = set(secrets.values()) - accessible_paths
     if inaccessible_paths:
         abort(
             HTTPStatus.UNPROCESSABLE_ENTITY,
@@ -239,6 +283,12 @@ def job_get():
     ``queue`` query parameters must be supplied; the server returns the first
     available job across those queues.
 
+    If the optional ``wait`` query parameter is specified, the request is
+    held for up to that many seconds (capped at ``JOB_WAIT_MAX``) until a
+    job becomes available, instead of returning an empty response right
+    away. The ``X-Testflinger-Job-Wait`` response header advertises the
+    maximum wait supported by the server.
+
     Any secrets referenced in the job are resolved against the secrets store
     at this point. Secrets that are inaccessible (store unreachable, path not
     found, or insufficient permissions) are silently resolved to an empty
@@ -253,13 +303,33 @@ def job_get():
     agent_name = request.cookies.get("agent_name")
     if not agent_name:
         abort(HTTPStatus.UNAUTHORIZED, message="Agent not identified")
+    try:
+        wait = min(max(int(request.args.get("wait", 0)), 0), JOB_WAIT_MAX)
+    except ValueError:
+        abort(HTTPStatus.BAD_REQUEST, message="Invalid wait specified")
+
+    deadline = time.monotonic() + wait
+    recheck = JOB_WAIT_RECHECK
     job = database.pop_job(queue_list=queue_list, agent_name=agent_name)
+    while not job and (remaining := deadline - time.monotonic()) > 0:
+        # Jobs submitted through other workers won't notify us, so re-check
+        # the database periodically as well
+        job_notifier.wait(queue_list, min(remaining, recheck))
+        recheck = min(recheck * 2, JOB_WAIT_RECHECK_MAX)
+        job = database.pop_job(queue_list=queue_list, agent_name=agent_name)
     if not job:
-        return jsonify({}), HTTPStatus.NO_CONTENT
-    if (secrets := retrieve_secrets(job)) is not None:
-        job["test_data"]["secrets"] = secrets
-    job["started_at"] = datetime.now(timezone.utc)
-    return jsonify(job)
+        response = jsonify({})
+        response.status_code = HTTPStatus.NO_CONTENT
+    else:
+        if (secrets := retrieve_secrets(job)) is not None:
+            job["test_data"]["secrets"] = secrets
+        job["started_at"] = datetime.now(timezone.utc)
+        result_notifier.notify(job["job_id"])
+        response = jsonify(job)
+    # Advertise long-poll support so agents know they don't need to sleep
+    # between requests
+    response.headers[JOB_WAIT_HEADER] = str(JOB_WAIT_MAX)
+    return response
 
 
 def retrieve_secrets(data: dict) -> dict | None:
@@ -284,16 +354,18 @@ def retrieve_secrets(data: dict) -> dict | None:
     ):
         return dict.fromkeys(secrets, "")
 
-    result = {}
-    for identifier, secret_path in secrets.items():
-        try:
-            secret_value = current_app.secrets_store.read(
-                client_id, secret_path
-            )
-        except (AccessError, StoreError, UnexpectedError):
-            secret_value = ""
-        result[identifier] = secret_value
-    return result
+    # all the secrets are read at once, so that the time it takes to hand
+    # out a job doesn't grow with the number of its secrets
+    try:
+        values = current_app.secrets_store.read_many(
+            client_id, secrets.values()
+        )
+    except (AccessError, StoreError, UnexpectedError):
+        values = {}
+    return {
+        identifier: values.get(secret_path, "")
+        for identifier, secret_path in secrets.items()
+    }
 
 
 @v1.get("/job/<job_id>")
@@ -335,10 +407,29 @@ def attachment_get(job_id):
     if not check_valid_uuid(job_id):
         return "Invalid job id\n", 400
     try:
-        file = database.retrieve_file(filename=f"{job_id}.attachments")
+        file = database.retrieve_attachments(job_id)
     except FileNotFoundError:
         return "", 204
-    return send_file(file, mimetype="application/gzip")
+    return send_stored_file(file, mimetype="application/gzip")
+
+
+@v1.get("/attachments/<sha256>")
+@authenticate
+@require_role(ServerRoles.ADMIN, ServerRoles.MANAGER, ServerRoles.CONTRIBUTOR)
+def attachments_blob_get(sha256):
+    """Check if an attachments archive is already stored on the server.
+
+    An archive that is already stored can be referenced when posting the
+    attachments of a job, instead of being uploaded again. Only archives
+    uploaded by the same client are found, so the endpoint reveals nothing
+    about the attachments of other clients.
+
+    :param sha256:
+        SHA-256 digest of the attachments archive, as a hex string
+    """
+    if not database.blob_exists(database.blob_id(sha256, g.client_id)):
+        return "Attachments archive not found\n", 404
+    return "OK", 200
 
 
 @v1.post("/job/<job_id>/attachments")
@@ -347,6 +438,10 @@ def attachment_get(job_id):
 def attachments_post(job_id):
     """Post attachment bundle for a specified job_id.
 
+    The attachments archive is either uploaded as a file, or referenced by
+    the SHA-256 digest of an identical archive already uploaded by the same
+    client, as JSON: {"sha256": <digest>}.
+
     :param job_id:
         UUID as a string for the job
     """
@@ -362,14 +457,24 @@ def attachments_post(job_id):
         # attachments already submitted: successful, could be due to a retry
         return "OK", 200
 
-    # save attachments archive in the database
-    database.save_file(
-        data=request.files["file"],
-        filename=f"{job_id}.attachments",
-    )
+    if request.is_json:
+        # reference an attachments archive that is already stored
+        sha256 = (request.get_json(silent=True) or {}).get("sha256")
+        if not isinstance(sha256, str):
+            return "Missing sha256 of the attachments archive\n", 400
+        archive_id = database.blob_id(sha256, g.client_id)
+        if not database.reference_blob(archive_id):
+            return "Attachments archive not found\n", 404
+    else:
+        # save attachments archive in the database, which references it
+        archive_id = save_upload(None, "attachments")
 
     # now the job can be processed
-    database.attachments_received(job_id)
+    if job_queue := database.attachments_received(job_id, archive_id):
+        job_notifier.notify(job_queue)
+    else:
+        # attachments were received concurrently: drop this reference
+        database.release_blob(archive_id)
     return "OK", 200
 
 
@@ -397,21 +502,48 @@ def search_jobs(query_data):
     elif states:
         query["result_data.job_state"] = {"$in": states}
 
-    pipeline = [
-        {"$match": query},
-        {
-            "$project": {
+    try:
+        jobs, newer, older = database.get_jobs_page(
+            query,
+            query_data["limit"],
+            after=query_data.get("after"),
+            before=query_data.get("before"),
+            start_datetime=query_data.get("start"),
+            stop_datetime=query_data.get("stop"),
+            projection={
                 "job_id": True,
                 "created_at": True,
-                "job_state": "$result_data.job_state",
+                "result_data.job_state": True,
                 "_id": False,
             },
-        },
-    ]
-
-    jobs = database.mongo.db.jobs.aggregate(pipeline)
+        )
+    except ValueError as exc:
+        abort(HTTPStatus.UNPROCESSABLE_ENTITY, message=str(exc))
 
-    return jsonify(list(jobs))
+    response = jsonify(
+        [
+            {
+                "job_id": job["job_id"],
+                "created_at": job["created_at"],
+                "job_state": job.get("result_data", {}).get("job_state"),
+            }
+            for job in jobs
+        ]
+    )
+    # Cursors for the adjacent pages are returned as web links (RFC 8288)
+    search_args = request.args.to_dict(flat=False)
+    search_args.pop("after", None)
+    search_args.pop("before", None)
+    links = []
+    if newer is not None:
+        url = url_for(request.endpoint, **search_args, before=newer)
+        links.append(f'<{url}>; rel="prev"')
+    if older is not None:
+        url = url_for(request.endpoint, **search_args, after=older)
+        links.append(f'<{url}>; rel="next"')
+    if links:
+        response.headers["Link"] = ", ".join(links)
+    return response
 
 
 @v1.post("/result/<job_id>/artifact")
@@ -425,13 +557,40 @@ def artifacts_post(job_id):
     """
     if not check_valid_uuid(job_id):
         return "Invalid job id\n", 400
-    database.save_file(
-        data=request.files["file"],
-        filename=f"{job_id}.artifact",
-    )
+    save_upload(f"{job_id}.artifact", "artifact")
     return "OK"
 
 
+def save_upload(filename: str | None, kind: str) -> dict | None:
+    """Store the file uploaded with the current request.
+
+    Files can be uploaded as multipart form data in a "file" field, or
+    streamed as an application/octet-stream request body, which is stored
+    as it arrives instead of being spooled to a temporary file first.
+
+    :param filename:
+        The name to store the file with, or None to store it by its
+        SHA-256 digest, as an attachments archive that can be shared by
+        the jobs of the current client and that the caller holds a
+        reference to.
+    :param kind: The kind of upload, used to label the upload metrics.
+    :return: The identifier of the archive, if stored by its digest.
+    """
+    start = time.monotonic()
+    if request.mimetype == "application/octet-stream":
+        data = request.stream
+    else:
+        data = request.files["file"]
+    archive_id = None
+    if filename is None:
+        archive_id, length = database.save_blob(data, g.client_id)
+    else:
+        length = database.save_file(data=data, filename=filename)
+    upload_bytes_metric.labels(kind).inc(length)
+    upload_seconds_metric.labels(kind).inc(time.monotonic() - start)
+    return archive_id
+
+
 @v1.get("/result/<job_id>/artifact")
 @authenticate
 @require_role(ServerRoles.ADMIN, ServerRoles.MANAGER, ServerRoles.CONTRIBUTOR)
@@ -451,7 +610,27 @@ def artifacts_get(job_id):
         file = database.retrieve_file(filename=f"{job_id}.artifact")
     except FileNotFoundError:
         return "", 204
-    return send_file(file, download_name="artifact.tar.gz")
+    return send_stored_file(file, download_name="artifact.tar.gz")
+
+
+def send_stored_file(file, **kwargs) -> Response:
+    """Send a file stored in GridFS, supporting resumable downloads.
+
+    Range requests are answered with just the requested bytes, and the ETag
+    is the ID of the stored file, which never changes, so clients can use
+    If-Range to resume an interrupted download.
+
+    :param file: The GridFS file to send.
+    :param kwargs: Additional arguments for `send_file`.
+    :return: The response, which is partial for range requests.
+    """
+    response = send_file(file, conditional=False, etag=False, **kwargs)
+    response.content_length = file.length
+    response.last_modified = file.upload_date
+    response.set_etag(str(file._id))
+    return response.make_conditional(
+        request, accept_ranges=True, complete_length=file.length
+    )
 
 
 class LogTypeConverter(BaseConverter):
@@ -527,6 +706,116 @@ def log_get(job_id: str, log_type: LogType):
     }
 
 
+@v1.get("/result/<job_id>/log/<log_type:log_type>/stream")
+@authenticate
+@require_role(ServerRoles.ADMIN, ServerRoles.MANAGER, ServerRoles.CONTRIBUTOR)
+@v1.doc(responses=schemas.log_stream_out)
+def log_stream_get(job_id: str, log_type: LogType):
+    """Stream logs and job state changes for a specified job_id.
+
+    The response is a ``text/event-stream`` (Server-Sent Events) that pushes
+    log fragments as soon as they are stored, instead of having clients poll
+    ``GET /v1/result/<job_id>/log/<log_type>`` repeatedly:
+
+    - ``log`` events contain a JSON object with the ``phase``,
+      ``fragment_number`` and ``log_data`` of a fragment. The event ID is
+      the fragment number.
+    - ``state`` events contain the same JSON object as
+      ``GET /v1/result/<job_id>/state`` whenever the job state or a phase
+      exit code changes.
+
+    The stream ends once the job is complete or cancelled, or after
+    ``LOG_STREAM_MAX`` seconds, in which case the client should reconnect.
+    Streaming resumes after the fragment in the ``Last-Event-ID`` header if
+    present, otherwise it starts from the ``start_fragment`` query parameter.
+    The optional ``phase`` and ``start_timestamp`` query parameters restrict
+    the stream to a single test phase and to the fragments created from
+    that time.
+
+    :param job_id: UUID as a string for the job
+    :param log_type: LogType enum value for the type of log requested
+    :raises HTTPError: If the job_id is not a valid UUID or if invalid query
+    """
+    if not check_valid_uuid(job_id):
+        abort(HTTPStatus.BAD_REQUEST, message="Invalid job id\n")
+    query_schema = schemas.LogQueryParams()
+    try:
+        query_params = query_schema.load(request.args)
+    except ValidationError as err:
+        abort(HTTPStatus.BAD_REQUEST, message=err.messages)
+    start_fragment = query_params.get("start_fragment", 0)
+    if last_event_id := request.headers.get("Last-Event-ID"):
+        try:
+            start_fragment = int(last_event_id) + 1
+        except ValueError:
+            abort(HTTPStatus.BAD_REQUEST, message="Invalid Last-Event-ID")
+    phase = query_params.get("phase")
+    start_timestamp = query_params.get("start_timestamp")
+    if not database.job_exists(job_id):
+        abort(HTTPStatus.NOT_FOUND, message="Job not found")
+
+    def generate_events():
+        log_handler = MongoLogHandler(database.mongo)
+        next_fragment = start_fragment
+        last_state = None
+        deadline = time.monotonic() + LOG_STREAM_MAX
+        recheck = LOG_STREAM_RECHECK
+
+        def log_events():
+            nonlocal next_fragment
+            fragments = log_handler.retrieve_log_fragments(
+                job_id, log_type, phase, next_fragment, start_timestamp
+            )
+            for fragment in fragments:
+                data = {
+                    "phase": fragment.phase,
+                    "fragment_number": fragment.fragment_number,
+                    "log_data": fragment.log_data,
+                }
+                yield (
+                    f"event: log\nid: {fragment.fragment_number}\n"
+                    f"data: {json.dumps(data)}\n\n"
+                )
+                next_fragment = fragment.fragment_number + 1
+
+        while True:
+            previous_fragment = next_fragment
+            yield from log_events()
+            if next_fragment != previous_fragment:
+                recheck = LOG_STREAM_RECHECK
+
+            result_state = get_result_state(job_id)
+            if result_state != last_state:
+                last_state = result_state
+                recheck = LOG_STREAM_RECHECK
+                yield f"event: state\ndata: {json.dumps(result_state)}\n\n"
+            if (result_state or {}).get("job_state") in (
+                "cancelled",
+                "complete",
+                "completed",
+            ):
+                # Send the fragments posted between reading the logs and
+                # the job state, since the stream ends here
+                yield from log_events()
+                return
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            # Updates posted through other workers won't notify us, so
+            # re-check the database periodically as well
+            if not result_notifier.wait([job_id], min(remaining, recheck)):
+                # Keep idle connections from being closed by proxies
+                yield ": keepalive\n\n"
+                recheck = min(recheck * 2, LOG_STREAM_RECHECK_MAX)
+
+    return Response(
+        stream_with_context(generate_events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @v1.post("/result/<job_id>/log/<log_type:log_type>")
 @authenticate
 @require_role(ServerRoles.AGENT)
@@ -560,6 +849,43 @@ def log_post(job_id: str, log_type: LogType, json_data: dict) -> str:
     )
     log_handler = MongoLogHandler(database.mongo)
     log_handler.store_log_fragment(log_fragment)
+    result_notifier.notify(job_id)
+    return "OK"
+
+
+@v1.post("/result/<job_id>/log")
+@authenticate
+@require_role(ServerRoles.AGENT)
+@v1.input(schemas.LogBatchPost, location="json")
+def log_batch_post(job_id: str, json_data: dict) -> str:
+    """Post a batch of logs for a specified job ID.
+
+    This stores several log fragments with a single request, instead of
+    posting each of them to ``/v1/result/<job_id>/log/<log_type>``.  The
+    ``fragments`` list is stored in order, and each fragment has the same
+    fields as a single fragment plus its ``log_type``, so a batch can
+    contain fragments for multiple phases and log types.
+
+    :param job_id: UUID as a string for the job
+    :raises HTTPError: If the job_id is not a valid UUID
+    :param json_data: Dictionary with the list of log fragments
+    """
+    if not check_valid_uuid(job_id):
+        abort(HTTPStatus.BAD_REQUEST, message="Invalid job_id specified")
+    log_fragments = [
+        LogFragment(
+            job_id,
+            LogType(fragment["log_type"]),
+            fragment["phase"],
+            fragment["fragment_number"],
+            fragment["timestamp"],
+            fragment["log_data"],
+        )
+        for fragment in json_data["fragments"]
+    ]
+    log_handler = MongoLogHandler(database.mongo)
+    log_handler.store_log_fragments(log_fragments)
+    result_notifier.notify(job_id)
     return "OK"
 
 
@@ -582,8 +908,22 @@ def result_post(job_id: str, json_data: dict) -> str:
     if content_length and content_length >= 16 * 1024 * 1024:
         abort(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, message="Payload too large")
 
+    job_complete = json_data.get("job_state") == "complete"
     database.add_job_results(job_id, json_data)
-    return "OK"
+    response = make_response("OK")
+    if job_complete:
+        database.release_job_blob(job_id)
+        log_handler = MongoLogHandler(database.mongo)
+
+        def clean_up_job():
+            # No more logs are expected, so merge them for faster retrieval
+            log_handler.compact_logs(job_id)
+            database.remove_unused_blobs()
+
+        # Clean up once the response is sent so the agent doesn't wait
+        response.call_on_close(clean_up_job)
+    result_notifier.notify(job_id)
+    return response
 
 
 @v1.get("/result/<job_id>")
@@ -618,6 +958,53 @@ def result_get(job_id: str):
     return log_handler.format_logs_as_results(job_id, result_data)
 
 
+@v1.get("/result/<job_id>/state")
+@authenticate
+@require_role(*ServerRoles)
+@v1.output(schemas.ResultState)
+def result_state_get(job_id: str):
+    """Return the job state and phase exit codes for a specified job_id.
+
+    This is a lightweight alternative to ``GET /v1/result/<job_id>`` for
+    clients that only need to track the progress of a job, as it does not
+    reconstruct any of the stored logs:
+
+    - ``job_state``: current state of the job
+    - ``{phase}_status``: exit code for each phase that has completed
+
+    :param job_id: UUID as a string for the job
+    :raises HTTPError: If the job_id is not a valid UUID
+    """
+    if not check_valid_uuid(job_id):
+        abort(HTTPStatus.BAD_REQUEST, message="Invalid job_id specified")
+
+    result_state = get_result_state(job_id)
+    if result_state is None:
+        return "", HTTPStatus.NO_CONTENT
+    return result_state
+
+
+def get_result_state(job_id: str) -> dict | None:
+    """Return the job state and phase exit codes for a specified job_id.
+
+    :param job_id: UUID as a string for the job
+    :return: Dictionary with the job state, or None if there are no results
+    """
+    response = database.get_job_state(job_id)
+
+    if not response or not (result_data := response.get("result_data")):
+        return None
+
+    phase_status = result_data.get("status", {})
+    result_state = {
+        f"{phase}_status": status
+        for phase in TestPhase
+        if (status := phase_status.get(phase)) is not None
+    }
+    result_state["job_state"] = result_data.get("job_state")
+    return result_state
+
+
 @v1.post("/job/<job_id>/action")
 @authenticate
 @require_role(ServerRoles.ADMIN, ServerRoles.MANAGER, ServerRoles.CONTRIBUTOR)
@@ -861,6 +1248,9 @@ def agents_status_post(job_id, json_data):
     """Post status updates from the agent to the server to be forwarded
     to the server-configured webhook url.
 
+    Updates are queued in an outbox and delivered by a background
+    dispatcher, which retries failed deliveries with backoff.
+
     The json sent to this endpoint may contain data such as the following:
     {
         "agent_id": "<string>",
@@ -873,9 +1263,17 @@ def agents_status_post(job_id, json_data):
             "detail": "<string>"
         },
         ...
-        ]
+        ],
+        "sequence": <integer>
     }
 
+    The events are accumulated by the server, so agents only need to send
+    the new events, with the number of the first of them among all the
+    events of the job as "sequence". Without it, the events are taken to be
+    all the events of the job. If the server is missing events before the
+    first one sent, the request fails with 409 and the agent should send
+    all the events again.
+
     :param job_id: UUID as a string for the job
     :param json_data: JSON data containing the status updates and webhook URL
     """
@@ -911,45 +1309,15 @@ def agents_status_post(job_id, json_data):
             message="Invalid job_status_webhook URL specified",
         )
 
-    # Attempt to get optional authentication header from server configuration
-    auth_headers = {}
-    if webhook_auth := os.environ.get("WEBHOOK_AUTH"):
-        auth_headers = {"Authorization": f"Bearer {webhook_auth}"}
-
-    try:
-        with requests.Session() as webhook_session:
-            retry_adapter = HTTPAdapter(
-                max_retries=Retry(
-                    total=1,
-                    allowed_methods=frozenset(["PUT"]),
-                )
-            )
-            webhook_session.mount(
-                f"{parsed_authorized_url.scheme}://", retry_adapter
-            )
-            response = webhook_session.put(
-                job_webhook,
-                json=json_data,
-                headers=auth_headers,
-                timeout=3,
-                allow_redirects=False,
-            )
+    events = json_data.pop("events", [])
+    sequence = json_data.pop("sequence", 0)
+    if not database.add_job_events(job_id, events, sequence):
+        abort(HTTPStatus.CONFLICT, message="Missing earlier job events")
 
-            # Auth failures can happen if webhook authentication
-            # is no longer valid or missing entirely.
-            if response.status_code in (
-                HTTPStatus.UNAUTHORIZED,
-                HTTPStatus.FORBIDDEN,
-            ):
-                abort(
-                    HTTPStatus.INTERNAL_SERVER_ERROR,
-                    message="Webhook authentication failed",
-                )
-            return response.text, response.status_code
-    except requests.exceptions.Timeout:
-        abort(HTTPStatus.GATEWAY_TIMEOUT, message="Webhook Timeout")
-    except requests.exceptions.RequestException:
-        abort(HTTPStatus.BAD_GATEWAY, message="Webhook unreachable")
+    # The update is delivered in the background, so that a slow webhook
+    # doesn't hold up the agent
+    webhook_dispatcher.enqueue(job_id, job_webhook, json_data)
+    return "OK"
 
 
 def check_valid_uuid(job_id):
@@ -972,26 +1340,12 @@ def check_valid_uuid(job_id):
 @require_role(ServerRoles.ADMIN, ServerRoles.MANAGER, ServerRoles.CONTRIBUTOR)
 def job_position_get(job_id):
     """Return the position of the specified jobid in the queue."""
-    job_data, status = job_get_id(job_id)
-    if status == 204:
+    if not check_valid_uuid(job_id):
+        abort(400, message="Invalid job_id specified")
+    position = database.get_job_position(job_id)
+    if position is None:
         return "Job not found or already started\n", 410
-    if status != 200:
-        return job_data
-    try:
-        queue = job_data.json.get("job_queue")
-    except (AttributeError, TypeError):
-        return f"Invalid json returned for id: {job_id}\n", 400
-    # Get all jobs with job_queue=queue and return only the _id
-    jobs = database.mongo.db.jobs.find(
-        {"job_data.job_queue": queue, "result_data.job_state": "waiting"},
-        {"job_id": 1},
-        sort=[("job_priority", -1)],
-    )
-    # Create a dict mapping job_id (as a string) to the position in the queue
-    jobs_id_position = {job.get("job_id"): pos for pos, job in enumerate(jobs)}
-    if job_id in jobs_id_position:
-        return str(jobs_id_position[job_id])
-    return "Job not found or already started\n", 410
+    return str(position)
 
 
 def cancel_job(job_id):
@@ -1012,6 +1366,8 @@ def cancel_job(job_id):
     )
     if response.modified_count == 0:
         return "The job is already completed or cancelled", 400
+    database.release_job_blob(job_id)
+    result_notifier.notify(job_id)
     return "OK"
 
 
@@ -1019,15 +1375,33 @@ def cancel_job(job_id):
 @authenticate
 @require_role(ServerRoles.ADMIN, ServerRoles.MANAGER, ServerRoles.CONTRIBUTOR)
 def queue_wait_time_percentiles_get():
-    """Get wait time metrics - optionally take a list of queues."""
+    """Get wait time metrics - optionally take a list of queues.
+
+    The window parameter sets the time window to include, such as 24h
+    (default 7d).
+    """
     queues = request.args.getlist("queue")
-    wait_times = database.get_queue_wait_times(queues)
-    queue_percentile_data = {}
-    for queue in wait_times:
-        queue_percentile_data[queue["name"]] = database.calculate_percentiles(
-            queue["wait_times"]
-        )
-    return queue_percentile_data
+    try:
+        window = parse_duration(request.args.get("window", "7d"))
+    except DurationParseError as exc:
+        abort(HTTPStatus.UNPROCESSABLE_ENTITY, message=str(exc))
+    wait_times = database.get_queue_wait_times(queues, window)
+    return {
+        queue: database.calculate_percentiles(histogram)
+        for queue, histogram in wait_times.items()
+    }
+
+
+@v1.get("/queues/stats")
+@authenticate
+@require_role(ServerRoles.ADMIN, ServerRoles.MANAGER, ServerRoles.CONTRIBUTOR)
+def queue_stats_get():
+    """Get the number of jobs in each state on each queue.
+
+    Optionally take a list of queues to include with the queue parameter.
+    """
+    queues = request.args.getlist("queue")
+    return database.get_queue_job_counts(queues or None)
 
 
 @v1.get("/queues/<queue_name>/agents")
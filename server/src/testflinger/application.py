@@ -27,12 +27,14 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 from testflinger.api.v1 import LogTypeConverter, v1
 from testflinger.database import setup_mongodb
 from testflinger.extensions import metrics
+from testflinger.logs import validate_log_compression
 from testflinger.oidc import app_register_oidc
 from testflinger.oidc.api import oidc_api
 from testflinger.oidc.views import oidc_views
 from testflinger.owasp import OWASPLogger
 from testflinger.providers import ISODatetimeProvider
 from testflinger.views import views
+from testflinger.webhooks import webhook_dispatcher
 
 try:
     import sentry_sdk
@@ -63,6 +65,9 @@ def create_flask_app(config=None, secrets_store=None):
 
     tf_app.config["PROPAGATE_EXCEPTIONS"] = True
 
+    # Fail early rather than silently storing uncompressed log segments
+    validate_log_compression()
+
     if os.environ.get("TEMPLATES_AUTO_RELOAD", "false").lower() == "true":
         tf_app.config["TEMPLATES_AUTO_RELOAD"] = True
 
@@ -89,6 +94,7 @@ def create_flask_app(config=None, secrets_store=None):
     metrics_port = int(os.environ.get("METRICS_PORT", "9090"))
     if not tf_app.config.get("TESTING"):
         metrics.start_http_server(metrics_port)
+        webhook_dispatcher.start()
 
     @tf_app.errorhandler(NotFound)
     def handle_404(exc):
@@ -0,0 +1,88 @@
+# Copyright (C) 2026 Canonical
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Short-lived in-process caches for frequently read database lookups."""
+
+import copy
+import functools
+import os
+import threading
+import time
+from collections.abc import Callable
+
+from prometheus_client import Counter
+
+# How long cached lookups are reused, in seconds. Writes through this
+# process clear the caches right away, so this only bounds how long changes
+# made by other workers or tools take to be seen. 0 disables caching.
+CACHE_TTL = float(os.environ.get("TESTFLINGER_CACHE_TTL", "10"))
+
+cache_metric = Counter(
+    "cache_lookups",
+    "Number of cached lookups",
+    ["cache", "result"],
+    namespace="testflinger",
+)
+
+
+class TTLCache:
+    """Cache the results of a function for ``CACHE_TTL`` seconds.
+
+    Results are cached per worker process and per set of arguments, and a
+    copy is returned each time so callers can't modify the cached value.
+    """
+
+    def __init__(self, func: Callable):
+        """Initialize an empty cache for the specified function."""
+        functools.update_wrapper(self, func)
+        self._func = func
+        self._lock = threading.Lock()
+        self._entries: dict[tuple, tuple[float, object]] = {}
+
+    def __call__(self, *args):
+        """Return the cached result, calling the function if needed."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(args)
+        if entry is not None and now - entry[0] < CACHE_TTL:
+            cache_metric.labels(self.__name__, "hit").inc()
+            return copy.deepcopy(entry[1])
+        cache_metric.labels(self.__name__, "miss").inc()
+        result = self._func(*args)
+        if CACHE_TTL > 0:
+            with self._lock:
+                self._entries[args] = (now, result)
+        return copy.deepcopy(result)
+
+    def clear(self):
+        """Remove all cached results."""
+        with self._lock:
+            self._entries.clear()
+
+
+_caches: list[TTLCache] = []
+
+
+def ttl_cache(func: Callable) -> TTLCache:
+    """Decorate a function so its results are cached by `TTLCache`."""
+    cache = TTLCache(func)
+    _caches.append(cache)
+    return cache
+
+
+def clear_caches():
+    """Remove all cached results, after a write that invalidates them."""
+    for cache in _caches:
+        cache.clear()
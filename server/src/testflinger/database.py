@@ -15,21 +15,81 @@
 #
 """Return a db object for talking to MongoDB."""
 
+import base64
+import contextlib
+import hashlib
+import io
+import itertools
+import math
 import os
 import urllib
+from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 from typing import Any
 
+from bson import Binary, ObjectId
 from flask_pymongo import PyMongo
 from gridfs import GridFS, errors
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure
 from testflinger_common.enums import ServerRoles
 
+from testflinger.cache import clear_caches, ttl_cache
+from testflinger.logs import LOG_FRAGMENT_KEY
+
 # Constants for TTL indexes
 REFRESH_TOKEN_IDEL_EXPIRATION = 60 * 60 * 24 * 90  # 90 days
 DEFAULT_EXPIRATION = 60 * 60 * 24 * 7  # 7 days
 OUTPUT_EXPIRATION = 60 * 60 * 4  # 4 hours
 ACCOUNT_DELETE_EXPIRATION = 60 * 60 * 24 * 90  # 90 days
 
+# Order in which waiting jobs are dispatched: priority, then FIFO
+JOB_DISPATCH_SORT = [("job_priority", DESCENDING), ("created_at", ASCENDING)]
+JOB_DISPATCH_INDEX = [
+    ("result_data.job_state", ASCENDING),
+    ("job_data.job_queue", ASCENDING),
+    *JOB_DISPATCH_SORT,
+]
+# Index created by older versions, which the dispatch index replaces
+LEGACY_JOB_STATE_INDEX = [
+    ("result_data.job_state", ASCENDING),
+    ("job_data.job_queue", ASCENDING),
+]
+
+# Size of the GridFS chunks files are stored in (the GridFS default), and
+# how many of them are written to the database at once
+GRIDFS_CHUNK_SIZE = 255 * 1024
+GRIDFS_CHUNK_BATCH = 16
+# Indexes the GridFS drivers create on the collections of a bucket, which
+# are also needed when the chunks are written directly
+GRIDFS_CHUNKS_INDEX = [("files_id", ASCENDING), ("n", ASCENDING)]
+GRIDFS_FILES_INDEX = [("filename", ASCENDING), ("uploadDate", ASCENDING)]
+
+# GridFS bucket for attachment archives stored by their SHA-256 digest, so
+# that identical archives submitted for several jobs are only stored once
+BLOB_BUCKET = "blobs"
+
+# Queue wait times are counted in histograms with logarithmic bins, so that
+# percentiles can be estimated within a few percent without keeping every
+# sample. Each histogram covers the jobs dispatched in one time bucket.
+WAIT_TIME_BINS_PER_DOUBLING = 16
+WAIT_TIME_BUCKET = 60 * 60  # 1 hour
+WAIT_TIME_PERCENTILES = [5, 10, 50, 90, 95]
+LEGACY_WAIT_TIMES_COLLECTION = "queue_wait_times"
+
+# Order in which jobs are listed: newest first, with the job ID as a
+# tie-break so that jobs created at the same time are paginated consistently
+JOB_LISTING_SORT = [("created_at", DESCENDING), ("job_id", DESCENDING)]
+
+LOG_FRAGMENT_INDEX = [(key, ASCENDING) for key in LOG_FRAGMENT_KEY]
+
+LOG_SEGMENT_INDEX = [
+    ("job_id", ASCENDING),
+    ("log_type", ASCENDING),
+    ("phase", ASCENDING),
+    ("first_fragment_number", ASCENDING),
+]
+
 mongo = PyMongo()
 
 
@@ -94,6 +154,17 @@ def create_indexes():
     mongo.db.logs.create_index(
         "updated_at", expireAfterSeconds=DEFAULT_EXPIRATION
     )
+    mongo.db.log_segments.create_index(
+        "updated_at", expireAfterSeconds=DEFAULT_EXPIRATION
+    )
+
+    # Remove queue wait time histograms after 7 days
+    mongo.db.queue_wait_time_buckets.create_index(
+        "bucket", expireAfterSeconds=DEFAULT_EXPIRATION
+    )
+    # Older versions kept every wait time sample, which the histograms
+    # replace, in this collection
+    mongo.db.drop_collection(LEGACY_WAIT_TIMES_COLLECTION)
 
     # Remove artifacts after 7 days
     mongo.db["fs.chunks"].create_index(
@@ -103,6 +174,20 @@ def create_indexes():
         "uploadDate", expireAfterSeconds=DEFAULT_EXPIRATION
     )
 
+    # Faster reads of stored files, and each chunk is only stored once
+    for bucket in ("fs", BLOB_BUCKET):
+        mongo.db[f"{bucket}.chunks"].create_index(
+            GRIDFS_CHUNKS_INDEX, unique=True
+        )
+        mongo.db[f"{bucket}.files"].create_index(GRIDFS_FILES_INDEX)
+
+    # Attachment blobs have no TTL: they are reference counted by the jobs
+    # using them instead, see `remove_unused_blobs`
+    mongo.db.attachment_blobs.create_index("last_used")
+
+    # Webhook updates are delivered in the order they are due
+    mongo.db.webhook_outbox.create_index("next_attempt")
+
     # Remove agents that haven't checked in for 7 days
     mongo.db.agents.create_index(
         "updated_at", expireAfterSeconds=DEFAULT_EXPIRATION
@@ -135,25 +220,142 @@ def create_indexes():
     mongo.db.client_permissions.create_index("client_id", unique=True)
     mongo.db.client_permissions.create_index("sub", sparse=True)
     mongo.db.jobs.create_index("job_id")
-    mongo.db.jobs.create_index(["result_data.job_state", "job_data.job_queue"])
+    mongo.db.queue_wait_time_buckets.create_index(
+        [("name", ASCENDING), ("bucket", ASCENDING)], unique=True
+    )
 
-    # Faster lookups for logs
-    mongo.db.logs.create_index(
-        ["job_id", "log_type", "phase", "fragment_number"]
+    # Dispatch index: matches the pop_job filter and provides its sort order
+    # (highest priority first, then oldest first) without an in-memory sort
+    mongo.db.jobs.create_index(JOB_DISPATCH_INDEX)
+    with contextlib.suppress(OperationFailure):
+        mongo.db.jobs.drop_index(LEGACY_JOB_STATE_INDEX)
+
+    # Listing index: provides the order in which jobs are paginated
+    mongo.db.jobs.create_index(JOB_LISTING_SORT)
+
+    # Faster lookups for logs, and each fragment is only stored once
+    create_log_fragment_index()
+    mongo.db.log_segments.create_index(LOG_SEGMENT_INDEX, unique=True)
+
+
+def create_log_fragment_index():
+    """Create the unique index on the fields identifying a log fragment.
+
+    Older versions created this index without the unique constraint, in
+    which case it is replaced, and any fragments stored more than once are
+    removed so the unique index can be built.
+    """
+    for name, info in mongo.db.logs.index_information().items():
+        if info["key"] == LOG_FRAGMENT_INDEX and not info.get("unique"):
+            mongo.db.logs.drop_index(name)
+    try:
+        mongo.db.logs.create_index(LOG_FRAGMENT_INDEX, unique=True)
+    except DuplicateKeyError:
+        remove_duplicate_log_fragments()
+        mongo.db.logs.create_index(LOG_FRAGMENT_INDEX, unique=True)
+
+
+def remove_duplicate_log_fragments():
+    """Remove all but one copy of log fragments that were stored repeatedly."""
+    duplicates = mongo.db.logs.aggregate(
+        [
+            {
+                "$group": {
+                    "_id": {key: f"${key}" for key in LOG_FRAGMENT_KEY},
+                    "ids": {"$push": "$_id"},
+                    "count": {"$sum": 1},
+                }
+            },
+            {"$match": {"count": {"$gt": 1}}},
+        ],
+        allowDiskUse=True,
     )
+    for duplicate in duplicates:
+        mongo.db.logs.delete_many({"_id": {"$in": duplicate["ids"][1:]}})
 
 
-def save_file(data: Any, filename: str):
-    """Store a file in the database (using GridFS)."""
-    # Normally we would use flask-pymongo save_file but it doesn't seem to
-    # work nicely for me with mongomock
-    storage = GridFS(mongo.db)
-    file_id = storage.put(data, filename=filename)
-    # Add a timestamp to the chunks - do this so we can set a TTL for them
-    timestamp = mongo.db["fs.files"].find_one({"_id": file_id})["uploadDate"]
-    mongo.db["fs.chunks"].update_many(
-        {"files_id": file_id}, {"$set": {"uploadDate": timestamp}}
+def save_file(data: Any, filename: str) -> int:
+    """Store a file in the database (using GridFS).
+
+    The file is written in GridFS chunks as the data is read, so uploads are
+    streamed to the database rather than buffered first. Each chunk includes
+    the upload date when it is inserted, so a TTL can be set for them.
+
+    :param data: The file contents, as bytes or a file-like object.
+    :param filename: The name to store the file with.
+    :return: The size of the file in bytes.
+    """
+    file_id = ObjectId()
+    upload_date = datetime.now(timezone.utc)
+    length = write_chunks(data, file_id, upload_date)
+    # The file only becomes visible once all of its chunks are stored
+    mongo.db["fs.files"].insert_one(
+        {
+            "_id": file_id,
+            "filename": filename,
+            "length": length,
+            "chunkSize": GRIDFS_CHUNK_SIZE,
+            "uploadDate": upload_date,
+        }
     )
+    return length
+
+
+def write_chunks(
+    data: Any, file_id: ObjectId, upload_date: datetime, bucket: str = "fs"
+) -> int:
+    """Write the contents of a file to the chunks collection of a bucket.
+
+    :param data: The file contents, as bytes or a file-like object.
+    :param file_id: The ID of the file the chunks belong to.
+    :param upload_date: The upload date to include in each chunk.
+    :param bucket: The name of the GridFS bucket.
+    :return: The size of the file in bytes.
+    """
+    if isinstance(data, bytes):
+        data = io.BytesIO(data)
+    chunks = mongo.db[f"{bucket}.chunks"]
+    length = 0
+    batch = []
+    try:
+        for n in itertools.count():
+            chunk = read_chunk(data, GRIDFS_CHUNK_SIZE)
+            if not chunk:
+                break
+            batch.append(
+                {
+                    "files_id": file_id,
+                    "n": n,
+                    "data": Binary(chunk),
+                    "uploadDate": upload_date,
+                }
+            )
+            length += len(chunk)
+            if len(batch) == GRIDFS_CHUNK_BATCH:
+                chunks.insert_many(batch)
+                batch = []
+        if batch:
+            chunks.insert_many(batch)
+    except BaseException:
+        # Don't leave the chunks of an incomplete upload behind
+        chunks.delete_many({"files_id": file_id})
+        raise
+    return length
+
+
+def read_chunk(data: Any, size: int) -> bytes:
+    """Read `size` bytes from `data`, or fewer only at the end of the data.
+
+    Raw streams, such as a request body, may return fewer bytes than asked
+    for before the end, but every GridFS chunk except the last is full.
+    """
+    chunk = data.read(size)
+    if not chunk or len(chunk) == size:
+        return chunk
+    buffer = bytearray(chunk)
+    while len(buffer) < size and (more := data.read(size - len(buffer))):
+        buffer += more
+    return bytes(buffer)
 
 
 def retrieve_file(filename):
@@ -167,6 +369,202 @@ def retrieve_file(filename):
         raise FileNotFoundError from error
 
 
+class HashingReader:
+    """File-like wrapper computing the SHA-256 digest of the data read."""
+
+    def __init__(self, data: Any):
+        """Wrap `data`, which is bytes or a file-like object."""
+        if isinstance(data, bytes):
+            data = io.BytesIO(data)
+        self._data = data
+        self.hash = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        """Read from the wrapped data, updating the digest."""
+        chunk = self._data.read(size)
+        self.hash.update(chunk)
+        return chunk
+
+
+def blob_id(sha256: str, owner: str | None) -> dict:
+    """Return the identifier of an attachments archive.
+
+    Archives are only shared between the jobs of the client that uploaded
+    them, so that other clients can neither check that an archive with
+    some contents is stored nor attach it to their jobs by its digest.
+    Identical archives uploaded by different clients are stored once per
+    client as a consequence.
+
+    :param sha256: The SHA-256 digest of the archive.
+    :param owner: The ID of the client that uploaded the archive, or None
+        for anonymous clients.
+    """
+    return {"sha256": sha256, "owner": owner}
+
+
+def save_blob(data: Any, owner: str | None = None) -> tuple[dict, int]:
+    """Store an attachments archive under its SHA-256 digest.
+
+    The archive is hashed while it is written, and if an identical archive
+    is already stored for the same owner (possibly by a concurrent upload),
+    the new copy is removed again and the existing one is kept. Either way,
+    a reference to the archive is added, which the caller must release
+    when done with it.
+
+    :param data: The archive contents, as bytes or a file-like object.
+    :param owner: The ID of the client uploading the archive.
+    :return: The identifier and the size of the archive in bytes.
+    """
+    remove_unused_blobs()
+    reader = HashingReader(data)
+    file_id = ObjectId()
+    upload_date = datetime.now(timezone.utc)
+    length = write_chunks(reader, file_id, upload_date, bucket=BLOB_BUCKET)
+    sha256 = reader.hash.hexdigest()
+    mongo.db[f"{BLOB_BUCKET}.files"].insert_one(
+        {
+            "_id": file_id,
+            "filename": sha256,
+            "length": length,
+            "chunkSize": GRIDFS_CHUNK_SIZE,
+            "uploadDate": upload_date,
+        }
+    )
+    # Referencing the stored archive and storing the new one is a single
+    # operation, so the archive can't be removed as unused in between
+    archive_id = blob_id(sha256, owner)
+    existing = mongo.db.attachment_blobs.find_one_and_update(
+        {"_id": archive_id},
+        {
+            "$inc": {"refcount": 1},
+            "$set": {"last_used": upload_date},
+            "$setOnInsert": {"file_id": file_id, "length": length},
+        },
+        upsert=True,
+    )
+    if existing is not None:
+        delete_blob_file(file_id)
+    return archive_id, length
+
+
+def delete_blob_file(file_id: ObjectId):
+    """Delete the stored contents of an attachments archive."""
+    mongo.db[f"{BLOB_BUCKET}.files"].delete_one({"_id": file_id})
+    mongo.db[f"{BLOB_BUCKET}.chunks"].delete_many({"files_id": file_id})
+
+
+def blob_exists(archive_id: dict) -> bool:
+    """Check if the attachments archive `archive_id` is stored."""
+    return mongo.db.attachment_blobs.count_documents({"_id": archive_id}) > 0
+
+
+def retrieve_blob(archive_id: dict | str):
+    """Retrieve the attachments archive `archive_id`.
+
+    :raises FileNotFoundError: If no such archive is stored.
+    """
+    blob = mongo.db.attachment_blobs.find_one({"_id": archive_id})
+    if blob is None:
+        raise FileNotFoundError(archive_id)
+    storage = GridFS(mongo.db, collection=BLOB_BUCKET)
+    try:
+        return storage.get(blob["file_id"])
+    except errors.NoFile as error:
+        raise FileNotFoundError(archive_id) from error
+
+
+def reference_blob(archive_id: dict) -> bool:
+    """Add a reference to the attachments archive `archive_id`.
+
+    :return: True if the archive is stored, False otherwise.
+    """
+    blob = mongo.db.attachment_blobs.find_one_and_update(
+        {"_id": archive_id},
+        {
+            "$inc": {"refcount": 1},
+            "$set": {"last_used": datetime.now(timezone.utc)},
+        },
+    )
+    return blob is not None
+
+
+def release_blob(archive_id: dict | str):
+    """Remove a reference to the attachments archive `archive_id`."""
+    mongo.db.attachment_blobs.update_one(
+        {"_id": archive_id},
+        {
+            "$inc": {"refcount": -1},
+            "$set": {"last_used": datetime.now(timezone.utc)},
+        },
+    )
+
+
+def release_job_blob(job_id: str):
+    """Remove the reference of a job to its attachments archive, if any.
+
+    The reference is only removed once, however many times the job is
+    completed or cancelled.
+    """
+    job = mongo.db.jobs.find_one_and_update(
+        {
+            "job_id": job_id,
+            "attachments_blob": {"$exists": True},
+            "attachments_released": {"$ne": True},
+        },
+        {"$set": {"attachments_released": True}},
+        projection={"_id": False, "attachments_blob": True},
+    )
+    if job is not None:
+        release_blob(job["attachments_blob"])
+
+
+def remove_unused_blobs():
+    """Remove attachments archives that are no longer used.
+
+    Archives are kept for `DEFAULT_EXPIRATION` after their last reference
+    is removed, so they can be reused by later submissions. Jobs expire
+    `DEFAULT_EXPIRATION` after they are created, so archives that haven't
+    been referenced for twice as long are removed even if a job expired
+    without removing its reference.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=DEFAULT_EXPIRATION)
+    query = {
+        "last_used": {"$lt": cutoff},
+        "$or": [
+            {"refcount": {"$lte": 0}},
+            {
+                "last_used": {
+                    "$lt": cutoff - timedelta(seconds=DEFAULT_EXPIRATION)
+                }
+            },
+        ],
+    }
+    for blob in mongo.db.attachment_blobs.find(query):
+        # Check the conditions again, in case the blob was just referenced
+        result = mongo.db.attachment_blobs.delete_one(
+            {"_id": blob["_id"], **query}
+        )
+        if result.deleted_count:
+            delete_blob_file(blob["file_id"])
+
+
+def retrieve_attachments(job_id: str):
+    """Retrieve the attachments archive of the job with `job_id`.
+
+    :raises FileNotFoundError: If the job has no attachments archive.
+    """
+    job = mongo.db.jobs.find_one(
+        {"job_id": job_id},
+        projection={"_id": False, "attachments_blob": True},
+    )
+    # Jobs submitted before archives were owned by clients reference them
+    # by their digest alone, which still identifies them
+    if job and (archive_id := job.get("attachments_blob")):
+        return retrieve_blob(archive_id)
+    # Archives uploaded before content-addressed storage are stored per job
+    return retrieve_file(filename=f"{job_id}.attachments")
+
+
 def get_attachments_status(job_id: str) -> str:
     """Return the attachments status of a job with `job_id`.
 
@@ -189,16 +587,29 @@ def get_attachments_status(job_id: str) -> str:
     return response["job_data"].get("attachments_status")
 
 
-def attachments_received(job_id):
-    """Inform the database that a job attachment archive has been stored."""
-    mongo.db.jobs.find_one_and_update(
+def attachments_received(job_id, archive_id: dict) -> str | None:
+    """Inform the database that a job attachment archive has been stored.
+
+    :param job_id: The ID of the job.
+    :param archive_id: The identifier of the (referenced) archive.
+    :returns: The queue of the job, or None if it wasn't awaiting attachments
+    """
+    response = mongo.db.jobs.find_one_and_update(
         {
             "job_id": job_id,
             "job_data.attachments_status": "waiting",
         },
-        {"$set": {"job_data.attachments_status": "complete"}},
-        projection={},
+        {
+            "$set": {
+                "job_data.attachments_status": "complete",
+                "attachments_blob": archive_id,
+            }
+        },
+        projection={"_id": False, "job_data.job_queue": True},
     )
+    if response is None:
+        return None
+    return response["job_data"].get("job_queue")
 
 
 def add_job(job: dict):
@@ -228,16 +639,24 @@ def pop_job(queue_list: list[str], agent_name: str) -> dict | None:
             "job_data.exclude_agents": {"$nin": [agent_name]},
         }
 
+        # Claim the job and mark the time it was started in a single atomic
+        # write, so no other agent can take it in between
+        started_at = datetime.now(timezone.utc)
         response = mongo.db.jobs.find_one_and_update(
             query_filter,
-            {"$set": {"result_data.job_state": "running"}},
+            {
+                "$set": {
+                    "result_data.job_state": "running",
+                    "started_at": started_at,
+                }
+            },
             projection={
                 "job_id": True,
                 "created_at": True,
                 "job_data": True,
                 "_id": True,
             },
-            sort=[("job_priority", -1)],
+            sort=JOB_DISPATCH_SORT,
         )
     except TypeError:
         return None
@@ -245,14 +664,7 @@ def pop_job(queue_list: list[str], agent_name: str) -> dict | None:
         return None
     # Flatten the job_data and include the job_id
     job = response["job_data"]
-    job_id = response["job_id"]
-    job["job_id"] = job_id
-    # Mark the time the job was started
-    started_at = datetime.now(timezone.utc)
-    mongo.db.jobs.update_one(
-        {"job_id": job_id},
-        {"$set": {"started_at": started_at}},
-    )
+    job["job_id"] = response["job_id"]
     # Save data about the wait time in the queue
     created_at = response["created_at"]
     queue = job["job_queue"]
@@ -264,31 +676,71 @@ def pop_job(queue_list: list[str], agent_name: str) -> dict | None:
 def save_queue_wait_time(
     queue: str, started_at: datetime, created_at: datetime
 ):
-    """Save data about the wait time in seconds for the specified queue."""
+    """Count the wait time of a job in the histogram for the queue."""
     # Ensure that python knows both datestamps are in UTC
     started_at = started_at.replace(tzinfo=timezone.utc)
     created_at = created_at.replace(tzinfo=timezone.utc)
-    wait_seconds = (started_at - created_at).seconds
-    mongo.db.queue_wait_times.update_one(
-        {"name": queue},
-        {
-            "$push": {
-                "wait_times": wait_seconds,
-            }
-        },
+    wait_seconds = (started_at - created_at).total_seconds()
+    mongo.db.queue_wait_time_buckets.update_one(
+        {"name": queue, "bucket": wait_time_bucket(started_at)},
+        {"$inc": {f"counts.{wait_time_bin(wait_seconds)}": 1}},
         upsert=True,
     )
 
 
-def get_queue_wait_times(queues: list[str] | None = None) -> list[dict]:
-    """Get the percentiles of wait times for specified queues or all queues."""
-    if not queues:
-        wait_times = mongo.db.queue_wait_times.find({}, {"_id": False})
-    else:
-        wait_times = mongo.db.queue_wait_times.find(
-            {"name": {"$in": queues}}, {"_id": False}
+def wait_time_bucket(timestamp: datetime) -> datetime:
+    """Return the start of the time bucket that includes a timestamp."""
+    return to_naive_utc(
+        datetime.fromtimestamp(
+            timestamp.timestamp() // WAIT_TIME_BUCKET * WAIT_TIME_BUCKET,
+            tz=timezone.utc,
         )
-    return list(wait_times)
+    )
+
+
+def wait_time_bin(wait_seconds: float) -> int:
+    """Return the histogram bin that counts a wait time.
+
+    Bin 0 counts wait times under a second, and each following bin
+    counts wait times from 2 ** ((bin - 1) / WAIT_TIME_BINS_PER_DOUBLING)
+    up to the start of the next bin.
+    """
+    if wait_seconds < 1:
+        return 0
+    return 1 + math.floor(
+        WAIT_TIME_BINS_PER_DOUBLING * math.log2(wait_seconds)
+    )
+
+
+def wait_time_bin_value(bin_index: int) -> float:
+    """Return the wait time that represents a histogram bin."""
+    if bin_index == 0:
+        return 0
+    # Geometric middle of the bin, to keep the relative error even
+    return 2 ** ((bin_index - 0.5) / WAIT_TIME_BINS_PER_DOUBLING)
+
+
+def get_queue_wait_times(
+    queues: list[str] | None = None, window: int = DEFAULT_EXPIRATION
+) -> dict[str, dict[int, int]]:
+    """Get the wait time histograms for specified queues or all queues.
+
+    :param queues: The queues to get wait times for, or None for all queues.
+    :param window: Only include jobs dispatched in this many seconds.
+    :return: A dict mapping each queue to a histogram of its wait times,
+        which maps each bin to the number of wait times in it.
+    """
+    since = datetime.now(timezone.utc) - timedelta(seconds=window)
+    query = {"bucket": {"$gte": wait_time_bucket(since)}}
+    if queues:
+        query["name"] = {"$in": queues}
+    histograms = defaultdict(lambda: defaultdict(int))
+    for bucket in mongo.db.queue_wait_time_buckets.find(
+        query, {"_id": False, "name": True, "counts": True}
+    ):
+        for bin_index, count in bucket.get("counts", {}).items():
+            histograms[bucket["name"]][int(bin_index)] += count
+    return {name: dict(histogram) for name, histogram in histograms.items()}
 
 
 def get_agents_on_queue(queue: str) -> list[dict]:
@@ -306,48 +758,222 @@ def get_jobs_on_queue(queue: str) -> list[dict]:
     return list(jobs)
 
 
-def get_num_incomplete_jobs_on_queue(queue: str) -> int:
-    """Get the number of incomplete jobs on a specific queue."""
+def encode_job_cursor(job: dict) -> str:
+    """Encode the position of a job in the job listing as a cursor.
+
+    :param job: The job, including its created_at and job_id.
+    :return: An opaque cursor string.
+    """
+    created_at = job["created_at"].isoformat()
+    cursor = f"{created_at}|{job['job_id']}"
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def decode_job_cursor(cursor: str) -> tuple[datetime, str]:
+    """Decode a cursor created by `encode_job_cursor`.
+
+    :param cursor: The cursor string.
+    :raises ValueError: If the cursor is not valid.
+    :return: The created_at and job_id of the job the cursor points to.
+    """
+    try:
+        created_at, job_id = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        )
+        return to_naive_utc(datetime.fromisoformat(created_at)), job_id
+    except (UnicodeError, ValueError) as exc:
+        raise ValueError(f"Invalid cursor: {cursor}") from exc
+
+
+def to_naive_utc(timestamp: datetime) -> datetime:
+    """Convert a timestamp to a naive UTC datetime, as stored in MongoDB."""
+    if timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def get_jobs_page(
+    query: dict,
+    limit: int,
+    after: str | None = None,
+    before: str | None = None,
+    start_datetime: datetime | None = None,
+    stop_datetime: datetime | None = None,
+    projection: dict | None = None,
+) -> tuple[list[dict], str | None, str | None]:
+    """Get a page of jobs, newest first, using keyset pagination.
+
+    :param query: Filter for the jobs to include.
+    :param limit: Maximum number of jobs to return.
+    :param after: Cursor of the job to list older jobs from (optional).
+    :param before: Cursor of the job to list newer jobs from (optional).
+    :param start_datetime: Only include jobs created from then (optional).
+    :param stop_datetime: Only include jobs created before then (optional).
+    :param projection: Fields to return for each job (optional).
+    :raises ValueError: If a cursor is not valid.
+    :return: The jobs, and the cursors for the newer and older pages, which
+        are None if there are no more jobs in that direction.
+    """
+    conditions = [query]
+    created_at_range = {}
+    if start_datetime is not None:
+        created_at_range["$gte"] = to_naive_utc(start_datetime)
+    if stop_datetime is not None:
+        created_at_range["$lt"] = to_naive_utc(stop_datetime)
+    if created_at_range:
+        conditions.append({"created_at": created_at_range})
+
+    # Paging backwards walks the listing in reverse, then flips the result
+    reverse = before is not None and after is None
+    cursor = after or before
+    if cursor is not None:
+        created_at, job_id = decode_job_cursor(cursor)
+        operator = "$gt" if reverse else "$lt"
+        conditions.append(
+            {
+                "$or": [
+                    {"created_at": {operator: created_at}},
+                    {"created_at": created_at, "job_id": {operator: job_id}},
+                ]
+            }
+        )
+
+    sort = [
+        (key, -direction if reverse else direction)
+        for key, direction in JOB_LISTING_SORT
+    ]
+    # Fetch one more job than needed to know whether there is another page
+    jobs = list(
+        mongo.db.jobs.find(
+            {"$and": conditions}, projection, sort=sort, limit=limit + 1
+        )
+    )
+    has_more = len(jobs) > limit
+    jobs = jobs[:limit]
+    if reverse:
+        jobs.reverse()
+
+    if not jobs:
+        return jobs, None, None
+    has_newer = has_more if reverse else cursor is not None
+    has_older = cursor is not None if reverse else has_more
+    newer = encode_job_cursor(jobs[0]) if has_newer else None
+    older = encode_job_cursor(jobs[-1]) if has_older else None
+    return jobs, newer, older
+
+
+def get_job_position(job_id: str) -> int | None:
+    """Get the position of a waiting job in its queue.
+
+    The position is the number of waiting jobs on the same queue that sort
+    ahead of it in the dispatch order, so it is counted from the dispatch
+    index without reading the rest of the queue.
+
+    :param job_id: The job identifier.
+    :return: The position, starting at 0, or None if the job is not waiting.
+    """
+    job = mongo.db.jobs.find_one(
+        {"job_id": job_id, "result_data.job_state": "waiting"},
+        projection={
+            "job_data.job_queue": True,
+            "job_priority": True,
+            "created_at": True,
+        },
+    )
+    if not job:
+        return None
+    priority = job.get("job_priority", 0)
+    created_at = job["created_at"]
     return mongo.db.jobs.count_documents(
         {
-            "job_data.job_queue": queue,
-            "result_data.job_state": {
-                "$nin": ["complete", "completed", "cancelled"]
-            },
+            "result_data.job_state": "waiting",
+            "job_data.job_queue": job["job_data"]["job_queue"],
+            "$or": [
+                {"job_priority": {"$gt": priority}},
+                {"job_priority": priority, "created_at": {"$lt": created_at}},
+                # Jobs created at the same time are ordered by insertion
+                {
+                    "job_priority": priority,
+                    "created_at": created_at,
+                    "_id": {"$lt": job["_id"]},
+                },
+            ],
         }
     )
 
 
-def calculate_percentiles(data: list) -> dict:
+def get_queue_job_counts(queues: list[str] | None = None) -> dict[str, dict]:
+    """Count the waiting, running and completed jobs on each queue.
+
+    All queues are counted with a single aggregation rather than one count
+    per queue.
+
+    :param queues: The queues to count jobs on, or None for all queues.
+    :return: A dict mapping each queue with jobs to its job counts.
     """
-    Calculate the percentiles of the wait times for each queue.
+    pipeline = []
+    if queues is not None:
+        pipeline.append({"$match": {"job_data.job_queue": {"$in": queues}}})
+    pipeline.append(
+        {
+            "$group": {
+                "_id": {
+                    "queue": "$job_data.job_queue",
+                    "state": "$result_data.job_state",
+                },
+                "count": {"$sum": 1},
+            }
+        }
+    )
+    counts = defaultdict(
+        lambda: {"waiting": 0, "running": 0, "completed": 0, "cancelled": 0}
+    )
+    for group in mongo.db.jobs.aggregate(pipeline):
+        queue = group["_id"].get("queue")
+        if queue is None:
+            continue
+        state = group["_id"].get("state")
+        if state in ("complete", "completed"):
+            state = "completed"
+        elif state not in ("waiting", "cancelled"):
+            # Any other state means the job has been dispatched to an agent
+            state = "running"
+        counts[queue][state] += group["count"]
+    return dict(counts)
+
+
+def calculate_percentiles(histogram: dict[int, int]) -> dict:
+    """
+    Estimate the percentiles of the wait times for a queue.
 
-    This uses the nearest rank with interpolation method, which can help in
-    cases where the data is not evenly distributed, such as when we might
-    have big gaps between the best and worst case scenarios.
+    This uses the nearest rank with interpolation method on the histogram
+    of wait times, with each wait time estimated by the middle of its bin.
     """
-    if not data:
+    total = sum(histogram.values())
+    if not total:
         return {}
-    percentiles = [5, 10, 50, 90, 95]
-    data.sort()
+    bins = sorted(histogram.items())
+
+    def value_at(position: int) -> float:
+        """Return the wait time at a position in the sorted wait times."""
+        seen = 0
+        for bin_index, count in bins:
+            seen += count
+            if seen > position:
+                return wait_time_bin_value(bin_index)
+        return wait_time_bin_value(bins[-1][0])
+
     percentile_results = {}
-    for percentile in percentiles:
-        # Index is the position in our sorted data that goes with this
-        # percentile
-        index = (len(data) - 1) * (percentile / 100.0)
-        # Lower and upper index are the indexes of two closest data points
-        # that are below and above the percentile
-        lower_index = int(index)
-        upper_index = lower_index + 1
-        if upper_index < len(data):
-            # Interpolate the value based on how far the lower and upper
-            # data points are from the percentile
-            lower_value = data[lower_index] * (upper_index - index)
-            upper_value = data[upper_index] * (index - lower_index)
-            percentile_results[percentile] = lower_value + upper_value
-        else:
-            # If the upper index is out of bounds, just use the lower value
-            percentile_results[percentile] = data[lower_index]
+    for percentile in WAIT_TIME_PERCENTILES:
+        # Rank is the position in the sorted wait times that goes with this
+        # percentile, interpolated between the two closest wait times
+        rank = (total - 1) * (percentile / 100.0)
+        lower_index = int(rank)
+        lower_value = value_at(lower_index)
+        upper_value = value_at(min(lower_index + 1, total - 1))
+        percentile_results[percentile] = lower_value + (
+            upper_value - lower_value
+        ) * (rank - lower_index)
     return percentile_results
 
 
@@ -402,10 +1028,7 @@ def check_queue_restricted(queue: str) -> bool:
     :param queue: Name of the queue to validate.
     :return: True if restricted, False otherwise.
     """
-    queue_count = mongo.db.restricted_queues.count_documents(
-        {"queue_name": queue}
-    )
-    return queue_count != 0
+    return queue in get_restricted_queues()
 
 
 def get_agent_info(agent: str) -> dict:
@@ -425,12 +1048,14 @@ def queue_exists(queue: str) -> bool:
     return mongo.db.agents.find_one({"queues": queue}) is not None
 
 
+@ttl_cache
 def get_restricted_queues() -> set[str]:
     """Return a set of all restricted queues."""
     restricted_queues = mongo.db.restricted_queues.distinct("queue_name")
     return set(restricted_queues)
 
 
+@ttl_cache
 def get_restricted_queues_owners() -> dict[str, list[str]]:
     """Return a mapping of restricted queues and its permitted client IDs."""
     docs = mongo.db.client_permissions.find(
@@ -464,6 +1089,7 @@ def add_restricted_queue(queue: str, client_id: str):
         {"client_id": client_id},
         {"$addToSet": {"allowed_queues": queue}},
     )
+    clear_caches()
 
 
 def delete_restricted_queue(queue: str, client_id: str):
@@ -477,6 +1103,7 @@ def delete_restricted_queue(queue: str, client_id: str):
     mongo.db.client_permissions.update_one(
         {"client_id": client_id}, {"$pull": {"allowed_queues": queue}}
     )
+    clear_caches()
 
 
 def check_client_exists(client_id: str) -> bool:
@@ -523,6 +1150,7 @@ def create_or_update_client_permissions(
     mongo.db.client_permissions.update_one(
         {"client_id": client_id}, {"$set": client_permissions}, upsert=True
     )
+    clear_caches()
 
 
 def delete_client_permissions(client_id: str) -> None:
@@ -531,6 +1159,7 @@ def delete_client_permissions(client_id: str) -> None:
     :param client_id: client_id to delete
     """
     mongo.db.client_permissions.delete_one({"client_id": client_id})
+    clear_caches()
 
 
 def add_refresh_token(data: dict) -> None:
@@ -625,6 +1254,7 @@ def register_oidc_client(userinfo: dict) -> None:
         },
         upsert=True,
     )
+    clear_caches()
 
 
 def get_job_results(job_id: str):
@@ -634,6 +1264,22 @@ def get_job_results(job_id: str):
     )
 
 
+def get_job_state(job_id: str) -> dict | None:
+    """Retrieve the job state and phase exit codes for a specific job id.
+
+    Only the small ``result_data`` fields are projected, so none of the
+    stored logs have to be read to answer this query.
+    """
+    return mongo.db.jobs.find_one(
+        {"job_id": job_id},
+        {
+            "_id": False,
+            "result_data.job_state": True,
+            "result_data.status": True,
+        },
+    )
+
+
 def add_job_results(job_id: str, json_data: dict):
     """Add results to specified job id with "result_data" prepended."""
     # First, we need to prepend "result_data" to each key in the result_data
@@ -654,6 +1300,40 @@ def job_exists(job_id: str) -> bool:
     )
 
 
+def add_job_events(job_id: str, events: list[dict], sequence: int) -> bool:
+    """Add status events to a job, skipping those it already has.
+
+    :param job_id: The job ID.
+    :param events: Status events, in the order they were emitted.
+    :param sequence: Number of the first of `events` among all the events
+        of the job.
+    :return: False if the job is missing events before `sequence`.
+    """
+    while True:
+        job = mongo.db.jobs.find_one(
+            {"job_id": job_id}, {"_id": False, "status_event_count": True}
+        )
+        count = job.get("status_event_count", 0)
+        if sequence > count:
+            return False
+        new_events = events[count - sequence :]
+        if not new_events:
+            return True
+        # Only add the events if no others were added in the meantime
+        result = mongo.db.jobs.update_one(
+            {
+                "job_id": job_id,
+                "status_event_count": count if count else {"$in": [0, None]},
+            },
+            {
+                "$push": {"status_events": {"$each": new_events}},
+                "$inc": {"status_event_count": len(new_events)},
+            },
+        )
+        if result.modified_count:
+            return True
+
+
 def add_oidc_device_code(device_code: str, request_id: str, expires_in: int):
     """Add OIDC device code to the database with an expiration time.
 
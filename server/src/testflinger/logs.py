@@ -16,14 +16,49 @@
 
 """Handlers for storing/retrieving agent output and serial output."""
 
+import heapq
+import itertools
+import os
+import zlib
 from abc import ABC, abstractmethod
 from collections import defaultdict
 from dataclasses import asdict, dataclass
 from datetime import datetime, timezone
 from typing import Iterable
 
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from testflinger_common.enums import LogType, TestPhase
 
+# Fields that uniquely identify a log fragment, so that fragments posted
+# more than once (e.g. when an agent retries a request) are stored once
+LOG_FRAGMENT_KEY = ("job_id", "log_type", "phase", "fragment_number")
+DUPLICATE_KEY_ERROR = 11000
+
+# Maximum size of the log data merged into a single log segment, well below
+# the MongoDB document size limit
+LOG_SEGMENT_SIZE = 1024 * 1024
+
+# Codecs for the log data of log segments, keyed by the marker stored in the
+# segment. Segments without a marker store their log data as plain text
+LOG_CODECS = {
+    "zlib": (zlib.compress, zlib.decompress),
+}
+# Codec used for new log segments, or "none" to store them uncompressed
+LOG_COMPRESSION = os.environ.get("LOG_COMPRESSION", "zlib")
+
+
+def validate_log_compression():
+    """Check that LOG_COMPRESSION is a known codec or "none".
+
+    :raises ValueError: If log segments can't be stored with the codec.
+    """
+    if LOG_COMPRESSION != "none" and LOG_COMPRESSION not in LOG_CODECS:
+        codecs = ", ".join(["none", *LOG_CODECS])
+        raise ValueError(
+            f"Unknown LOG_COMPRESSION {LOG_COMPRESSION!r}, "
+            f"expected one of: {codecs}"
+        )
+
 
 @dataclass
 class LogFragment:
@@ -51,6 +86,22 @@ class LogHandler(ABC):
         """
         raise NotImplementedError
 
+    def store_log_fragments(self, log_fragments: list[LogFragment]):
+        """Store a batch of log fragments in the handler-specific backend.
+
+        :param log_fragments: The LogFragment objects to store, in order.
+        """
+        for log_fragment in log_fragments:
+            self.store_log_fragment(log_fragment)
+
+    @abstractmethod
+    def compact_logs(self, job_id: str):
+        """Merge the stored log fragments of a finished job.
+
+        :param job_id: The job identifier.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def retrieve_log_fragments(
         self,
@@ -133,15 +184,57 @@ class MongoLogHandler(LogHandler):
     def store_log_fragment(self, log_fragment: LogFragment):
         """Store logs in the approriate log collection in MongoDB.
 
+        Fragments that are already stored are ignored, relying on the
+        unique index on ``LOG_FRAGMENT_KEY``.
+
         :param log_fragment: The LogFragment object to store.
         """
         log_collection = self.mongo.db.logs
+        try:
+            log_collection.insert_one(self._fragment_document(log_fragment))
+        except DuplicateKeyError:
+            # The fragment was already stored by a previous request
+            pass
+
+    def store_log_fragments(self, log_fragments: list[LogFragment]):
+        """Store a batch of logs in the log collection with one request.
+
+        Fragments that are already stored are ignored, relying on the
+        unique index on ``LOG_FRAGMENT_KEY``.
+
+        :param log_fragments: The LogFragment objects to store, in order.
+        """
+        log_collection = self.mongo.db.logs
+        try:
+            # Unordered, so the rest of the batch is stored even if some of
+            # the fragments are duplicates
+            log_collection.insert_many(
+                [
+                    self._fragment_document(fragment)
+                    for fragment in log_fragments
+                ],
+                ordered=False,
+            )
+        except BulkWriteError as exc:
+            if any(
+                error["code"] != DUPLICATE_KEY_ERROR
+                for error in exc.details["writeErrors"]
+            ):
+                raise
+
+    @staticmethod
+    def _fragment_document(log_fragment: LogFragment) -> dict:
+        """Convert a LogFragment to the document stored in MongoDB.
+
+        :param log_fragment: The LogFragment object to convert.
+        :return: The document to store.
+        """
         fragment_dict = asdict(log_fragment)
         timestamp = datetime.now(timezone.utc)
         if fragment_dict["timestamp"] is None:
             fragment_dict["timestamp"] = timestamp
         fragment_dict["updated_at"] = timestamp
-        log_collection.insert_one(fragment_dict)
+        return fragment_dict
 
     def retrieve_log_fragments(
         self,
@@ -153,6 +246,9 @@ class MongoLogHandler(LogHandler):
     ) -> Iterable[LogFragment]:
         """Retrieve log fragments from MongoDB sorted by fragment number.
 
+        Fragments from compacted log segments are included, either as a
+        whole segment or, if only part of it matches, fragment by fragment.
+
         :param job_id: The job identifier.
         :param log_type: The type of log to retrieve (optional).
         :param phase: The test phase to retrieve logs from (optional).
@@ -160,33 +256,226 @@ class MongoLogHandler(LogHandler):
         :param start_timestamp: Timestamp to start retrieving from (optional).
         :return: An iterable of LogFragment objects.
         """
-        log_collection = self.mongo.db.logs
-        query = {
-            "job_id": job_id,
-            "fragment_number": {"$gte": start_fragment},
-        }
-        optional_filters = {
-            "log_type": log_type,
-            "phase": phase,
-            "timestamp": {"$gte": start_timestamp}
-            if start_timestamp is not None
-            else None,
-        }
+        query = {"job_id": job_id}
+        optional_filters = {"log_type": log_type, "phase": phase}
         # Add optional filters to query if they are provided
         for key, value in optional_filters.items():
             if value is not None:
                 query[key] = value
 
-        yield from (
-            LogFragment(
-                fragment["job_id"],
-                fragment["log_type"],
-                fragment["phase"],
+        fragment_query = query | {"fragment_number": {"$gte": start_fragment}}
+        segment_query = query | {
+            "last_fragment_number": {"$gte": start_fragment}
+        }
+        if start_timestamp is not None:
+            fragment_query["timestamp"] = {"$gte": start_timestamp}
+            segment_query["timestamps"] = {"$gte": start_timestamp}
+
+        fragments = (
+            (
                 fragment["fragment_number"],
-                fragment["timestamp"],
-                fragment["log_data"],
+                self._fragment_from_document(fragment),
+            )
+            for fragment in self.mongo.db.logs.find(fragment_query).sort(
+                "fragment_number"
+            )
+        )
+        segments = (
+            fragment
+            for segment in self.mongo.db.log_segments.find(segment_query).sort(
+                "first_fragment_number"
+            )
+            for fragment in self._split_segment(
+                segment, start_fragment, start_timestamp
             )
-            for fragment in log_collection.find(query).sort("fragment_number")
+        )
+        # Compacted segments and fragments stored after the compaction are
+        # returned together in fragment number order. Fragments can be in
+        # both while they are compacted, or if they are posted again after
+        # the compaction, so those covered by a segment are skipped.
+        last_numbers = {}
+        for _, fragment in heapq.merge(
+            segments, fragments, key=lambda item: item[0]
+        ):
+            key = (fragment.log_type, fragment.phase)
+            if fragment.fragment_number <= last_numbers.get(key, -1):
+                continue
+            last_numbers[key] = fragment.fragment_number
+            yield fragment
+
+    def compact_logs(self, job_id: str):
+        """Merge the log fragments of a job into large log segments.
+
+        Each phase and log type is merged into segments of up to
+        ``LOG_SEGMENT_SIZE`` characters, which keep the number, timestamp
+        and offset of every fragment they contain so they can still be
+        queried by start_fragment and start_timestamp.
+
+        :param job_id: The job identifier.
+        """
+        log_collection = self.mongo.db.logs
+        fragments = log_collection.find({"job_id": job_id}).sort(
+            [(key, 1) for key in LOG_FRAGMENT_KEY]
+        )
+        for _, group in itertools.groupby(
+            fragments,
+            key=lambda fragment: (fragment["log_type"], fragment["phase"]),
+        ):
+            segment = []
+            segment_size = 0
+            for fragment in group:
+                if segment and (
+                    segment_size + len(fragment["log_data"]) > LOG_SEGMENT_SIZE
+                ):
+                    self._store_log_segment(segment)
+                    segment = []
+                    segment_size = 0
+                segment.append(fragment)
+                segment_size += len(fragment["log_data"])
+            if segment:
+                self._store_log_segment(segment)
+
+    def _store_log_segment(self, fragments: list[dict]):
+        """Replace consecutive fragment documents with a log segment.
+
+        The segment is stored before the fragments are removed, so a
+        compaction that is interrupted can safely be run again, and the
+        fragments are only retrieved once while both are stored.
+
+        :param fragments: The fragment documents to merge, in order.
+        """
+        offsets = list(
+            itertools.accumulate(
+                (len(fragment["log_data"]) for fragment in fragments[:-1]),
+                initial=0,
+            )
+        )
+        segment = {
+            "job_id": fragments[0]["job_id"],
+            "log_type": fragments[0]["log_type"],
+            "phase": fragments[0]["phase"],
+            "first_fragment_number": fragments[0]["fragment_number"],
+            "last_fragment_number": fragments[-1]["fragment_number"],
+            "fragment_numbers": [f["fragment_number"] for f in fragments],
+            "timestamps": [f["timestamp"] for f in fragments],
+            "offsets": offsets,
+            "updated_at": datetime.now(timezone.utc),
+        }
+        segment.update(
+            self._encode_log_data("".join(f["log_data"] for f in fragments))
+        )
+        try:
+            self.mongo.db.log_segments.insert_one(segment)
+        except DuplicateKeyError:
+            # The segment was stored by a previous compaction
+            pass
+        self.mongo.db.logs.delete_many(
+            {"_id": {"$in": [fragment["_id"] for fragment in fragments]}}
+        )
+
+    @staticmethod
+    def _encode_log_data(log_data: str) -> dict:
+        """Return the segment fields storing log data with LOG_COMPRESSION.
+
+        :param log_data: The log data to store.
+        :return: The log data and, if compressed, the codec used.
+        """
+        if LOG_COMPRESSION not in LOG_CODECS:
+            return {"log_data": log_data}
+        compress, _ = LOG_CODECS[LOG_COMPRESSION]
+        return {
+            "codec": LOG_COMPRESSION,
+            "log_data": compress(log_data.encode("utf-8")),
+        }
+
+    @staticmethod
+    def _decode_log_data(segment: dict) -> str:
+        """Return the log data of a segment, decompressing it if needed.
+
+        :param segment: The log segment document.
+        :return: The log data as text.
+        """
+        codec = segment.get("codec")
+        if codec is None:
+            return segment["log_data"]
+        _, decompress = LOG_CODECS[codec]
+        return decompress(segment["log_data"]).decode("utf-8")
+
+    @classmethod
+    def _split_segment(
+        cls,
+        segment: dict,
+        start_fragment: int,
+        start_timestamp: datetime | None,
+    ) -> Iterable[tuple[int, LogFragment]]:
+        """Return the parts of a log segment that match a query.
+
+        A segment that matches as a whole is returned as a single fragment
+        numbered after its last fragment, otherwise each matching fragment
+        is returned on its own.
+
+        :param segment: The log segment document.
+        :param start_fragment: The fragment number to start retrieving from.
+        :param start_timestamp: Timestamp to start retrieving from (optional).
+        :return: An iterable of (first fragment number, LogFragment) tuples.
+        """
+        numbers = segment["fragment_numbers"]
+        timestamps = segment["timestamps"]
+        log_data = cls._decode_log_data(segment)
+        offsets = [*segment["offsets"], len(log_data)]
+        if start_timestamp is not None and start_timestamp.tzinfo is None:
+            start_timestamp = start_timestamp.replace(tzinfo=timezone.utc)
+        selected = [
+            index
+            for index, number in enumerate(numbers)
+            if number >= start_fragment
+            and (
+                start_timestamp is None
+                # MongoDB returns naive datetimes in UTC by default
+                or timestamps[index].replace(tzinfo=timezone.utc)
+                >= start_timestamp
+            )
+        ]
+        if len(selected) == len(numbers):
+            yield (
+                numbers[0],
+                LogFragment(
+                    segment["job_id"],
+                    segment["log_type"],
+                    segment["phase"],
+                    numbers[-1],
+                    timestamps[-1],
+                    log_data,
+                ),
+            )
+            return
+        for index in selected:
+            yield (
+                numbers[index],
+                LogFragment(
+                    segment["job_id"],
+                    segment["log_type"],
+                    segment["phase"],
+                    numbers[index],
+                    timestamps[index],
+                    log_data[offsets[index] : offsets[index + 1]],
+                ),
+            )
+
+    @staticmethod
+    def _fragment_from_document(fragment: dict) -> LogFragment:
+        """Convert a document stored in MongoDB to a LogFragment.
+
+        :param fragment: The fragment document.
+        :return: The LogFragment object.
+        """
+        return LogFragment(
+            fragment["job_id"],
+            fragment["log_type"],
+            fragment["phase"],
+            fragment["fragment_number"],
+            fragment["timestamp"],
+            fragment["log_data"],
         )
 
     def format_logs_as_results(self, job_id: str, result_data: dict) -> dict:
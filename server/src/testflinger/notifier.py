@@ -0,0 +1,81 @@
+# Copyright (C) 2026 Canonical
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Notify waiting requests when jobs become available or are updated."""
+
+import threading
+from collections.abc import Iterable
+
+
+class JobNotifier:
+    """Wake up requests waiting for a change on a set of keys.
+
+    Keys are queue names when agents are waiting for a job to become
+    available, or job IDs when clients are waiting for new output or state
+    changes of a job.
+
+    Waiting is done on a ``threading.Event``, which the gevent workers used
+    to deploy the server monkey-patch, so each waiting agent only holds a
+    greenlet rather than a worker thread.
+
+    Notifications are only delivered within the current process, so
+    waiters should still re-check the database periodically to pick up
+    jobs that were submitted through other workers.
+    """
+
+    def __init__(self):
+        """Initialize the notifier with no waiters."""
+        self._lock = threading.Lock()
+        self._waiters: dict[str, set[threading.Event]] = {}
+
+    def notify(self, key: str):
+        """Wake up everything waiting on the specified key.
+
+        :param key: Queue name or job ID that has been updated
+        """
+        with self._lock:
+            waiters = self._waiters.pop(key, set())
+        for event in waiters:
+            event.set()
+
+    def wait(self, keys: Iterable[str], timeout: float) -> bool:
+        """Wait until any of the specified keys is notified.
+
+        :param keys: Queue names or job IDs to wait on
+        :param timeout: Maximum number of seconds to wait
+        :return: True if notified, False if the timeout expired
+        """
+        keys = set(keys)
+        event = threading.Event()
+        with self._lock:
+            for key in keys:
+                self._waiters.setdefault(key, set()).add(event)
+        try:
+            return event.wait(timeout)
+        finally:
+            with self._lock:
+                for key in keys:
+                    waiters = self._waiters.get(key)
+                    if waiters is None:
+                        continue
+                    waiters.discard(event)
+                    if not waiters:
+                        del self._waiters[key]
+
+
+# Keyed by queue name, notified when a job becomes available
+job_notifier = JobNotifier()
+# Keyed by job ID, notified when a job has new output or a new state
+result_notifier = JobNotifier()
@@ -30,7 +30,7 @@ from pymongo.errors import DuplicateKeyError, EncryptionError, PyMongoError
 
 from testflinger.database import get_mongo_uri
 from testflinger.secrets.exceptions import StoreError
-from testflinger.secrets.mongo import MongoStore
+from testflinger.secrets.mongo import DataKeyListener, MongoStore
 from testflinger.secrets.store import SecretsStore
 from testflinger.secrets.vault import VaultStore
 
@@ -48,6 +48,12 @@ logger.addHandler(handler)
 KEY_VAULT_DATABASE = "encryption"
 KEY_VAULT_COLLECTION = "__keyVault"
 
+# How long the unwrapped data key is kept in memory to decrypt secrets
+# without fetching it from the key vault again, in seconds
+DATA_KEY_CACHE_TTL = int(
+    os.environ.get("TESTFLINGER_SECRETS_KEY_CACHE_TTL", "600")
+)
+
 
 def setup_vault_store() -> VaultStore:
     """
@@ -104,6 +110,7 @@ def _make_cipher(
     master_key: bytes,
     key_vault_namespace: str,
     kms_providers: dict | None = None,
+    key_cache_ttl: int | None = None,
 ) -> ClientEncryption:
     """Create a ClientEncryption instance for the given master key.
 
@@ -111,12 +118,17 @@ def _make_cipher(
     :param master_key: Raw master key bytes.
     :param key_vault_namespace: Fully-qualified key vault namespace.
     :param kms_providers: Optional KMS providers map.
+    :param key_cache_ttl: Optional time to keep unwrapped data keys cached,
+        in seconds.
     """
     return ClientEncryption(
         kms_providers=kms_providers or {"local": {"key": master_key}},
         key_vault_namespace=key_vault_namespace,
         key_vault_client=key_vault_client,
         codec_options=CodecOptions(),
+        key_expiration_ms=(
+            key_cache_ttl * 1000 if key_cache_ttl is not None else None
+        ),
     )
 
 
@@ -148,12 +160,22 @@ def setup_mongo_store() -> MongoStore | None:
     # Explicit Client-Side Field-Level Encryption
     # Reference: https://www.mongodb.com/docs/manual/core/csfle/fundamentals/manual-encryption/
     # PyMongo docs: https://pymongo.readthedocs.io/en/stable/examples/encryption.html#explicit-encryption-and-decryption
-    client = MongoClient(mongo_url)
+    # the data keys fetched from the key vault are counted by the listener,
+    # to tell how often decrypting a secret finds the data key cached
+    key_vault_namespace = f"{KEY_VAULT_DATABASE}.{KEY_VAULT_COLLECTION}"
+    data_key_listener = DataKeyListener(key_vault_namespace)
 
     # Production instance should use a dedicated client for the key vault.
     # For dev testing, reuse the same MongoClient instance if URI not provided.
     key_vault_uri = os.environ.get("TESTFLINGER_KEY_VAULT_URI")
-    key_vault_client = MongoClient(key_vault_uri) if key_vault_uri else client
+    if key_vault_uri:
+        client = MongoClient(mongo_url)
+        key_vault_client = MongoClient(
+            key_vault_uri, event_listeners=[data_key_listener]
+        )
+    else:
+        client = MongoClient(mongo_url, event_listeners=[data_key_listener])
+        key_vault_client = client
 
     # human-readable name for the data key that encrypts the secrets
     key_name = "testflinger-secrets"
@@ -162,7 +184,8 @@ def setup_mongo_store() -> MongoStore | None:
     cipher = _make_cipher(
         key_vault_client=key_vault_client,
         master_key=master_key,
-        key_vault_namespace=f"{KEY_VAULT_DATABASE}.{KEY_VAULT_COLLECTION}",
+        key_vault_namespace=key_vault_namespace,
+        key_cache_ttl=DATA_KEY_CACHE_TTL,
     )
 
     # Ensure the unique partial index on keyAltNames exists so that concurrent
@@ -192,7 +215,9 @@ def setup_mongo_store() -> MongoStore | None:
             f"Failed to access the key vault collection: {error}"
         ) from error
 
-    return MongoStore(client, cipher, key_name)
+    return MongoStore(
+        client, cipher, key_name, data_key_listener=data_key_listener
+    )
 
 
 def setup_secrets_store() -> SecretsStore | None:
@@ -15,15 +15,70 @@
 
 """A Mongo-based implementation for the Testflinger secrets store."""
 
+import threading
+import time
+from collections.abc import Iterable
 from datetime import datetime, timedelta, timezone
 
-from pymongo import MongoClient
+from prometheus_client import Counter, Histogram
+from pymongo import MongoClient, monitoring
 from pymongo.encryption import Algorithm, ClientEncryption
 from pymongo.errors import ConnectionFailure, EncryptionError, OperationFailure
 
-from testflinger.secrets.exceptions import AccessError, StoreError
+from testflinger.secrets.exceptions import (
+    AccessError,
+    SecretsError,
+    StoreError,
+)
 from testflinger.secrets.store import DEFAULT_SECRET_EXPIRATION, SecretsStore
 
+decrypt_latency_metric = Histogram(
+    "secrets_decrypt_duration_seconds",
+    "Time taken to decrypt a secret value",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, float("inf")),
+    namespace="testflinger",
+)
+data_key_cache_metric = Counter(
+    "secrets_data_key_cache",
+    "Number of secret decryptions, by whether the data key was cached",
+    ["result"],
+    namespace="testflinger",
+)
+
+
+class DataKeyListener(monitoring.CommandListener):
+    """Count the data keys fetched from the key vault by each thread.
+
+    The data key used to decrypt secrets is fetched from the key vault and
+    unwrapped with the master key only when it isn't cached already, so
+    this tells whether a decryption found the data key in the cache.
+    """
+
+    def __init__(self, key_vault_namespace: str):
+        """Initialize the listener for the key vault at the given namespace."""
+        self.database, self.collection = key_vault_namespace.split(".", 1)
+        self._local = threading.local()
+
+    @property
+    def fetches(self) -> int:
+        """Return the number of data keys fetched by the current thread."""
+        return getattr(self._local, "fetches", 0)
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        """Count the command if it fetches data keys from the key vault."""
+        if (
+            event.command_name == "find"
+            and event.database_name == self.database
+            and event.command.get("find") == self.collection
+        ):
+            self._local.fetches = self.fetches + 1
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        """Ignore completed commands."""
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        """Ignore failed commands."""
+
 
 class MongoStore(SecretsStore):
     """MongoDB-based secrets store using explicit Client-Side Field Level
@@ -40,14 +95,17 @@ class MongoStore(SecretsStore):
         cipher: ClientEncryption,
         data_key_name: str,
         algorithm: Algorithm = Algorithm.AEAD_AES_256_CBC_HMAC_SHA_512_Random,
+        data_key_listener: DataKeyListener | None = None,
     ):
         """Initialize MongoStore with client, cipher, data key name and
-        (optionally) the algorithm used for encryption.
+        (optionally) the algorithm used for encryption and the listener for
+        the data keys fetched by the cipher.
         """
         self.database = client.get_default_database()
         self.cipher = cipher
         self.data_key_name = data_key_name
         self.algorithm = algorithm
+        self.data_key_listener = data_key_listener
         self._ttl_index_initialized_namespaces = set()
 
     @staticmethod
@@ -101,30 +159,95 @@ class MongoStore(SecretsStore):
         if result is None:
             raise AccessError(f"Unable to access '{key}' under '{namespace}'")
 
-        encrypted_value = result["value"]
+        value = self._decrypt_value(namespace, result)
+
+        # If secret is ephemeral, delete it after reading
+        if result.get("ephemeral", False):
+            self.delete(namespace, key)
+
+        return value
+
+    def read_many(self, namespace: str, keys: Iterable[str]) -> dict[str, str]:
+        """Return the stored values for `keys` under `namespace`.
+
+        All the secrets are fetched with a single query. Keys whose value
+        cannot be read are left out of the result.
+
+        :raises AccessError: if the namespace cannot be accessed
+        :raises StoreError: if there is an issue with the MongoDB store
+        """
+        collection = self.database.secrets[
+            self._normalize_namespace(namespace)
+        ]
+        try:
+            documents = list(
+                collection.find({"key": {"$in": list(set(keys))}})
+            )
+        except OperationFailure as error:
+            raise AccessError(f"Unable to access '{namespace}'") from error
+        except ConnectionFailure as error:
+            raise StoreError(
+                f"Unable to access store for '{namespace}'"
+            ) from error
+
+        values = {}
+        for document in documents:
+            try:
+                values[document["key"]] = self._decrypt_value(
+                    namespace, document
+                )
+            except SecretsError:
+                continue
+
+        # If any secrets are ephemeral, delete them after reading, and
+        # leave them out if they can't be deleted
+        if ephemeral_keys := [
+            document["key"]
+            for document in documents
+            if document.get("ephemeral", False) and document["key"] in values
+        ]:
+            try:
+                collection.delete_many({"key": {"$in": ephemeral_keys}})
+            except (OperationFailure, ConnectionFailure):
+                for key in ephemeral_keys:
+                    del values[key]
+        return values
+
+    def _decrypt_value(self, namespace: str, document: dict) -> str:
+        """Return the decrypted value of a stored secret document.
+
+        :raises AccessError: if the secret has expired
+        :raises StoreError: if the value cannot be decrypted
+        """
+        key = document["key"]
+        encrypted_value = document["value"]
 
         # Deny access to expired secrets while waiting for MongoDB TTL cleanup
-        expire_at = result.get("expire_at")
+        expire_at = document.get("expire_at")
         if expire_at and expire_at.replace(tzinfo=timezone.utc) < datetime.now(
             timezone.utc
         ):
             raise AccessError(f"Expired '{key}' under '{namespace}'")
 
+        listener = self.data_key_listener
+        fetches = listener.fetches if listener else 0
+        start = time.monotonic()
         try:
             decrypted_value = self.cipher.decrypt(encrypted_value)
         except EncryptionError as error:
             raise StoreError(
                 f"Failed to decrypt value for '{key}' under '{namespace}'"
             ) from error
+        decrypt_latency_metric.observe(time.monotonic() - start)
+        if listener:
+            data_key_cache_metric.labels(
+                "miss" if listener.fetches > fetches else "hit"
+            ).inc()
         if decrypted_value is None:
             raise StoreError(
                 f"Failed to decrypt value for '{key}' under '{namespace}'"
             )
 
-        # If secret is ephemeral, delete it after reading
-        if result.get("ephemeral", False):
-            self.delete(namespace, key)
-
         # Return the decrypted value as a UTF-8 string, if possible
         try:
             return decrypted_value.decode("utf-8")
@@ -241,3 +364,31 @@ class MongoStore(SecretsStore):
             )
         except (OperationFailure, ConnectionFailure):
             return False
+
+    def exists_many(self, namespace: str, keys: Iterable[str]) -> set[str]:
+        """Return which of `keys` exist under `namespace`.
+
+        All the secrets are checked with a single query.
+
+        :param namespace: The namespace to check for the secrets.
+        :param keys: The keys for the secrets to check.
+        :returns: The keys that exist.
+        """
+        try:
+            return {
+                document["key"]
+                for document in self.database.secrets[
+                    self._normalize_namespace(namespace)
+                ].find(
+                    {
+                        "key": {"$in": list(set(keys))},
+                        "$or": [
+                            {"expire_at": {"$exists": False}},
+                            {"expire_at": {"$gt": datetime.now(timezone.utc)}},
+                        ],
+                    },
+                    {"_id": 0, "key": 1},
+                )
+            }
+        except (OperationFailure, ConnectionFailure):
+            return set()
@@ -16,8 +16,11 @@
 """Abstract base class defining the interface to the secrets store."""
 
 from abc import ABC, abstractmethod
+from collections.abc import Iterable
 from datetime import datetime
 
+from testflinger.secrets.exceptions import SecretsError
+
 DEFAULT_SECRET_EXPIRATION = 60 * 60 * 24 * 365  # 1 year
 
 
@@ -64,3 +67,30 @@ class SecretsStore(ABC):
     def exists(self, namespace: str, key: str) -> bool:
         """Validate `key` existence under `namespace`, if any."""
         raise NotImplementedError
+
+    def read_many(self, namespace: str, keys: Iterable[str]) -> dict[str, str]:
+        """Return the stored values for `keys` under `namespace`.
+
+        Keys whose value cannot be read are left out of the result, so
+        implementations can read all the keys at once instead of one by one.
+
+        :param namespace: the namespace under which the secrets are stored
+        :param keys: the keys for the secrets to read
+        :returns: A mapping from each key that could be read to its value.
+        """
+        values = {}
+        for key in set(keys):
+            try:
+                values[key] = self.read(namespace, key)
+            except SecretsError:
+                continue
+        return values
+
+    def exists_many(self, namespace: str, keys: Iterable[str]) -> set[str]:
+        """Return which of `keys` exist under `namespace`.
+
+        :param namespace: the namespace under which the secrets are stored
+        :param keys: the keys for the secrets to check
+        :returns: The keys that exist.
+        """
+        return {key for key in set(keys) if self.exists(namespace, key)}
@@ -15,6 +15,8 @@
 
 """A Vault-based implementation for the Testflinger secrets store."""
 
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 import hvac
@@ -22,11 +24,15 @@ import requests
 
 from testflinger.secrets.exceptions import (
     AccessError,
+    SecretsError,
     StoreError,
     UnexpectedError,
 )
 from testflinger.secrets.store import DEFAULT_SECRET_EXPIRATION, SecretsStore
 
+# Maximum number of concurrent requests to Vault when reading many secrets
+VAULT_MAX_CONCURRENCY = 8
+
 
 class VaultStore(SecretsStore):
     """A Vault-based secrets store implementation."""
@@ -166,3 +172,45 @@ class VaultStore(SecretsStore):
             requests.exceptions.ConnectionError,
         ):
             return False
+
+    def read_many(self, namespace: str, keys: Iterable[str]) -> dict[str, str]:
+        """Return the stored values for `keys` under `namespace`.
+
+        Each secret is a separate request to Vault, so they are read
+        concurrently. Keys whose value cannot be read are left out.
+        """
+        keys = set(keys)
+        if len(keys) <= 1:
+            return super().read_many(namespace, keys)
+
+        def read(key: str) -> str | None:
+            try:
+                return self.read(namespace, key)
+            except SecretsError:
+                return None
+
+        with ThreadPoolExecutor(
+            max_workers=min(len(keys), VAULT_MAX_CONCURRENCY)
+        ) as executor:
+            values = dict(zip(keys, executor.map(read, keys), strict=True))
+        return {
+            key: value for key, value in values.items() if value is not None
+        }
+
+    def exists_many(self, namespace: str, keys: Iterable[str]) -> set[str]:
+        """Return which of `keys` exist under `namespace`.
+
+        Each secret is a separate request to Vault, so they are checked
+        concurrently.
+        """
+        keys = set(keys)
+        if len(keys) <= 1:
+            return super().exists_many(namespace, keys)
+
+        with ThreadPoolExecutor(
+            max_workers=min(len(keys), VAULT_MAX_CONCURRENCY)
+        ) as executor:
+            found = executor.map(lambda key: self.exists(namespace, key), keys)
+            return {
+                key for key, exists in zip(keys, found, strict=True) if exists
+            }
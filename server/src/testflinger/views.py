@@ -39,6 +39,9 @@ from testflinger.logs import MongoLogHandler
 
 views = APIBlueprint("testflinger", __name__, enable_openapi=False)
 
+# Number of jobs shown on each page of the jobs view by default
+JOBS_PAGE_SIZE = 100
+
 
 @views.before_request
 def require_login():
@@ -184,16 +187,16 @@ def agent_detail(agent_id):
         for queue in agent_info.get("queues", [])
     }
 
+    queue_names = agent_info.pop("queues", [])
+    job_counts = database.get_queue_job_counts(queue_names)
     queue_info = []
-    for queue_name in agent_info.pop("queues", []):
+    for queue_name in queue_names:
         queue_data = mongo.db.queues.find_one({"name": queue_name})
         if not queue_data:
             # If it's not an advertised queue, create some dummy data
             queue_data = {"description": ""}
         queue_data["name"] = queue_name
-        queue_data["numjobs"] = database.get_num_incomplete_jobs_on_queue(
-            queue_name
-        )
+        queue_data["numjobs"] = num_incomplete_jobs(job_counts.get(queue_name))
         queue_info.append(queue_data)
 
     agent_info["queues"] = queue_info
@@ -230,9 +233,46 @@ def agent_detail(agent_id):
 
 @views.route("/jobs")
 def jobs():
-    """Jobs view."""
-    jobs_data = mongo.db.jobs.find(sort=[("created_at", -1)])
-    return render_template("jobs.html", jobs=jobs_data)
+    """Jobs view, paginated from the newest job."""
+    start_date = request.args.get("start", "")
+    stop_date = request.args.get("stop", "")
+    try:
+        limit = min(int(request.args.get("limit", JOBS_PAGE_SIZE)), 1000)
+        # Both dates are optional and include the whole day
+        start_datetime = (
+            datetime.strptime(start_date, "%Y-%m-%d").replace(
+                tzinfo=timezone.utc
+            )
+            if start_date
+            else None
+        )
+        stop_datetime = (
+            datetime.strptime(stop_date, "%Y-%m-%d").replace(
+                tzinfo=timezone.utc
+            )
+            + timedelta(days=1)
+            if stop_date
+            else None
+        )
+        jobs_data, newer, older = database.get_jobs_page(
+            {},
+            max(limit, 1),
+            after=request.args.get("after"),
+            before=request.args.get("before"),
+            start_datetime=start_datetime,
+            stop_datetime=stop_datetime,
+        )
+    except ValueError as exc:
+        return make_response(str(exc), HTTPStatus.BAD_REQUEST)
+
+    return render_template(
+        "jobs.html",
+        jobs=jobs_data,
+        newer=newer,
+        older=older,
+        start=start_date,
+        stop=stop_date,
+    )
 
 
 @views.route("/jobs/<job_id>")
@@ -292,14 +332,20 @@ def queues_data():
             {"name": queue_name, "description": "", "numjobs": 0}
         )
 
-    # Get job counts for each queue
+    # Get job counts for all queues at once
+    job_counts = database.get_queue_job_counts()
     for queue in queue_data:
-        queue["numjobs"] = database.get_num_incomplete_jobs_on_queue(
-            queue["name"]
-        )
+        queue["numjobs"] = num_incomplete_jobs(job_counts.get(queue["name"]))
     return queue_data
 
 
+def num_incomplete_jobs(job_counts: dict | None) -> int:
+    """Return the number of waiting and running jobs from job counts."""
+    if not job_counts:
+        return 0
+    return job_counts["waiting"] + job_counts["running"]
+
+
 @views.route("/queues/<queue_name>")
 def queue_detail(queue_name):
     """Queue detailed view."""
@@ -320,11 +366,9 @@ def queue_detail(queue_name):
 
     # Get the percentiles of wait times for this queue
     wait_times = database.get_queue_wait_times([queue_name])
-    try:
-        wait_times = wait_times[0]["wait_times"]
-    except (IndexError, KeyError):
-        wait_times = []
-    queue_percentile_data = database.calculate_percentiles(wait_times)
+    queue_percentile_data = database.calculate_percentiles(
+        wait_times.get(queue_name, {})
+    )
 
     # Convert the wait times to human-readable strings
     for key, value in queue_percentile_data.items():
@@ -0,0 +1,276 @@
+# Copyright (C) 2026 Canonical
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Deliver job status updates to webhooks in the background."""
+
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from http import HTTPStatus
+
+import requests
+from prometheus_client import Gauge, Histogram
+from pymongo import ReturnDocument
+from requests.adapters import HTTPAdapter
+
+from testflinger import database
+
+logger = logging.getLogger(__name__)
+
+# How long to wait for a webhook to respond, in seconds
+WEBHOOK_TIMEOUT = 10
+# How long a worker may take to deliver an update before another worker can
+# try again, in seconds
+WEBHOOK_LEASE = 60
+# Failed deliveries are retried after an exponentially increasing delay,
+# until they have been attempted this many times
+WEBHOOK_RETRY_DELAY = 5
+WEBHOOK_MAX_RETRY_DELAY = 5 * 60
+WEBHOOK_MAX_ATTEMPTS = 8
+# How often to check the outbox for updates queued by other workers, or
+# that are due to be retried, in seconds
+WEBHOOK_POLL_INTERVAL = 5
+# Which events of a job each update includes: "all" of them, or only the
+# "new" ones not delivered yet, along with the sequence number of the first
+WEBHOOK_EVENTS = os.environ.get("WEBHOOK_EVENTS", "all")
+
+outbox_depth_metric = Gauge(
+    "webhook_outbox_depth",
+    "Number of job status updates waiting to be delivered to webhooks",
+    namespace="testflinger",
+)
+delivery_latency_metric = Histogram(
+    "webhook_delivery_latency_seconds",
+    "Time from queuing a job status update to delivering it to the webhook",
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, float("inf")),
+    namespace="testflinger",
+)
+
+
+class WebhookDispatcher:
+    """Deliver job status updates from the webhook outbox.
+
+    Updates are stored in the ``webhook_outbox`` collection, with one entry
+    per job: a newer update for a job replaces the one that hasn't been
+    delivered yet, and the events to deliver are read from the job when the
+    update is delivered, so they include all the events received so far.
+
+    Each worker process runs a dispatcher thread, and entries are leased
+    before they are delivered, so that only one worker delivers each update.
+    """
+
+    def __init__(self):
+        """Initialize the dispatcher without starting it."""
+        self._wakeup = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._started = False
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._session.mount("http://", HTTPAdapter(pool_maxsize=4))
+        self._session.mount("https://", HTTPAdapter(pool_maxsize=4))
+
+    def start(self):
+        """Start delivering updates in a background thread."""
+        with self._lock:
+            self._started = True
+            # a worker forked from the process the dispatcher was started
+            # in doesn't inherit its thread, so it is started again
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="webhook-dispatcher", daemon=True
+                )
+                self._thread.start()
+
+    def enqueue(self, job_id: str, webhook: str, payload: dict):
+        """Queue a status update for delivery to the webhook of a job.
+
+        :param job_id: UUID as a string for the job
+        :param webhook: URL of the webhook to deliver the update to
+        :param payload: The status update to deliver, without the events
+        """
+        now = datetime.now(timezone.utc)
+        database.mongo.db.webhook_outbox.update_one(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "webhook": webhook,
+                    "payload": payload,
+                    "queued_at": now,
+                    "next_attempt": now,
+                    "attempts": 0,
+                },
+                "$inc": {"version": 1},
+            },
+            upsert=True,
+        )
+        if self._started:
+            self.start()
+            self._wakeup.set()
+
+    def _run(self):
+        """Deliver updates until the process exits."""
+        while True:
+            try:
+                self.dispatch_pending()
+            except Exception:
+                logger.exception("Unable to dispatch webhook updates")
+            self._wakeup.wait(WEBHOOK_POLL_INTERVAL)
+            self._wakeup.clear()
+
+    def dispatch_pending(self):
+        """Deliver all the updates that are due."""
+        outbox = database.mongo.db.webhook_outbox
+        while entry := self._lease_next():
+            self._deliver(entry)
+        outbox_depth_metric.set(outbox.count_documents({}))
+
+    def _lease_next(self) -> dict | None:
+        """Lease the next update that is due for delivery, if any."""
+        now = datetime.now(timezone.utc)
+        return database.mongo.db.webhook_outbox.find_one_and_update(
+            {
+                "next_attempt": {"$lte": now},
+                "$or": [
+                    {"leased_until": {"$exists": False}},
+                    {"leased_until": {"$lte": now}},
+                ],
+            },
+            {"$set": {"leased_until": now + timedelta(seconds=WEBHOOK_LEASE)}},
+            sort=[("next_attempt", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _deliver(self, entry: dict):
+        """Deliver a leased update, and remove it or schedule a retry."""
+        job = database.mongo.db.jobs.find_one(
+            {"job_id": entry["_id"]},
+            {"_id": False, "status_events": True, "webhook_events_sent": True},
+        )
+        events = (job or {}).get("status_events", [])
+        payload = dict(entry["payload"])
+        if WEBHOOK_EVENTS == "new":
+            sent = (job or {}).get("webhook_events_sent", 0)
+            events = events[sent:]
+            if not events:
+                self._remove(entry)
+                return
+            payload["sequence"] = sent
+        payload["events"] = events
+
+        headers = {}
+        if webhook_auth := os.environ.get("WEBHOOK_AUTH"):
+            headers = {"Authorization": f"Bearer {webhook_auth}"}
+        try:
+            response = self._session.put(
+                entry["webhook"],
+                json=payload,
+                headers=headers,
+                timeout=WEBHOOK_TIMEOUT,
+                allow_redirects=False,
+            )
+        except requests.exceptions.RequestException as error:
+            logger.warning(
+                "Webhook for job %s failed: %s", entry["_id"], error
+            )
+            self._retry(entry)
+            return
+
+        if response.ok:
+            if "sequence" in payload:
+                database.mongo.db.jobs.update_one(
+                    {"job_id": entry["_id"]},
+                    {
+                        "$max": {
+                            "webhook_events_sent": payload["sequence"]
+                            + len(events)
+                        }
+                    },
+                )
+            queued_at = entry["queued_at"].replace(tzinfo=timezone.utc)
+            delivery_latency_metric.observe(
+                (datetime.now(timezone.utc) - queued_at).total_seconds()
+            )
+            self._remove(entry)
+        elif response.status_code in (
+            HTTPStatus.UNAUTHORIZED,
+            HTTPStatus.FORBIDDEN,
+        ):
+            # the webhook authentication is no longer valid or missing, which
+            # needs to be fixed in the server configuration by an admin
+            logger.error(
+                "Webhook authentication failed for job %s", entry["_id"]
+            )
+            self._retry(entry)
+        elif response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR or (
+            response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+        ):
+            self._retry(entry)
+        else:
+            logger.warning(
+                "Webhook rejected update for job %s (%s): %s",
+                entry["_id"],
+                response.status_code,
+                response.text,
+            )
+            self._remove(entry)
+
+    def _retry(self, entry: dict):
+        """Schedule another attempt to deliver an update."""
+        attempts = entry.get("attempts", 0) + 1
+        if attempts >= WEBHOOK_MAX_ATTEMPTS:
+            logger.error(
+                "Giving up on webhook update for job %s after %d attempts",
+                entry["_id"],
+                attempts,
+            )
+            self._remove(entry)
+            return
+        delay = min(
+            WEBHOOK_RETRY_DELAY * 2 ** (attempts - 1), WEBHOOK_MAX_RETRY_DELAY
+        )
+        # a newer update queued in the meantime is attempted right away
+        outbox = database.mongo.db.webhook_outbox
+        result = outbox.update_one(
+            {"_id": entry["_id"], "version": entry["version"]},
+            {
+                "$set": {
+                    "attempts": attempts,
+                    "next_attempt": datetime.now(timezone.utc)
+                    + timedelta(seconds=delay),
+                },
+                "$unset": {"leased_until": ""},
+            },
+        )
+        if not result.matched_count:
+            self._release(entry)
+
+    def _remove(self, entry: dict):
+        """Remove a delivered update, unless a newer one has been queued."""
+        outbox = database.mongo.db.webhook_outbox
+        result = outbox.delete_one(
+            {"_id": entry["_id"], "version": entry["version"]}
+        )
+        if not result.deleted_count:
+            self._release(entry)
+
+    def _release(self, entry: dict):
+        """Release the lease on an update, so it can be delivered again."""
+        database.mongo.db.webhook_outbox.update_one(
+            {"_id": entry["_id"]}, {"$unset": {"leased_until": ""}}
+        )
+
+
+webhook_dispatcher = WebhookDispatcher()
@@ -52,6 +52,12 @@ class MongoClientMock(mongomock.MongoClient):
         return super().start_session(*args, **kwargs)
 
 
+@pytest.fixture(autouse=True)
+def disable_caches(monkeypatch):
+    """Disable caching, as tests often write to the database directly."""
+    monkeypatch.setattr("testflinger.cache.CACHE_TTL", 0)
+
+
 @pytest.fixture(name="mongo_app")
 def mongo_app_fixture(monkeypatch):
     """Create a pytest fixture for database and app."""
@@ -60,6 +66,8 @@ def mongo_app_fixture(monkeypatch):
     mock_mongo = MongoClientMock()
     database.mongo = mock_mongo
     app = application.create_flask_app(TestingConfig)
+    # Log fragments rely on a unique index to ignore duplicates
+    database.create_log_fragment_index()
     yield app.test_client(), mock_mongo.db
 
 
@@ -139,9 +147,15 @@ def app_with_store(mocker, monkeypatch):
             }
         )
 
-    # mock store
+    # mock store, reading and checking many secrets one by one
     mock_secrets_store = mocker.Mock(spec=SecretsStore)
     mock_secrets_store.write.return_value = None
+    mock_secrets_store.read_many.side_effect = lambda namespace, keys: (
+        SecretsStore.read_many(mock_secrets_store, namespace, keys)
+    )
+    mock_secrets_store.exists_many.side_effect = lambda namespace, keys: (
+        SecretsStore.exists_many(mock_secrets_store, namespace, keys)
+    )
 
     # create app
     flask_app = application.create_flask_app(
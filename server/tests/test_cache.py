@@ -0,0 +1,84 @@
+# Copyright (C) 2026 Canonical
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Unit tests for the in-process caches."""
+
+from unittest.mock import patch
+
+import mongomock
+import pytest
+
+from testflinger import cache, database
+
+
+@pytest.fixture(name="enable_caches")
+def enable_caches_fixture(monkeypatch):
+    """Enable caching with a long TTL, starting with empty caches."""
+    monkeypatch.setattr("testflinger.cache.CACHE_TTL", 60)
+    cache.clear_caches()
+    yield
+    cache.clear_caches()
+
+
+def test_ttl_cache_hit_and_miss(enable_caches):
+    """Test results are reused until the cache is cleared."""
+    calls = []
+    hits = cache.cache_metric.labels("lookup", "hit")
+
+    @cache.ttl_cache
+    def lookup(key):
+        calls.append(key)
+        return {"key": key}
+
+    hits_before = hits._value.get()
+    assert lookup("a") == {"key": "a"}
+    # Modifying a returned value doesn't modify the cached one
+    lookup("a")["key"] = "b"
+    assert lookup("a") == {"key": "a"}
+    assert calls == ["a"]
+    assert hits._value.get() - hits_before == 2
+
+    cache.clear_caches()
+    lookup("a")
+    assert calls == ["a", "a"]
+
+
+def test_ttl_cache_expires(enable_caches, monkeypatch):
+    """Test results are looked up again once they expire."""
+    calls = []
+
+    @cache.ttl_cache
+    def lookup():
+        calls.append(None)
+
+    lookup()
+    monkeypatch.setattr("testflinger.cache.time.monotonic", lambda: 1e12)
+    lookup()
+    assert len(calls) == 2
+
+
+@patch("testflinger.database.mongo", new_callable=mongomock.MongoClient)
+def test_restricted_queues_invalidated_on_write(mock_mongo, enable_caches):
+    """Test restricted queue lookups see writes made through this process."""
+    mock_mongo.db.client_permissions.insert_one({"client_id": "client1"})
+    assert not database.check_queue_restricted("queue1")
+
+    database.add_restricted_queue("queue1", "client1")
+    assert database.check_queue_restricted("queue1")
+    assert database.get_restricted_queues_owners() == {"queue1": ["client1"]}
+
+    database.delete_restricted_queue("queue1", "client1")
+    assert not database.check_queue_restricted("queue1")
+    assert database.get_restricted_queues_owners() == {}
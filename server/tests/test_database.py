@@ -15,6 +15,8 @@
 #
 """Unit tests for testflinger database functions."""
 
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
 from unittest.mock import patch
 
 import mongomock
@@ -22,9 +24,22 @@ import pytest
 from mongomock.gridfs import enable_gridfs_integration
 
 from testflinger.database import (
+    BLOB_BUCKET,
     DEFAULT_EXPIRATION,
+    GRIDFS_CHUNKS_INDEX,
+    GRIDFS_FILES_INDEX,
+    JOB_DISPATCH_INDEX,
+    LEGACY_JOB_STATE_INDEX,
+    LEGACY_WAIT_TIMES_COLLECTION,
+    LOG_FRAGMENT_INDEX,
     create_indexes,
+    create_log_fragment_index,
+    get_job_position,
+    pop_job,
+    remove_unused_blobs,
+    retrieve_blob,
     retrieve_file,
+    save_blob,
     save_file,
 )
 
@@ -56,6 +71,47 @@ def test_save_file_as_chunks(mock_mongo):
         assert chunk["uploadDate"] == file_doc["uploadDate"]
 
 
+@patch("testflinger.database.GRIDFS_CHUNK_BATCH", 2)
+@patch("testflinger.database.GRIDFS_CHUNK_SIZE", 4)
+@patch("testflinger.database.mongo", new_callable=mongomock.MongoClient)
+def test_save_file_streamed(mock_mongo):
+    """Test save_file reads and stores a stream in several chunks."""
+    content = b"hello streamed world"
+    assert save_file(BytesIO(content), "hello.txt") == len(content)
+
+    file_doc = mock_mongo.db["fs.files"].find_one({"filename": "hello.txt"})
+    assert file_doc["length"] == len(content)
+    chunks = mock_mongo.db["fs.chunks"].find({"files_id": file_doc["_id"]})
+    assert [chunk["n"] for chunk in chunks] == [0, 1, 2, 3, 4]
+    assert retrieve_file("hello.txt").read() == content
+
+
+class ShortReader(BytesIO):
+    """Stream returning fewer bytes than asked for, like a raw stream."""
+
+    def read(self, size=-1):
+        """Read at most 3 bytes."""
+        return super().read(min(size, 3) if size >= 0 else 3)
+
+
+@patch("testflinger.database.GRIDFS_CHUNK_SIZE", 4)
+@patch("testflinger.database.mongo", new_callable=mongomock.MongoClient)
+def test_save_file_short_reads(mock_mongo):
+    """Test every chunk but the last is full when reads return less."""
+    content = b"hello streamed world!"
+    assert save_file(ShortReader(content), "hello.txt") == len(content)
+
+    file_doc = mock_mongo.db["fs.files"].find_one({"filename": "hello.txt"})
+    chunks = list(
+        mock_mongo.db["fs.chunks"]
+        .find({"files_id": file_doc["_id"]})
+        .sort("n")
+    )
+    assert [chunk["n"] for chunk in chunks] == [0, 1, 2, 3, 4, 5]
+    assert [len(chunk["data"]) for chunk in chunks] == [4, 4, 4, 4, 4, 1]
+    assert retrieve_file("hello.txt").read() == content
+
+
 @patch("testflinger.database.mongo", new_callable=mongomock.MongoClient)
 def test_retrieve_file_returns_stored_content(mock_mongo):
     """Test retrieve_file returns the content stored with save_file."""
@@ -65,6 +121,53 @@ def test_retrieve_file_returns_stored_content(mock_mongo):
     assert result.read() == content
 
 
+@patch("testflinger.database.mongo", new_callable=mongomock.MongoClient)
+def test_save_blob_references_existing(mock_mongo):
+    """Test save_blob references an identical archive instead of a copy."""
+    archive_id, length = save_blob(b"archive", "client")
+    assert save_blob(BytesIO(b"archive"), "client") == (archive_id, length)
+
+    blob = mock_mongo.db.attachment_blobs.find_one({"_id": archive_id})
+    assert blob["refcount"] == 2
+    assert mock_mongo.db[f"{BLOB_BUCKET}.files"].count_documents({}) == 1
+    assert retrieve_blob(archive_id).read() == b"archive"
+
+
+@patch("testflinger.database.mongo", new_callable=mongomock.MongoClient)
+def test_save_blob_per_owner(mock_mongo):
+    """Test save_blob doesn't share archives between clients."""
+    archive_id, _ = save_blob(b"archive", "client")
+    other_id, _ = save_blob(b"archive", "other-client")
+    assert archive_id != other_id
+    assert archive_id["sha256"] == other_id["sha256"]
+    assert mock_mongo.db[f"{BLOB_BUCKET}.files"].count_documents({}) == 2
+
+
+@patch("testflinger.database.mongo", new_callable=mongomock.MongoClient)
+def test_remove_unused_blobs(mock_mongo):
+    """Test only archives released for long enough are removed."""
+    unused, _ = save_blob(b"unused")
+    used, _ = save_blob(b"used")
+    mock_mongo.db.attachment_blobs.update_one(
+        {"_id": unused}, {"$set": {"refcount": 0}}
+    )
+    mock_mongo.db.attachment_blobs.update_many(
+        {},
+        {
+            "$set": {
+                "last_used": datetime.now(timezone.utc)
+                - timedelta(seconds=DEFAULT_EXPIRATION + 60)
+            }
+        },
+    )
+
+    remove_unused_blobs()
+    with pytest.raises(FileNotFoundError):
+        retrieve_blob(unused)
+    assert retrieve_blob(used).read() == b"used"
+    assert mock_mongo.db[f"{BLOB_BUCKET}.chunks"].count_documents({}) == 1
+
+
 @patch("testflinger.database.mongo", new_callable=mongomock.MongoClient)
 def test_retrieve_file_raises_for_missing_file(mock_mongo):
     """Test retrieve_file raises FileNotFoundError for a non-existent file."""
@@ -107,3 +210,157 @@ def test_create_indexes_gridfs_collections(mock_mongo):
     assert chunks_ttl.get("expireAfterSeconds") == DEFAULT_EXPIRATION
     assert files_ttl is not None
     assert files_ttl.get("expireAfterSeconds") == DEFAULT_EXPIRATION
+
+
+@patch("testflinger.database.mongo", new_callable=mongomock.MongoClient)
+def test_create_indexes_gridfs_lookups(mock_mongo):
+    """Test the GridFS lookup indexes are created on every bucket."""
+    with (
+        patch.object(mock_mongo.db.jobs, "create_index"),
+        patch.object(mock_mongo.db.logs, "create_index"),
+    ):
+        create_indexes()
+
+    for bucket in ("fs", BLOB_BUCKET):
+        chunks_indexes = mock_mongo.db[f"{bucket}.chunks"].index_information()
+        files_indexes = mock_mongo.db[f"{bucket}.files"].index_information()
+        assert any(
+            info["key"] == GRIDFS_CHUNKS_INDEX and info.get("unique")
+            for info in chunks_indexes.values()
+        )
+        assert any(
+            info["key"] == GRIDFS_FILES_INDEX
+            for info in files_indexes.values()
+        )
+
+
+@patch("testflinger.database.mongo", new_callable=mongomock.MongoClient)
+def test_create_indexes_job_dispatch(mock_mongo):
+    """Test the compound index covering the pop_job query is created."""
+    with (
+        patch.object(mock_mongo.db.jobs, "create_index") as jobs_index,
+        patch.object(mock_mongo.db.logs, "create_index"),
+    ):
+        create_indexes()
+    jobs_index.assert_any_call(JOB_DISPATCH_INDEX)
+
+
+@patch("testflinger.database.mongo", new_callable=mongomock.MongoClient)
+def test_create_indexes_drops_legacy_job_index(mock_mongo):
+    """Test the index replaced by the dispatch index is dropped."""
+    mock_mongo.db.jobs.create_index(LEGACY_JOB_STATE_INDEX)
+    with (
+        patch.object(mock_mongo.db.jobs, "create_index"),
+        patch.object(mock_mongo.db.logs, "create_index"),
+    ):
+        create_indexes()
+        # creating the indexes again doesn't fail once it is gone
+        create_indexes()
+    assert LEGACY_JOB_STATE_INDEX not in [
+        info["key"] for info in mock_mongo.db.jobs.index_information().values()
+    ]
+
+
+@patch("testflinger.database.mongo", new_callable=mongomock.MongoClient)
+def test_create_indexes_drops_legacy_wait_times(mock_mongo):
+    """Test the samples replaced by the wait time histograms are dropped."""
+    mock_mongo.db[LEGACY_WAIT_TIMES_COLLECTION].insert_one(
+        {"name": "queue1", "wait_times": [1.0, 2.0]}
+    )
+    with (
+        patch.object(mock_mongo.db.jobs, "create_index"),
+        patch.object(mock_mongo.db.logs, "create_index"),
+    ):
+        create_indexes()
+    assert (
+        LEGACY_WAIT_TIMES_COLLECTION
+        not in mock_mongo.db.list_collection_names()
+    )
+
+
+@patch("testflinger.database.mongo", new_callable=mongomock.MongoClient)
+def test_create_log_fragment_index_replaces_non_unique(mock_mongo):
+    """Test duplicate fragments are removed to build the unique index."""
+    mock_mongo.db.logs.create_index(LOG_FRAGMENT_INDEX)
+    fragment = {
+        "job_id": "job1",
+        "log_type": "output",
+        "phase": "test",
+        "fragment_number": 0,
+        "log_data": "data",
+    }
+    for _ in range(3):
+        mock_mongo.db.logs.insert_one(dict(fragment))
+    mock_mongo.db.logs.insert_one(dict(fragment, fragment_number=1))
+
+    create_log_fragment_index()
+
+    assert mock_mongo.db.logs.count_documents({"job_id": "job1"}) == 2
+    unique_indexes = [
+        info
+        for info in mock_mongo.db.logs.index_information().values()
+        if info["key"] == LOG_FRAGMENT_INDEX
+    ]
+    assert len(unique_indexes) == 1
+    assert unique_indexes[0].get("unique")
+
+
+def _insert_waiting_job(mock_mongo, job_id, created_at, priority=0):
+    """Insert a waiting job directly into the mocked jobs collection."""
+    mock_mongo.db.jobs.insert_one(
+        {
+            "job_id": job_id,
+            "created_at": created_at,
+            "job_priority": priority,
+            "job_data": {"job_queue": "test"},
+            "result_data": {"job_state": "waiting"},
+        }
+    )
+
+
+@patch("testflinger.database.mongo", new_callable=mongomock.MongoClient)
+def test_pop_job_priority_then_fifo(mock_mongo):
+    """Test jobs are popped by priority first and then oldest first."""
+    now = datetime.now(timezone.utc)
+    _insert_waiting_job(mock_mongo, "newest", now)
+    _insert_waiting_job(mock_mongo, "oldest", now - timedelta(minutes=2))
+    _insert_waiting_job(mock_mongo, "middle", now - timedelta(minutes=1))
+    _insert_waiting_job(mock_mongo, "priority", now, priority=100)
+
+    popped = [pop_job(["test"], "agent1")["job_id"] for _ in range(4)]
+
+    assert popped == ["priority", "oldest", "middle", "newest"]
+    assert pop_job(["test"], "agent1") is None
+
+
+@patch("testflinger.database.mongo", new_callable=mongomock.MongoClient)
+def test_get_job_position_matches_dispatch_order(mock_mongo):
+    """Test job positions follow the order in which jobs are popped."""
+    now = datetime.now(timezone.utc)
+    _insert_waiting_job(mock_mongo, "newest", now)
+    _insert_waiting_job(mock_mongo, "oldest", now - timedelta(minutes=2))
+    _insert_waiting_job(mock_mongo, "tied", now)
+    _insert_waiting_job(mock_mongo, "priority", now, priority=100)
+
+    positions = {
+        job_id: get_job_position(job_id)
+        for job_id in ("priority", "oldest", "newest", "tied")
+    }
+
+    assert positions == {"priority": 0, "oldest": 1, "newest": 2, "tied": 3}
+    pop_job(["test"], "agent1")
+    assert get_job_position("priority") is None
+    assert get_job_position("tied") == 2
+
+
+@patch("testflinger.database.mongo", new_callable=mongomock.MongoClient)
+def test_pop_job_sets_started_at(mock_mongo):
+    """Test pop_job claims the job and stamps started_at together."""
+    created_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    _insert_waiting_job(mock_mongo, "job1", created_at)
+
+    job = pop_job(["test"], "agent1")
+
+    stored = mock_mongo.db.jobs.find_one({"job_id": job["job_id"]})
+    assert stored["result_data"]["job_state"] == "running"
+    assert stored["started_at"] is not None
@@ -19,11 +19,17 @@
 import urllib.parse
 import uuid
 from datetime import datetime, timezone
+from unittest.mock import patch
 
 import pytest
 from testflinger_common.enums import LogType, TestPhase
 
-from testflinger.logs import LogFragment, MongoLogHandler
+from testflinger.database import LOG_FRAGMENT_INDEX
+from testflinger.logs import (
+    LogFragment,
+    MongoLogHandler,
+    validate_log_compression,
+)
 
 
 @pytest.fixture(name="mongo_app_with_outputs")
@@ -75,6 +81,54 @@ def test_store_log_fragment(mongo_app):
     assert log_fragments[1]["log_data"] == "My log data 1"
 
 
+def test_store_log_fragment_twice(mongo_app):
+    """Tests that a fragment posted again is only stored once."""
+    _, mongo = mongo_app
+    job_id = str(uuid.uuid1())
+    mongo.db.logs.create_index(LOG_FRAGMENT_INDEX, unique=True)
+    log_handler = MongoLogHandler(mongo)
+    log_fragment = LogFragment(
+        job_id,
+        LogType.STANDARD_OUTPUT,
+        TestPhase.SETUP,
+        0,
+        datetime.now(timezone.utc),
+        "My log data",
+    )
+    log_handler.store_log_fragment(log_fragment)
+    log_handler.store_log_fragment(log_fragment)
+    log_handler.store_log_fragments([log_fragment])
+    assert mongo.db.logs.count_documents({"job_id": job_id}) == 1
+    assert log_handler.retrieve_logs(
+        job_id, LogType.STANDARD_OUTPUT, TestPhase.SETUP
+    ) == {"last_fragment_number": 0, "log_data": "My log data"}
+
+
+def test_store_log_fragments_overlapping(mongo_app):
+    """Tests that a retried batch only stores the new fragments."""
+    _, mongo = mongo_app
+    job_id = str(uuid.uuid1())
+    mongo.db.logs.create_index(LOG_FRAGMENT_INDEX, unique=True)
+    log_handler = MongoLogHandler(mongo)
+    log_fragments = [
+        LogFragment(
+            job_id,
+            LogType.SERIAL_OUTPUT,
+            TestPhase.TEST,
+            i,
+            datetime.now(timezone.utc),
+            f"line{i}\n",
+        )
+        for i in range(4)
+    ]
+    log_handler.store_log_fragments(log_fragments[:2])
+    log_handler.store_log_fragments(log_fragments[1:])
+    combined_log = log_handler.retrieve_logs(
+        job_id, LogType.SERIAL_OUTPUT, TestPhase.TEST
+    )
+    assert combined_log["log_data"] == "line0\nline1\nline2\nline3\n"
+
+
 def test_retrieve_log_fragments(mongo_app_with_outputs):
     """Tests that log fragments can be retrieved using the log_handler."""
     _, mongo, job_id = mongo_app_with_outputs
@@ -125,6 +179,162 @@ def test_retrieve_logs(mongo_app_with_outputs):
     assert combined_log["log_data"] == combined_log_expected
 
 
+@patch("testflinger.logs.LOG_SEGMENT_SIZE", 40)
+def test_compact_logs(mongo_app_with_outputs):
+    """Tests that compacted logs are merged into segments."""
+    _, mongo, job_id = mongo_app_with_outputs
+    log_handler = MongoLogHandler(mongo)
+    log_handler.compact_logs(job_id)
+    assert mongo.db.logs.count_documents({"job_id": job_id}) == 0
+    # Each fragment is 13 characters long, so 3 fit in each segment
+    assert mongo.db.log_segments.count_documents({"job_id": job_id}) == 4
+    combined_log = log_handler.retrieve_logs(
+        job_id, LogType.STANDARD_OUTPUT, TestPhase.SETUP
+    )
+    assert combined_log["last_fragment_number"] == 9
+    assert combined_log["log_data"] == "".join(
+        [f"My log data {i}" for i in range(10)]
+    )
+
+
+@patch("testflinger.logs.LOG_SEGMENT_SIZE", 40)
+def test_retrieve_log_fragments_compacted(mongo_app_with_outputs):
+    """Tests that compacted logs can be retrieved from a fragment number."""
+    _, mongo, job_id = mongo_app_with_outputs
+    log_handler = MongoLogHandler(mongo)
+    log_handler.compact_logs(job_id)
+    fragments = list(
+        log_handler.retrieve_log_fragments(
+            job_id, LogType.STANDARD_OUTPUT, TestPhase.SETUP, 4
+        )
+    )
+    # The first segment is skipped, the second one is only partially
+    # returned and the rest of them are returned as a whole
+    assert [f.fragment_number for f in fragments] == [4, 5, 8, 9]
+    assert "".join(f.log_data for f in fragments) == "".join(
+        [f"My log data {i}" for i in range(4, 10)]
+    )
+    start_timestamp = datetime(2025, 4, 24, 10, 32, 0, tzinfo=timezone.utc)
+    combined_log = log_handler.retrieve_logs(
+        job_id,
+        LogType.STANDARD_OUTPUT,
+        TestPhase.SETUP,
+        start_timestamp=start_timestamp,
+    )
+    assert combined_log["last_fragment_number"] == 9
+    assert combined_log["log_data"] == "".join(
+        [f"My log data {i}" for i in range(7, 10)]
+    )
+
+
+@patch("testflinger.logs.LOG_SEGMENT_SIZE", 40)
+def test_retrieve_log_fragments_stored_after_compaction(
+    mongo_app_with_outputs,
+):
+    """Tests that fragments posted again after compaction aren't repeated."""
+    _, mongo, job_id = mongo_app_with_outputs
+    log_handler = MongoLogHandler(mongo)
+    log_handler.compact_logs(job_id)
+    log_handler.store_log_fragment(
+        LogFragment(
+            job_id,
+            LogType.STANDARD_OUTPUT,
+            TestPhase.SETUP,
+            4,
+            datetime(2025, 4, 24, 10, 20, 0, tzinfo=timezone.utc),
+            "My log data 4",
+        )
+    )
+    combined_log = log_handler.retrieve_logs(
+        job_id, LogType.STANDARD_OUTPUT, TestPhase.SETUP
+    )
+    assert combined_log["last_fragment_number"] == 9
+    assert combined_log["log_data"] == "".join(
+        [f"My log data {i}" for i in range(10)]
+    )
+
+
+@patch("testflinger.logs.LOG_SEGMENT_SIZE", 40)
+def test_retrieve_log_fragments_during_compaction(mongo_app_with_outputs):
+    """Tests that fragments aren't repeated before they are removed."""
+    _, mongo, job_id = mongo_app_with_outputs
+    log_handler = MongoLogHandler(mongo)
+    fragments = list(mongo.db.logs.find({"job_id": job_id}))
+    with patch.object(mongo.db.logs, "delete_many"):
+        log_handler.compact_logs(job_id)
+    assert mongo.db.logs.count_documents({"job_id": job_id}) == len(fragments)
+    fragments = list(
+        log_handler.retrieve_log_fragments(
+            job_id, LogType.STANDARD_OUTPUT, TestPhase.SETUP, 4
+        )
+    )
+    assert "".join(f.log_data for f in fragments) == "".join(
+        [f"My log data {i}" for i in range(4, 10)]
+    )
+
+
+def test_compact_logs_compressed(mongo_app_with_outputs):
+    """Tests that log segments are stored compressed."""
+    _, mongo, job_id = mongo_app_with_outputs
+    log_handler = MongoLogHandler(mongo)
+    log_handler.compact_logs(job_id)
+    segment = mongo.db.log_segments.find_one({"job_id": job_id})
+    assert segment["codec"] == "zlib"
+    assert isinstance(segment["log_data"], bytes)
+    assert log_handler.retrieve_logs(job_id)["log_data"][
+        "setup_output"
+    ] == "".join([f"My log data {i}" for i in range(10)])
+
+
+@patch("testflinger.logs.LOG_COMPRESSION", "none")
+def test_compact_logs_uncompressed(mongo_app_with_outputs):
+    """Tests that log segments can be stored as plain text."""
+    _, mongo, job_id = mongo_app_with_outputs
+    log_handler = MongoLogHandler(mongo)
+    log_handler.compact_logs(job_id)
+    segment = mongo.db.log_segments.find_one({"job_id": job_id})
+    assert "codec" not in segment
+    assert segment["log_data"] == "".join(
+        [f"My log data {i}" for i in range(10)]
+    )
+
+
+@patch("testflinger.logs.LOG_COMPRESSION", "lzma")
+def test_validate_log_compression_unknown():
+    """Tests that unknown codecs are rejected instead of being ignored."""
+    with pytest.raises(ValueError, match="lzma"):
+        validate_log_compression()
+
+
+def test_compact_logs_twice(mongo_app_with_outputs):
+    """Tests that fragments stored after a compaction are also merged."""
+    _, mongo, job_id = mongo_app_with_outputs
+    log_handler = MongoLogHandler(mongo)
+    log_handler.compact_logs(job_id)
+    log_handler.store_log_fragment(
+        LogFragment(
+            job_id,
+            LogType.STANDARD_OUTPUT,
+            TestPhase.SETUP,
+            10,
+            datetime(2025, 4, 24, 11, 0, 0, tzinfo=timezone.utc),
+            "My log data 10",
+        )
+    )
+    expected_log = "".join([f"My log data {i}" for i in range(11)])
+    assert (
+        log_handler.retrieve_logs(job_id)["log_data"]["setup_output"]
+        == expected_log
+    )
+    log_handler.compact_logs(job_id)
+    assert mongo.db.logs.count_documents({"job_id": job_id}) == 0
+    assert mongo.db.log_segments.count_documents({"job_id": job_id}) == 2
+    assert (
+        log_handler.retrieve_logs(job_id)["log_data"]["setup_output"]
+        == expected_log
+    )
+
+
 def test_output_post_get(mongo_app, agent_auth_header):
     """Test posting output data for a job then reading it back."""
     app, _ = mongo_app
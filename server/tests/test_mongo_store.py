@@ -22,6 +22,7 @@ from unittest.mock import ANY, patch
 
 import pytest
 from bson.binary import Binary
+from prometheus_client import REGISTRY
 from pymongo import MongoClient
 from pymongo.encryption import ClientEncryption
 from pymongo.errors import (
@@ -31,12 +32,12 @@ from pymongo.errors import (
     OperationFailure,
 )
 
-from testflinger.secrets import setup_mongo_store
+from testflinger.secrets import DATA_KEY_CACHE_TTL, setup_mongo_store
 from testflinger.secrets.exceptions import (
     AccessError,
     StoreError,
 )
-from testflinger.secrets.mongo import MongoStore
+from testflinger.secrets.mongo import DataKeyListener, MongoStore
 
 
 class TestMongoStore:
@@ -592,6 +593,123 @@ class TestMongoStore:
             {"_id": 1},
         )
 
+    def test_read_many(
+        self, mongo_store, mock_collection, mock_client_encryption
+    ):
+        """Test reading many secrets with a single query."""
+        expired_time = datetime.now(timezone.utc) - timedelta(seconds=60)
+        mock_collection.find.return_value = [
+            {"key": "key1", "value": Binary(b"value1")},
+            {"key": "key2", "value": Binary(b"value2"), "ephemeral": True},
+            {
+                "key": "expired",
+                "value": Binary(b"expired"),
+                "expire_at": expired_time,
+            },
+        ]
+        mock_client_encryption.decrypt.side_effect = bytes
+
+        result = mongo_store.read_many(
+            "test-namespace", ["key1", "key2", "expired", "missing"]
+        )
+
+        assert result == {"key1": "value1", "key2": "value2"}
+        mock_collection.find.assert_called_once()
+        mock_collection.delete_many.assert_called_once_with(
+            {"key": {"$in": ["key2"]}}
+        )
+
+    def test_read_many_connection_failure(self, mongo_store, mock_collection):
+        """Test read_many with ConnectionFailure raises StoreError."""
+        mock_collection.find.side_effect = ConnectionFailure("Network error")
+
+        with pytest.raises(StoreError):
+            mongo_store.read_many("test-namespace", ["key1", "key2"])
+
+    def test_exists_many(self, mongo_store, mock_collection):
+        """Test checking which of many secrets exist with a single query."""
+        mock_collection.find.return_value = [{"key": "key1"}]
+
+        result = mongo_store.exists_many("test-namespace", ["key1", "key2"])
+
+        assert result == {"key1"}
+        mock_collection.find.assert_called_once_with(
+            {
+                "key": {"$in": ANY},
+                "$or": [
+                    {"expire_at": {"$exists": False}},
+                    {"expire_at": {"$gt": ANY}},
+                ],
+            },
+            {"_id": 0, "key": 1},
+        )
+
+    def test_data_key_cache_metric(
+        self, mock_client, mock_client_encryption, mock_database, mocker
+    ):
+        """Test that decryptions are counted by whether the key was cached."""
+        mock_client.get_default_database.return_value = mock_database
+        listener = DataKeyListener("encryption.__keyVault")
+        store = MongoStore(
+            mock_client,
+            mock_client_encryption,
+            "test-key",
+            data_key_listener=listener,
+        )
+        mock_database.secrets.__getitem__ = mocker.Mock(
+            return_value=mocker.Mock(
+                find=mocker.Mock(
+                    return_value=[
+                        {"key": "key1", "value": Binary(b"value1")},
+                        {"key": "key2", "value": Binary(b"value2")},
+                    ]
+                )
+            )
+        )
+
+        def decrypt(value):
+            # the data key is only fetched for the first decryption
+            if not listener.fetches:
+                listener.started(
+                    mocker.Mock(
+                        command_name="find",
+                        database_name="encryption",
+                        command={"find": "__keyVault"},
+                    )
+                )
+            return bytes(value)
+
+        mock_client_encryption.decrypt.side_effect = decrypt
+
+        def sample(result):
+            return (
+                REGISTRY.get_sample_value(
+                    "testflinger_secrets_data_key_cache_total",
+                    {"result": result},
+                )
+                or 0
+            )
+
+        hits, misses = sample("hit"), sample("miss")
+        store.read_many("test-namespace", ["key1", "key2"])
+
+        assert sample("hit") == hits + 1
+        assert sample("miss") == misses + 1
+
+    def test_data_key_listener_ignores_other_commands(self, mocker):
+        """Test that only data key lookups are counted."""
+        listener = DataKeyListener("encryption.__keyVault")
+
+        listener.started(
+            mocker.Mock(
+                command_name="find",
+                database_name="testflinger_db",
+                command={"find": "jobs"},
+            )
+        )
+
+        assert listener.fetches == 0
+
 
 class TestSetupMongoStore:
     """Test cases for setup_mongo_store function."""
@@ -684,6 +802,21 @@ class TestSetupMongoStore:
         # Verify MongoStore creation
         assert result == mock_store
 
+    def test_setup_mongo_store_caches_data_key(
+        self, mocker, valid_master_key, mock_mongo_setup
+    ):
+        """Test that the unwrapped data key is cached for a while."""
+        mock_client, _, _ = mock_mongo_setup
+        mock_client.__getitem__ = mocker.MagicMock()
+        mock_client_encryption = mocker.patch(
+            "testflinger.secrets.ClientEncryption"
+        )
+
+        setup_mongo_store()
+
+        kwargs = mock_client_encryption.call_args.kwargs
+        assert kwargs["key_expiration_ms"] == DATA_KEY_CACHE_TTL * 1000
+
     def test_setup_mongo_store_success_with_new_key(
         self, mocker, valid_master_key, mock_mongo_setup
     ):
@@ -0,0 +1,51 @@
+# Copyright (C) 2026 Canonical
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Unit tests for the job notifier."""
+
+import threading
+
+from testflinger.notifier import JobNotifier
+
+
+def test_wait_times_out():
+    """Test wait returns False when nothing is notified."""
+    notifier = JobNotifier()
+    assert notifier.wait(["queue1"], timeout=0.1) is False
+
+
+def test_notify_wakes_waiter():
+    """Test notifying a queue wakes up requests waiting on it."""
+    notifier = JobNotifier()
+    timer = threading.Timer(0.1, notifier.notify, args=("queue2",))
+    timer.start()
+    assert notifier.wait(["queue1", "queue2"], timeout=10) is True
+    timer.join()
+
+
+def test_notify_other_queue():
+    """Test notifying a different queue doesn't wake up the waiter."""
+    notifier = JobNotifier()
+    timer = threading.Timer(0.1, notifier.notify, args=("queue2",))
+    timer.start()
+    assert notifier.wait(["queue1"], timeout=0.5) is False
+    timer.join()
+
+
+def test_waiters_removed_after_wait():
+    """Test waiters are unregistered once they stop waiting."""
+    notifier = JobNotifier()
+    notifier.wait(["queue1", "queue2"], timeout=0.01)
+    assert notifier._waiters == {}
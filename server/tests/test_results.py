@@ -15,6 +15,7 @@
 #
 """Unit tests for Testflinger v1 API results endpoint."""
 
+import json
 from datetime import datetime, timezone
 from http import HTTPStatus
 from io import BytesIO
@@ -72,6 +73,38 @@ def test_result_post_baddata(mongo_app, agent_auth_header):
     assert 422 == response.status_code
 
 
+def test_result_state_get(mongo_app, agent_auth_header):
+    """Test that the job state and phase exit codes are returned."""
+    app, _ = mongo_app
+    newjob = app.post("/v1/job", json={"job_queue": "test"})
+    job_id = newjob.json.get("job_id")
+    data = {"status": {"setup": 0, "test": 1}, "job_state": "test"}
+    app.post(f"/v1/result/{job_id}", json=data, headers=agent_auth_header)
+
+    response = app.get(f"/v1/result/{job_id}/state")
+    assert HTTPStatus.OK == response.status_code
+    assert response.json == {
+        "setup_status": 0,
+        "test_status": 1,
+        "job_state": "test",
+    }
+
+
+def test_result_state_get_not_exists(mongo_app):
+    """Test for 204 when getting the state of a nonexistent job."""
+    app, _ = mongo_app
+    output = app.get("/v1/result/11111111-1111-1111-1111-111111111111/state")
+    assert HTTPStatus.NO_CONTENT == output.status_code
+
+
+def test_result_state_get_bad(mongo_app):
+    """Test for error when getting the state of a bad job ID."""
+    app, _ = mongo_app
+    output = app.get("/v1/result/BAD_JOB_ID/state")
+    assert "Invalid job_id specified" in output.text
+    assert HTTPStatus.BAD_REQUEST == output.status_code
+
+
 def test_result_get_with_logs(mongo_app, agent_auth_header):
     """Tests that results are retrieved with complete output logs."""
     app, mongo = mongo_app
@@ -103,6 +136,305 @@ def test_result_get_with_logs(mongo_app, agent_auth_header):
     assert response.json[f"{phase}_status"] == 404
 
 
+def test_result_post_complete_compacts_logs(mongo_app, agent_auth_header):
+    """Tests that logs are compacted once the job is complete."""
+    app, mongo = mongo_app
+    newjob = app.post("/v1/job", json={"job_queue": "test"})
+    job_id = newjob.json.get("job_id")
+    output_url = f"/v1/result/{job_id}/log/{LogType.STANDARD_OUTPUT}"
+    phase = str(TestPhase.SETUP)
+    for i in range(10):
+        log_json = {
+            "fragment_number": i,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "phase": phase,
+            "log_data": f"line{i}\n",
+        }
+        app.post(output_url, json=log_json, headers=agent_auth_header)
+    result_url = f"/v1/result/{job_id}"
+    data = {"status": {phase: 0}, "job_state": "complete"}
+    # the logs are compacted once the whole response is sent
+    response = app.post(
+        result_url, json=data, headers=agent_auth_header, buffered=True
+    )
+    assert HTTPStatus.OK == response.status_code
+    assert mongo.logs.count_documents({"job_id": job_id}) == 0
+    assert mongo.log_segments.count_documents({"job_id": job_id}) == 1
+    response = app.get(result_url)
+    assert response.json[f"{phase}_output"] == "".join(
+        [f"line{i}\n" for i in range(10)]
+    )
+    response = app.get(f"{output_url}?start_fragment=8")
+    assert response.json["output"][phase] == {
+        "last_fragment_number": 9,
+        "log_data": "line8\nline9\n",
+    }
+
+
+def test_result_post_complete_compacts_after_response(
+    mongo_app, agent_auth_header
+):
+    """Tests that logs are only compacted once the response is sent."""
+    app, mongo = mongo_app
+    newjob = app.post("/v1/job", json={"job_queue": "test"})
+    job_id = newjob.json.get("job_id")
+    log_json = {
+        "fragment_number": 0,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "phase": str(TestPhase.SETUP),
+        "log_data": "line0\n",
+    }
+    app.post(
+        f"/v1/result/{job_id}/log/{LogType.STANDARD_OUTPUT}",
+        json=log_json,
+        headers=agent_auth_header,
+    )
+    data = {"status": {"setup": 0}, "job_state": "complete"}
+    response = app.post(
+        f"/v1/result/{job_id}",
+        json=data,
+        headers=agent_auth_header,
+        buffered=False,
+    )
+    assert HTTPStatus.OK == response.status_code
+    assert mongo.logs.count_documents({"job_id": job_id}) == 1
+    response.close()
+    assert mongo.logs.count_documents({"job_id": job_id}) == 0
+    assert mongo.log_segments.count_documents({"job_id": job_id}) == 1
+
+
+def test_log_batch_post(mongo_app, agent_auth_header):
+    """Test a batch of fragments for several log types is stored."""
+    app, mongo = mongo_app
+    newjob = app.post("/v1/job", json={"job_queue": "test"})
+    job_id = newjob.json.get("job_id")
+    timestamp = datetime.now(timezone.utc).isoformat()
+    fragments = [
+        {
+            "log_type": log_type,
+            "fragment_number": i,
+            "timestamp": timestamp,
+            "phase": str(TestPhase.TEST),
+            "log_data": f"{log_type}{i}\n",
+        }
+        for log_type in ("output", "serial")
+        for i in range(3)
+    ]
+    response = app.post(
+        f"/v1/result/{job_id}/log",
+        json={"fragments": fragments},
+        headers=agent_auth_header,
+    )
+    assert HTTPStatus.OK == response.status_code
+    assert mongo.logs.count_documents({"job_id": job_id}) == 6
+
+    response = app.get(f"/v1/result/{job_id}/log/serial?phase=test")
+    assert response.json["serial"]["test"] == {
+        "last_fragment_number": 2,
+        "log_data": "serial0\nserial1\nserial2\n",
+    }
+
+
+def test_log_batch_post_bad(mongo_app, agent_auth_header):
+    """Test a batch with an invalid log type or no fragments is rejected."""
+    app, _ = mongo_app
+    newjob = app.post("/v1/job", json={"job_queue": "test"})
+    job_id = newjob.json.get("job_id")
+    fragment = {
+        "log_type": "invalid",
+        "fragment_number": 0,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "phase": str(TestPhase.TEST),
+        "log_data": "data",
+    }
+    for data in ({"fragments": [fragment]}, {"fragments": []}):
+        response = app.post(
+            f"/v1/result/{job_id}/log", json=data, headers=agent_auth_header
+        )
+        assert HTTPStatus.UNPROCESSABLE_ENTITY == response.status_code
+
+
+def parse_events(stream: str) -> list[dict]:
+    """Parse a Server-Sent Events stream into a list of events."""
+    events = []
+    for block in stream.split("\n\n"):
+        event = {}
+        for line in block.splitlines():
+            if line.startswith(":"):
+                continue
+            field, _, value = line.partition(": ")
+            event[field] = value
+        if event:
+            events.append(event)
+    return events
+
+
+def test_log_stream_get(mongo_app, agent_auth_header):
+    """Test log fragments and state changes are streamed until complete."""
+    app, _ = mongo_app
+    newjob = app.post("/v1/job", json={"job_queue": "test"})
+    job_id = newjob.json.get("job_id")
+    output_url = f"/v1/result/{job_id}/log/{LogType.STANDARD_OUTPUT}"
+    for i in range(3):
+        log_json = {
+            "fragment_number": i,
+            "timestamp": datetime(
+                2025, 4, 24, 10, i, 0, tzinfo=timezone.utc
+            ).isoformat(),
+            "phase": str(TestPhase.SETUP),
+            "log_data": f"line{i}\n",
+        }
+        app.post(output_url, json=log_json, headers=agent_auth_header)
+    data = {"status": {"setup": 0}, "job_state": "complete"}
+    app.post(
+        f"/v1/result/{job_id}",
+        json=data,
+        headers=agent_auth_header,
+        buffered=True,
+    )
+
+    response = app.get(f"{output_url}/stream")
+    assert HTTPStatus.OK == response.status_code
+    assert response.mimetype == "text/event-stream"
+    events = parse_events(response.text)
+    # the logs of the completed job are compacted, so they are streamed as
+    # a single event with the number of the last fragment
+    assert [event["event"] for event in events] == ["log", "state"]
+    assert events[0]["id"] == "2"
+    assert json.loads(events[0]["data"]) == {
+        "phase": "setup",
+        "fragment_number": 2,
+        "log_data": "line0\nline1\nline2\n",
+    }
+    assert json.loads(events[1]["data"]) == {
+        "setup_status": 0,
+        "job_state": "complete",
+    }
+
+
+def test_log_stream_get_resume(mongo_app, agent_auth_header):
+    """Test the stream resumes after the fragment in Last-Event-ID."""
+    app, _ = mongo_app
+    newjob = app.post("/v1/job", json={"job_queue": "test"})
+    job_id = newjob.json.get("job_id")
+    output_url = f"/v1/result/{job_id}/log/{LogType.STANDARD_OUTPUT}"
+    for i in range(3):
+        log_json = {
+            "fragment_number": i,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "phase": str(TestPhase.TEST),
+            "log_data": f"line{i}\n",
+        }
+        app.post(output_url, json=log_json, headers=agent_auth_header)
+    app.post(f"/v1/job/{job_id}/action", json={"action": "cancel"})
+
+    response = app.get(f"{output_url}/stream", headers={"Last-Event-ID": "1"})
+    events = parse_events(response.text)
+    assert [event.get("id") for event in events] == ["2", None]
+    assert json.loads(events[1]["data"])["job_state"] == "cancelled"
+
+
+def test_log_stream_get_start_timestamp(mongo_app, agent_auth_header):
+    """Test the stream only includes fragments from start_timestamp."""
+    app, _ = mongo_app
+    newjob = app.post("/v1/job", json={"job_queue": "test"})
+    job_id = newjob.json.get("job_id")
+    output_url = f"/v1/result/{job_id}/log/{LogType.STANDARD_OUTPUT}"
+    for i in range(3):
+        log_json = {
+            "fragment_number": i,
+            "timestamp": datetime(
+                2025, 4, 24, 10, i, 0, tzinfo=timezone.utc
+            ).isoformat(),
+            "phase": str(TestPhase.TEST),
+            "log_data": f"line{i}\n",
+        }
+        app.post(output_url, json=log_json, headers=agent_auth_header)
+    app.post(f"/v1/job/{job_id}/action", json={"action": "cancel"})
+
+    start_timestamp = datetime(2025, 4, 24, 10, 1, 0, tzinfo=timezone.utc)
+    response = app.get(
+        f"{output_url}/stream",
+        query_string={"start_timestamp": start_timestamp.isoformat()},
+    )
+    events = parse_events(response.text)
+    assert [event.get("id") for event in events] == ["1", "2", None]
+
+
+def test_log_stream_get_final_fragments(
+    mongo_app, agent_auth_header, monkeypatch
+):
+    """Test fragments posted just before the job completes are streamed."""
+    from testflinger import database
+    from testflinger.api import v1
+    from testflinger.logs import LogFragment, MongoLogHandler
+
+    app, _ = mongo_app
+    newjob = app.post("/v1/job", json={"job_queue": "test"})
+    job_id = newjob.json.get("job_id")
+
+    def complete_after_last_fragment(job_id):
+        # the last fragment arrives after the stream read the logs, but
+        # before it read the final job state
+        MongoLogHandler(database.mongo).store_log_fragment(
+            LogFragment(
+                job_id,
+                LogType.STANDARD_OUTPUT,
+                TestPhase.TEST,
+                0,
+                datetime.now(timezone.utc),
+                "last line\n",
+            )
+        )
+        return {"job_state": "complete"}
+
+    monkeypatch.setattr(v1, "get_result_state", complete_after_last_fragment)
+    response = app.get(
+        f"/v1/result/{job_id}/log/{LogType.STANDARD_OUTPUT}/stream"
+    )
+    events = parse_events(response.text)
+    assert [event["event"] for event in events] == ["state", "log"]
+    assert json.loads(events[1]["data"])["log_data"] == "last line\n"
+
+
+def test_log_stream_get_backs_off(mongo_app, monkeypatch):
+    """Test the stream re-checks a quiet job less and less often."""
+    from testflinger.api import v1
+
+    app, _ = mongo_app
+    monkeypatch.setattr(v1, "LOG_STREAM_MAX", 1)
+    monkeypatch.setattr(v1, "LOG_STREAM_RECHECK", 0.1)
+    monkeypatch.setattr(v1, "LOG_STREAM_RECHECK_MAX", 0.4)
+    newjob = app.post("/v1/job", json={"job_queue": "test"})
+    job_id = newjob.json.get("job_id")
+    get_result_state = v1.get_result_state
+    calls = []
+
+    def counting_get_result_state(job_id):
+        calls.append(job_id)
+        return get_result_state(job_id)
+
+    monkeypatch.setattr(v1, "get_result_state", counting_get_result_state)
+    response = app.get(
+        f"/v1/result/{job_id}/log/{LogType.STANDARD_OUTPUT}/stream"
+    )
+    assert [event["event"] for event in parse_events(response.text)] == [
+        "state"
+    ]
+    # checked right away, then after 0.1, 0.2, 0.4 and the last 0.3 seconds
+    assert len(calls) == 5
+
+
+def test_log_stream_get_bad(mongo_app):
+    """Test the stream rejects bad job IDs and unknown jobs."""
+    app, _ = mongo_app
+    response = app.get("/v1/result/BAD_JOB_ID/log/output/stream")
+    assert HTTPStatus.BAD_REQUEST == response.status_code
+    job_id = "11111111-1111-1111-1111-111111111111"
+    response = app.get(f"/v1/result/{job_id}/log/output/stream")
+    assert HTTPStatus.NOT_FOUND == response.status_code
+
+
 def test_artifact_post_good(mongo_app, agent_auth_header):
     """Test both get and put of a result artifact."""
     app, _ = mongo_app
@@ -122,6 +454,56 @@ def test_artifact_post_good(mongo_app, agent_auth_header):
     assert output.data == data
 
 
+def test_artifact_post_stream(mongo_app, agent_auth_header):
+    """Test a result artifact can be streamed as the request body."""
+    app, _ = mongo_app
+    newjob = app.post("/v1/job", json={"job_queue": "test"})
+    job_id = newjob.json.get("job_id")
+    artifact_url = f"/v1/result/{job_id}/artifact"
+    data = b"test file content"
+    output = app.post(
+        artifact_url,
+        data=data,
+        content_type="application/octet-stream",
+        headers=agent_auth_header,
+    )
+    assert "OK" == output.text
+    output = app.get(artifact_url)
+    assert output.data == data
+
+
+def test_artifact_get_range(mongo_app, agent_auth_header):
+    """Test an artifact download can be resumed with a range request."""
+    app, _ = mongo_app
+    newjob = app.post("/v1/job", json={"job_queue": "test"})
+    job_id = newjob.json.get("job_id")
+    artifact_url = f"/v1/result/{job_id}/artifact"
+    data = b"test file content"
+    app.post(
+        artifact_url,
+        data=data,
+        content_type="application/octet-stream",
+        headers=agent_auth_header,
+    )
+    output = app.get(artifact_url)
+    assert output.headers["Accept-Ranges"] == "bytes"
+    etag = output.headers["ETag"]
+
+    output = app.get(
+        artifact_url, headers={"Range": "bytes=5-", "If-Range": etag}
+    )
+    assert HTTPStatus.PARTIAL_CONTENT == output.status_code
+    assert output.data == data[5:]
+    assert output.headers["Content-Range"] == f"bytes 5-16/{len(data)}"
+
+    # The whole file is sent again if it changed since the first download
+    output = app.get(
+        artifact_url, headers={"Range": "bytes=5-", "If-Range": '"other"'}
+    )
+    assert HTTPStatus.OK == output.status_code
+    assert output.data == data
+
+
 def test_result_get_artifact_not_exists(mongo_app):
     """Get artifacts for a nonexistent job and confirm we get 204."""
     app, _ = mongo_app
@@ -15,17 +15,25 @@
 #
 """Unit tests for Testflinger v1 API."""
 
+import hashlib
 import json
 import os
+import re
+import threading
+import time
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from http import HTTPStatus
+from io import BytesIO
 
 import pytest
 import requests
+from bson import ObjectId
 from testflinger_common.enums import ServerRoles
 
+from testflinger import database
 from testflinger.api import v1
+from testflinger.webhooks import webhook_dispatcher
 from tests.utilities import get_access_token_header
 
 
@@ -647,6 +655,126 @@ def test_add_job_good_with_attachments(mongo_app, tmp_path, agent_auth_header):
     assert set(job_data).issubset(recovered_data)
 
 
+def test_add_job_with_shared_attachments(mongo_app, agent_auth_header):
+    """Test that identical attachments archives are stored only once."""
+    app, mongo = mongo_app
+    job_data = {
+        "job_queue": "test",
+        "test_data": {"attachments": [{"agent": "filename"}]},
+    }
+    archive = os.urandom(8000)
+    sha256 = hashlib.sha256(archive).hexdigest()
+
+    # the archive isn't stored yet, so it can't be referenced
+    assert app.get(f"/v1/attachments/{sha256}").status_code == 404
+    job_id = app.post("/v1/job", json=job_data).json["job_id"]
+    output = app.post(f"/v1/job/{job_id}/attachments", json={"sha256": sha256})
+    assert output.status_code == 404
+
+    # upload the archive for the first job
+    output = app.post(
+        f"/v1/job/{job_id}/attachments",
+        data={"file": (BytesIO(archive), "attachments.tar.gz")},
+        content_type="multipart/form-data",
+    )
+    assert output.status_code == 200
+    assert app.get(f"/v1/attachments/{sha256}").status_code == 200
+
+    # reference the stored archive for a second job
+    other_job_id = app.post("/v1/job", json=job_data).json["job_id"]
+    output = app.post(
+        f"/v1/job/{other_job_id}/attachments", json={"sha256": sha256}
+    )
+    assert output.status_code == 200
+    output = app.get(
+        f"/v1/job/{other_job_id}/attachments", headers=agent_auth_header
+    )
+    assert output.data == archive
+
+    assert mongo["blobs.files"].count_documents({}) == 1
+    archive_id = {"sha256": sha256, "owner": None}
+    assert (
+        mongo.attachment_blobs.find_one({"_id": archive_id})["refcount"] == 2
+    )
+
+    # each job releases its reference once, when it is completed or cancelled
+    app.post(f"/v1/job/{job_id}/action", json={"action": "cancel"})
+    app.post(
+        f"/v1/result/{other_job_id}",
+        json={"job_state": "complete"},
+        headers=agent_auth_header,
+    )
+    app.post(
+        f"/v1/result/{other_job_id}",
+        json={"job_state": "complete"},
+        headers=agent_auth_header,
+    )
+    assert (
+        mongo.attachment_blobs.find_one({"_id": archive_id})["refcount"] == 0
+    )
+
+
+def test_shared_attachments_per_client(mongo_app):
+    """Test that attachments archives aren't shared between clients."""
+    app, _ = mongo_app
+    job_data = {
+        "job_queue": "test",
+        "test_data": {"attachments": [{"agent": "filename"}]},
+    }
+    archive = os.urandom(8000)
+    sha256 = hashlib.sha256(archive).hexdigest()
+    owner = get_access_token_header("owner", ServerRoles.CONTRIBUTOR)
+    other = get_access_token_header("other", ServerRoles.CONTRIBUTOR)
+
+    job_id = app.post("/v1/job", json=job_data, headers=owner).json["job_id"]
+    output = app.post(
+        f"/v1/job/{job_id}/attachments",
+        data={"file": (BytesIO(archive), "attachments.tar.gz")},
+        content_type="multipart/form-data",
+        headers=owner,
+    )
+    assert output.status_code == 200
+    assert (
+        app.get(f"/v1/attachments/{sha256}", headers=owner).status_code == 200
+    )
+
+    # another client can neither find the archive nor reference it
+    assert (
+        app.get(f"/v1/attachments/{sha256}", headers=other).status_code == 404
+    )
+    other_job_id = app.post("/v1/job", json=job_data, headers=other).json[
+        "job_id"
+    ]
+    output = app.post(
+        f"/v1/job/{other_job_id}/attachments",
+        json={"sha256": sha256},
+        headers=other,
+    )
+    assert output.status_code == 404
+
+
+def test_complete_job_removes_unused_blobs(mongo_app, agent_auth_header):
+    """Test that unused attachments archives are removed as jobs complete."""
+    app, mongo = mongo_app
+    mongo.attachment_blobs.insert_one(
+        {
+            "_id": "unused",
+            "file_id": ObjectId(),
+            "length": 0,
+            "refcount": 0,
+            "last_used": datetime.now(timezone.utc) - timedelta(days=30),
+        }
+    )
+    job_id = app.post("/v1/job", json={"job_queue": "test"}).json["job_id"]
+    app.post(
+        f"/v1/result/{job_id}",
+        json={"job_state": "complete"},
+        headers=agent_auth_header,
+        buffered=True,
+    )
+    assert mongo.attachment_blobs.count_documents({}) == 0
+
+
 def test_submit_attachment_without_job(mongo_app, tmp_path):
     """Test for error when submitting attachments for a non-job."""
     app, _ = mongo_app
@@ -755,6 +883,104 @@ def test_get_job_no_queue(mongo_app, agent_auth_header):
     assert 400 == output.status_code
 
 
+def test_get_job_wait_returns_available_job(mongo_app, agent_auth_header):
+    """Test long-polling returns right away if a job is already waiting."""
+    app, _ = mongo_app
+    job_id = app.post("/v1/job", json={"job_queue": "test"}).json["job_id"]
+    app.post(
+        "/v1/agents/data/agent1",
+        json={"state": "waiting", "queues": ["test"], "location": "here"},
+        headers=agent_auth_header,
+    )
+    output = app.get("/v1/job?queue=test&wait=30", headers=agent_auth_header)
+    assert output.status_code == HTTPStatus.OK
+    assert output.json["job_id"] == job_id
+    assert output.headers[v1.JOB_WAIT_HEADER] == str(v1.JOB_WAIT_MAX)
+
+
+def test_get_job_wait_times_out(mongo_app, agent_auth_header, monkeypatch):
+    """Test long-polling returns 204 once the wait expires."""
+    app, _ = mongo_app
+    monkeypatch.setattr(v1, "JOB_WAIT_RECHECK", 0.1)
+    app.post(
+        "/v1/agents/data/agent1",
+        json={"state": "waiting", "queues": ["test"], "location": "here"},
+        headers=agent_auth_header,
+    )
+    start = time.monotonic()
+    output = app.get("/v1/job?queue=test&wait=1", headers=agent_auth_header)
+    assert output.status_code == HTTPStatus.NO_CONTENT
+    assert time.monotonic() - start >= 1
+    assert v1.JOB_WAIT_HEADER in output.headers
+
+
+def test_get_job_wait_backs_off(mongo_app, agent_auth_header, monkeypatch):
+    """Test long-polling re-checks the database less and less often."""
+    app, _ = mongo_app
+    monkeypatch.setattr(v1, "JOB_WAIT_RECHECK", 0.1)
+    monkeypatch.setattr(v1, "JOB_WAIT_RECHECK_MAX", 0.4)
+    app.post(
+        "/v1/agents/data/agent1",
+        json={"state": "waiting", "queues": ["test"], "location": "here"},
+        headers=agent_auth_header,
+    )
+    pop_job = database.pop_job
+    calls = []
+
+    def counting_pop_job(**kwargs):
+        calls.append(time.monotonic())
+        return pop_job(**kwargs)
+
+    monkeypatch.setattr(database, "pop_job", counting_pop_job)
+    output = app.get("/v1/job?queue=test&wait=1", headers=agent_auth_header)
+    assert output.status_code == HTTPStatus.NO_CONTENT
+    # checked right away, then after 0.1, 0.2, 0.4 and the last 0.3 seconds
+    assert len(calls) == 5
+
+
+def test_get_job_wait_notified(mongo_app, agent_auth_header, monkeypatch):
+    """Test long-polling returns a job as soon as it is submitted."""
+    app, mongo = mongo_app
+    monkeypatch.setattr(v1, "JOB_WAIT_RECHECK", 30)
+    app.post(
+        "/v1/agents/data/agent1",
+        json={"state": "waiting", "queues": ["test"], "location": "here"},
+        headers=agent_auth_header,
+    )
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "created_at": datetime.now(timezone.utc),
+        "job_priority": 0,
+        "job_data": {"job_queue": "test"},
+        "result_data": {"job_state": "waiting"},
+    }
+
+    def submit_job():
+        mongo.jobs.insert_one(job)
+        v1.job_notifier.notify("test")
+
+    timer = threading.Timer(0.2, submit_job)
+    timer.start()
+    start = time.monotonic()
+    output = app.get("/v1/job?queue=test&wait=20", headers=agent_auth_header)
+    timer.join()
+    assert output.status_code == HTTPStatus.OK
+    assert output.json["job_id"] == job["job_id"]
+    assert time.monotonic() - start < 10
+
+
+def test_get_job_wait_invalid(mongo_app, agent_auth_header):
+    """Test for error when the requested wait is not a number."""
+    app, _ = mongo_app
+    app.post(
+        "/v1/agents/data/agent1",
+        json={"state": "waiting", "queues": ["test"], "location": "here"},
+        headers=agent_auth_header,
+    )
+    output = app.get("/v1/job?queue=test&wait=foo", headers=agent_auth_header)
+    assert output.status_code == HTTPStatus.BAD_REQUEST
+
+
 def test_add_job_bad(mongo_app):
     """Test for error when posting an empty job."""
     app, _ = mongo_app
@@ -1074,9 +1300,11 @@ def test_agents_provision_logs_post(mongo_app, agent_auth_header):
     assert agent_data["provision_streak_count"] == 1
 
 
-def test_agents_status_put(mongo_app, agent_auth_header, webhook_fixture):
+def test_agents_status_put(
+    mongo_app, requests_mock, agent_auth_header, webhook_fixture
+):
     """Test api to receive agent status requests."""
-    app, _ = mongo_app
+    app, mongo = mongo_app
     job_data = {"job_queue": "test"}
     job_output = app.post("/v1/job", json=job_data)
     job_id = job_output.json.get("job_id")
@@ -1100,6 +1328,115 @@ def test_agents_status_put(mongo_app, agent_auth_header, webhook_fixture):
     )
     assert output.status_code == HTTPStatus.OK
 
+    # the update is delivered by the webhook dispatcher
+    assert not requests_mock.called
+    webhook_dispatcher.dispatch_pending()
+    delivered = requests_mock.last_request.json()
+    assert delivered["agent_id"] == "agent1"
+    assert delivered["events"] == status_update_data["events"]
+    assert mongo.webhook_outbox.count_documents({}) == 0
+
+
+def test_agents_status_put_coalesced(
+    mongo_app, requests_mock, agent_auth_header, webhook_fixture
+):
+    """Test that only the latest pending update for a job is delivered."""
+    app, _ = mongo_app
+    job_id = app.post("/v1/job", json={"job_queue": "test"}).json["job_id"]
+
+    events = []
+    for event_name in ("first_event", "second_event"):
+        events.append({"event_name": event_name, "timestamp": "now"})
+        status_update_data = {
+            "job_status_webhook": webhook_fixture,
+            "events": events,
+        }
+        app.post(
+            f"/v1/job/{job_id}/events",
+            json=status_update_data,
+            headers=agent_auth_header,
+        )
+    webhook_dispatcher.dispatch_pending()
+    assert requests_mock.call_count == 1
+    delivered = requests_mock.last_request.json()
+    assert delivered["events"] == status_update_data["events"]
+
+
+def test_agents_status_put_sequence(
+    mongo_app, requests_mock, agent_auth_header, webhook_fixture
+):
+    """Test that events sent with a sequence number are accumulated."""
+    app, _ = mongo_app
+    job_id = app.post("/v1/job", json={"job_queue": "test"}).json["job_id"]
+
+    events = [
+        {"event_name": f"event{number}", "timestamp": "now"}
+        for number in range(3)
+    ]
+    # the second update is sent again, as if the response was lost
+    for sequence, end in ((0, 2), (1, 2), (2, 3)):
+        output = app.post(
+            f"/v1/job/{job_id}/events",
+            json={
+                "job_status_webhook": webhook_fixture,
+                "events": events[sequence:end],
+                "sequence": sequence,
+            },
+            headers=agent_auth_header,
+        )
+        assert output.status_code == HTTPStatus.OK
+    webhook_dispatcher.dispatch_pending()
+    delivered = requests_mock.last_request.json()
+    assert delivered["events"] == events
+    assert "sequence" not in delivered
+
+
+def test_agents_status_put_sequence_gap(
+    mongo_app, agent_auth_header, webhook_fixture
+):
+    """Test that events after ones the server is missing are rejected."""
+    app, _ = mongo_app
+    job_id = app.post("/v1/job", json={"job_queue": "test"}).json["job_id"]
+
+    output = app.post(
+        f"/v1/job/{job_id}/events",
+        json={
+            "job_status_webhook": webhook_fixture,
+            "events": [{"event_name": "event1", "timestamp": "now"}],
+            "sequence": 1,
+        },
+        headers=agent_auth_header,
+    )
+    assert output.status_code == HTTPStatus.CONFLICT
+
+
+def test_agents_status_put_new_events_only(
+    mongo_app, requests_mock, agent_auth_header, webhook_fixture, monkeypatch
+):
+    """Test that webhooks can receive only the events not delivered yet."""
+    app, _ = mongo_app
+    monkeypatch.setattr("testflinger.webhooks.WEBHOOK_EVENTS", "new")
+    job_id = app.post("/v1/job", json={"job_queue": "test"}).json["job_id"]
+
+    for sequence in range(2):
+        app.post(
+            f"/v1/job/{job_id}/events",
+            json={
+                "job_status_webhook": webhook_fixture,
+                "events": [
+                    {"event_name": f"event{sequence}", "timestamp": "now"}
+                ],
+                "sequence": sequence,
+            },
+            headers=agent_auth_header,
+        )
+        webhook_dispatcher.dispatch_pending()
+        delivered = requests_mock.last_request.json()
+        assert delivered["sequence"] == sequence
+        assert [event["event_name"] for event in delivered["events"]] == [
+            f"event{sequence}"
+        ]
+
 
 def test_agents_status_put_no_webhook_configured(
     mongo_app, monkeypatch, agent_auth_header
@@ -1173,6 +1510,7 @@ def test_agents_status_put_with_auth_header(
         headers=agent_auth_header,
     )
     assert output.status_code == HTTPStatus.OK
+    webhook_dispatcher.dispatch_pending()
     assert requests_mock.last_request.headers["Authorization"] == (
         "Bearer fake_token"
     )
@@ -1223,18 +1561,28 @@ def test_agents_status_put_nonexistent_job(
     assert output.status_code == HTTPStatus.NOT_FOUND
 
 
-def test_agents_status_put_webhook_timeout(
-    mongo_app, requests_mock, monkeypatch, agent_auth_header
+@pytest.mark.parametrize(
+    "webhook_response",
+    [
+        {"exc": requests.exceptions.Timeout},
+        {"exc": requests.exceptions.ConnectionError},
+        {"status_code": HTTPStatus.BAD_GATEWAY},
+        {"status_code": HTTPStatus.UNAUTHORIZED},
+        {"status_code": HTTPStatus.FORBIDDEN},
+    ],
+)
+def test_agents_status_put_webhook_retried(
+    mongo_app, requests_mock, monkeypatch, agent_auth_header, webhook_response
 ):
-    """Test that webhook timeout is handled with GATEWAY_TIMEOUT."""
-    app, _ = mongo_app
+    """Test that failed webhook deliveries are retried later."""
+    app, mongo = mongo_app
     monkeypatch.setenv("WEBHOOK_URL", "http://mywebhook.com/")
     job_data = {"job_queue": "test"}
     job_output = app.post("/v1/job", json=job_data)
     job_id = job_output.json.get("job_id")
 
     webhook = "http://mywebhook.com/v1/test-executions/1234/status_update"
-    requests_mock.put(webhook, exc=requests.exceptions.Timeout)
+    requests_mock.put(webhook, [webhook_response, {"status_code": 200}])
 
     status_update_data = {
         "agent_id": "agent1",
@@ -1247,70 +1595,42 @@ def test_agents_status_put_webhook_timeout(
         json=status_update_data,
         headers=agent_auth_header,
     )
-    assert output.status_code == HTTPStatus.GATEWAY_TIMEOUT
-
-
-def test_agents_status_put_webhook_unreachable(
-    mongo_app, requests_mock, monkeypatch, agent_auth_header
-):
-    """Test that webhook connection error is handled with BAD_GATEWAY."""
-    app, _ = mongo_app
-    monkeypatch.setenv("WEBHOOK_URL", "http://mywebhook.com/")
-    job_data = {"job_queue": "test"}
-    job_output = app.post("/v1/job", json=job_data)
-    job_id = job_output.json.get("job_id")
-
-    webhook = "http://mywebhook.com/v1/test-executions/1234/status_update"
-    requests_mock.put(webhook, exc=requests.exceptions.ConnectionError)
+    # the agent isn't held up by the webhook failing
+    assert output.status_code == HTTPStatus.OK
 
-    status_update_data = {
-        "agent_id": "agent1",
-        "job_queue": "myjobqueue",
-        "job_status_webhook": webhook,
-        "events": [],
-    }
-    output = app.post(
-        f"/v1/job/{job_id}/events",
-        json=status_update_data,
-        headers=agent_auth_header,
+    webhook_dispatcher.dispatch_pending()
+    entry = mongo.webhook_outbox.find_one({"_id": job_id})
+    assert entry["attempts"] == 1
+    assert requests_mock.call_count == 1
+
+    # the retry is delivered once it is due
+    webhook_dispatcher.dispatch_pending()
+    assert requests_mock.call_count == 1
+    mongo.webhook_outbox.update_one(
+        {"_id": job_id},
+        {"$set": {"next_attempt": datetime(2000, 1, 1, tzinfo=timezone.utc)}},
     )
-    assert output.status_code == HTTPStatus.BAD_GATEWAY
+    webhook_dispatcher.dispatch_pending()
+    assert requests_mock.call_count == 2
+    assert mongo.webhook_outbox.count_documents({}) == 0
 
 
-@pytest.mark.parametrize(
-    "webhook_status", [HTTPStatus.UNAUTHORIZED, HTTPStatus.FORBIDDEN]
-)
-def test_agents_status_put_webhook_auth_failure(
-    mongo_app, requests_mock, monkeypatch, webhook_status, agent_auth_header
+def test_agents_status_put_webhook_rejected(
+    mongo_app, requests_mock, agent_auth_header, webhook_fixture
 ):
-    """Test that auth errors from the webhook server results in 500 error."""
-    app, _ = mongo_app
-    monkeypatch.setenv("WEBHOOK_URL", "http://mywebhook.com/")
-    monkeypatch.setenv("WEBHOOK_AUTH", "fake_token")
-    job_data = {"job_queue": "test"}
-    job_output = app.post("/v1/job", json=job_data)
-    job_id = job_output.json.get("job_id")
-
-    webhook = "http://mywebhook.com/v1/test-executions/1234/status_update"
-    requests_mock.put(webhook, status_code=webhook_status)
+    """Test that updates rejected by the webhook are not retried."""
+    app, mongo = mongo_app
+    job_id = app.post("/v1/job", json={"job_queue": "test"}).json["job_id"]
+    requests_mock.put(webhook_fixture, status_code=HTTPStatus.BAD_REQUEST)
 
-    status_update_data = {
-        "agent_id": "agent1",
-        "job_queue": "myjobqueue",
-        "job_status_webhook": webhook,
-        "events": [],
-    }
-    output = app.post(
+    app.post(
         f"/v1/job/{job_id}/events",
-        json=status_update_data,
+        json={"job_status_webhook": webhook_fixture, "events": []},
         headers=agent_auth_header,
     )
-
-    # Testflinger server should return 500 error if the webhook server
-    # responds with an auth error, as this indicates a misconfiguration
-    # that needs to be fixed at charm level by an admin.
-    assert output.status_code == HTTPStatus.INTERNAL_SERVER_ERROR
-    assert "Webhook authentication failed" in output.get_data(as_text=True)
+    webhook_dispatcher.dispatch_pending()
+    assert requests_mock.call_count == 1
+    assert mongo.webhook_outbox.count_documents({}) == 0
 
 
 def test_get_agents_data(mongo_app, agent_auth_header):
@@ -1488,30 +1808,141 @@ def test_search_jobs_datetime_iso8601(mongo_app):
     assert output.json[0]["created_at"] == "2020-01-01T00:00:00Z"
 
 
-def test_get_queue_wait_times(mongo_app):
-    """Test that the wait times for a queue are returned."""
+def test_search_jobs_paginated(mongo_app):
+    """Test that search results can be paginated with cursors."""
+    app, _ = mongo_app
+
+    job_ids = [
+        app.post("/v1/job", json={"job_queue": "test"}).json["job_id"]
+        for _ in range(5)
+    ]
+    found = []
+    url = "/v1/job/search?limit=2"
+    while url:
+        output = app.get(url)
+        assert 200 == output.status_code
+        assert len(output.json) <= 2
+        found.extend(job["job_id"] for job in output.json)
+        links = {
+            rel: link
+            for link, rel in re.findall(
+                r'<([^>]*)>; rel="(\w+)"', output.headers.get("Link", "")
+            )
+        }
+        url = links.get("next")
+    assert sorted(found) == sorted(job_ids)
+
+    # The previous page of the last page is the one before it
+    output = app.get(links["prev"])
+    assert [job["job_id"] for job in output.json] == found[2:4]
+
+
+def test_search_jobs_by_date(mongo_app):
+    """Test that search results can be filtered by creation date."""
     app, mongo = mongo_app
 
-    # Add some fake wait times to the queue_wait_times collection
-    mongo.queue_wait_times.insert_many(
-        [
-            {"name": "queue1", "wait_times": [1, 2, 3, 4, 5]},
-            {"name": "queue2", "wait_times": [10, 20, 30, 40, 50]},
-        ]
+    job_response = app.post("/v1/job", json={"job_queue": "test"})
+    job_id = job_response.json.get("job_id")
+    app.post("/v1/job", json={"job_queue": "test"})
+    mongo.jobs.update_one(
+        {"job_id": job_id},
+        {"$set": {"created_at": datetime(2020, 1, 1, tzinfo=timezone.utc)}},
     )
+    output = app.get("/v1/job/search?stop=2020-01-02T00:00:00Z")
+    assert 200 == output.status_code
+    assert [job["job_id"] for job in output.json] == [job_id]
+    output = app.get("/v1/job/search?start=2020-01-02T00:00:00Z")
+    assert 200 == output.status_code
+    assert len(output.json) == 1
+    assert output.json[0]["job_id"] != job_id
+
+
+def test_search_jobs_invalid_cursor(mongo_app):
+    """Test that an invalid cursor is rejected."""
+    app, _ = mongo_app
+
+    output = app.get("/v1/job/search?after=foo")
+    assert 422 == output.status_code
+
+
+def test_get_queue_stats(mongo_app, agent_auth_header):
+    """Test that the number of jobs in each state is returned per queue."""
+    app, _ = mongo_app
+
+    for queue in ("queue1", "queue1", "queue1", "queue2"):
+        app.post("/v1/job", json={"job_queue": queue})
+    job_id = app.post("/v1/job", json={"job_queue": "queue2"}).json["job_id"]
+    app.post(
+        f"/v1/result/{job_id}",
+        json={"job_state": "cancelled"},
+        headers=agent_auth_header,
+    )
+    app.post(
+        "/v1/agents/data/agent1",
+        json={"state": "waiting", "queues": ["queue1"], "location": "here"},
+        headers=agent_auth_header,
+    )
+    app.get("/v1/job?queue=queue1", headers=agent_auth_header)
+
+    output = app.get("/v1/queues/stats")
+    assert 200 == output.status_code
+    assert output.json == {
+        "queue1": {"waiting": 2, "running": 1, "completed": 0, "cancelled": 0},
+        "queue2": {"waiting": 1, "running": 0, "completed": 0, "cancelled": 1},
+    }
+    output = app.get("/v1/queues/stats?queue=queue2")
+    assert list(output.json) == ["queue2"]
+
+
+def test_get_queue_wait_times(mongo_app):
+    """Test that the wait times for a queue are returned."""
+    app, _ = mongo_app
+
+    # Count some fake wait times in the wait time histograms
+    now = datetime.now(timezone.utc)
+    for queue, wait_times in (
+        ("queue1", [1, 2, 3, 4, 5]),
+        ("queue2", [10, 20, 30, 40, 50]),
+    ):
+        for wait_time in wait_times:
+            database.save_queue_wait_time(
+                queue, now, now - timedelta(seconds=wait_time)
+            )
 
     # Get the wait times for a specific queue
     output = app.get("/v1/queues/wait_times?queue=queue1")
     assert 200 == output.status_code
     assert len(output.json) == 1
-    assert output.json["queue1"]["50"] == 3.0
+    # Percentiles are estimated within a few percent
+    assert output.json["queue1"]["50"] == pytest.approx(3.0, rel=0.03)
 
     # Get the wait times for all queues
     output = app.get("/v1/queues/wait_times")
     assert 200 == output.status_code
     assert len(output.json) == 2
-    assert output.json["queue1"]["50"] == 3.0
-    assert output.json["queue2"]["50"] == 30.0
+    assert output.json["queue1"]["50"] == pytest.approx(3.0, rel=0.03)
+    assert output.json["queue2"]["50"] == pytest.approx(30.0, rel=0.03)
+    assert output.json["queue2"]["95"] == pytest.approx(48.0, rel=0.03)
+
+
+def test_get_queue_wait_times_window(mongo_app):
+    """Test that only wait times in the requested window are included."""
+    app, _ = mongo_app
+
+    now = datetime.now(timezone.utc)
+    database.save_queue_wait_time("queue1", now, now - timedelta(seconds=10))
+    two_days_ago = now - timedelta(days=2)
+    database.save_queue_wait_time(
+        "queue2", two_days_ago, two_days_ago - timedelta(seconds=1000)
+    )
+
+    output = app.get("/v1/queues/wait_times?window=24h")
+    assert 200 == output.status_code
+    assert list(output.json) == ["queue1"]
+    output = app.get("/v1/queues/wait_times?window=7d")
+    assert output.json["queue2"]["50"] == pytest.approx(1000.0, rel=0.03)
+    output = app.get("/v1/queues/wait_times?window=foo")
+    assert 422 == output.status_code
 
 
 def test_get_agents_on_queue(mongo_app, agent_auth_header):
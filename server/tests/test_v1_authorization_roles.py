@@ -18,6 +18,7 @@ Unit tests for permissions on every endpoint and method in the
 Testflinger API.
 """
 
+import hashlib
 import json
 import re
 from http import HTTPStatus
@@ -223,6 +224,9 @@ def do_setup(
     # Note: This also includes "/jobs" at any place in the uri.
     if "/job" in endpoint and method in ("GET", "DELETE"):
         need_job = True
+    # shared attachments are stored when submitted for a job
+    if "<sha256>" in endpoint:
+        need_job = True
 
     if "<queue_name>" in endpoint or need_agent:
         need_agent = True
@@ -259,6 +263,29 @@ def do_setup(
             "log_data": "some log output",
         }
         endpoint = endpoint.replace("<log_type>", log_type)
+        if endpoint.endswith("/stream"):
+            # Finish the job so the log stream ends right away
+            response = app.post(
+                f"/v1/job/{job_id}/action",
+                json={"action": "cancel"},
+                headers=setup_headers,
+            )
+            assert response.status_code == HTTPStatus.OK, (
+                f"{response.status} {response.data}"
+            )
+
+    if endpoint.endswith("/log"):
+        test_data = {
+            "fragments": [
+                {
+                    "log_type": "serial",
+                    "fragment_number": 0,
+                    "timestamp": "2014-12-22T03:12:58.019077+00:00",
+                    "phase": "test",
+                    "log_data": "some serial output",
+                }
+            ]
+        }
 
     if "<path>" in endpoint:
         path = "path"
@@ -369,16 +396,27 @@ def do_setup(
         # the "attachment" that we are using is this `__file__` which exists
         # submit the attachments archive for the job
         filename = __file__
+        upload_headers = setup_headers
+        if "<sha256>" in endpoint:
+            # shared archives are only found by the client that uploaded them
+            if client_id is not None:
+                upload_headers = get_access_token_header(
+                    client_id, ServerRoles.CONTRIBUTOR
+                )
+            elif app.application.oauth is None:
+                upload_headers = None
         with open(filename, "rb") as attachments:
             response = app.post(
                 f"/v1/job/{job_id}/attachments",
                 data={"file": (attachments, filename)},
                 content_type="multipart/form-data",
-                headers=setup_headers,
+                headers=upload_headers,
             )
             assert response.status_code == HTTPStatus.OK, (
                 f"{response.status} {response.data}"
             )
+        sha256 = hashlib.sha256(Path(filename).read_bytes()).hexdigest()
+        endpoint = endpoint.replace("<sha256>", sha256)
 
     if "artifact" in endpoint:
         data = b"test file content"
@@ -237,6 +237,47 @@ class TestVaultStore:
         )
         assert vault_store.exists("test-namespace", "test-key") is False
 
+    def test_read_many(self, vault_store, mock_client):
+        """Test reading many secrets, leaving out inaccessible ones."""
+
+        def read_secret_version(path):
+            if path == "test-namespace/missing":
+                raise hvac.exceptions.InvalidPath()
+            return {"data": {"data": {"value": f"value-of-{path}"}}}
+
+        mock_client.secrets.kv.v2.read_secret_version.side_effect = (
+            read_secret_version
+        )
+
+        result = vault_store.read_many(
+            "test-namespace", ["key1", "key2", "missing", "key1"]
+        )
+
+        assert result == {
+            "key1": "value-of-test-namespace/key1",
+            "key2": "value-of-test-namespace/key2",
+        }
+        # each secret is only read once
+        assert mock_client.secrets.kv.v2.read_secret_version.call_count == 3
+
+    def test_exists_many(self, vault_store, mock_client):
+        """Test checking which of many secrets exist."""
+
+        def read_secret_version(path):
+            if path == "test-namespace/missing":
+                raise hvac.exceptions.InvalidPath()
+            return {"data": {"data": {"value": "test-secret-value"}}}
+
+        mock_client.secrets.kv.v2.read_secret_version.side_effect = (
+            read_secret_version
+        )
+
+        result = vault_store.exists_many(
+            "test-namespace", ["key1", "key2", "missing"]
+        )
+
+        assert result == {"key1", "key2"}
+
 
 class TestSecretsInit:
     """Test cases for secrets module initialization."""